@@ -6,6 +6,9 @@ from flask_migrate import Migrate, MigrateCommand
 from flask_script import Manager
 
 from shop_db2.api import app, db, set_app
+from shop_db2.helpers.financial_overview import get_inconsistent_financial_rollups, rebuild_financial_rollups
+from shop_db2.helpers.uploads import backfill_images
+from shop_db2.helpers.users import get_inconsistent_user_credits, rebuild_user_credits
 
 import configuration as config  # isort: skip
 
@@ -16,5 +19,42 @@ manager = Manager(app)
 
 manager.add_command("db", MigrateCommand)
 
+
+@manager.option("--rebuild", dest="rebuild", action="store_true", help="Recalculate all inconsistent credits")
+def check_credits(rebuild=False):
+    """Compares the persisted credit of all users with their full history."""
+    inconsistent = get_inconsistent_user_credits()
+    for entry in inconsistent:
+        print("User {id}: credit is {credit}, expected {expected}".format(**entry))
+    if not inconsistent:
+        print("All user credits are consistent.")
+    elif rebuild:
+        print("Corrected the credit of {} user(s).".format(rebuild_user_credits()))
+
+
+@manager.option("--rebuild", dest="rebuild", action="store_true", help="Recalculate all financial rollups")
+def check_financial_rollups(rebuild=False):
+    """Compares the daily financial rollups with the full history."""
+    inconsistent = get_inconsistent_financial_rollups()
+    for entry in inconsistent:
+        print("{date} {category}: amount is {amount}, expected {expected}".format(**entry))
+    if not inconsistent:
+        print("All financial rollups are consistent.")
+    elif rebuild:
+        print("Corrected {} financial rollup(s).".format(rebuild_financial_rollups()))
+
+
+@manager.option("--rebuild", dest="rebuild", action="store_true", help="Rename the images and create the thumbnails")
+def check_images(rebuild=False):
+    """Checks whether all uploaded images are stored under the hash of their content and have all thumbnails."""
+    renamed, thumbnails = backfill_images(rebuild=rebuild)
+    if not renamed and not thumbnails:
+        print("All images are up to date.")
+    elif rebuild:
+        print("Renamed {} upload(s) and created {} thumbnail(s).".format(renamed, thumbnails))
+    else:
+        print("{} upload(s) must be renamed and {} thumbnail(s) must be created.".format(renamed, thumbnails))
+
+
 if __name__ == "__main__":
     manager.run()
@@ -0,0 +1,41 @@
+"""This package contains micro benchmarks for performance critical code paths.
+
+Each module can be run on its own, e.g. ``python -m benchmarks.bench_user_credit``. All benchmarks work on an in-memory
+database which is filled with synthetic data.
+"""
+
+import time
+from typing import Callable, Tuple
+
+from shop_db2.api import app, db, set_app
+from shop_db2.models import AdminUpdate, Product, Rank, Tag, User
+
+import configuration as config  # isort: skip
+
+
+def setup_database() -> None:
+    """Creates an empty in-memory database with one rank, one administrator, one tag and one product."""
+    set_app(config.UnittestConfig)
+    app.app_context().push()
+    db.drop_all()
+    db.create_all()
+    db.session.add(Rank(name="Member", debt_limit=-2000))
+    db.session.add(User(firstname="Admin", lastname="Admin", password=b"unused"))
+    db.session.commit()
+    db.session.add(AdminUpdate(user_id=1, admin_id=1, is_admin=True))
+    db.session.commit()
+    User.query.filter_by(id=1).first().verify(admin_id=1, rank_id=1)
+    db.session.add(Tag(name="Food", created_by=1))
+    db.session.add(Product(name="Pizza", created_by=1))
+    db.session.commit()
+    Product.query.filter_by(id=1).first().set_price(price=300, admin_id=1)
+    db.session.commit()
+
+
+def timed(func: Callable, repeat: int) -> Tuple[float, object]:
+    """Calls a function repeatedly and returns the mean execution time in milliseconds and the last result."""
+    result = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
@@ -0,0 +1,95 @@
+"""Benchmark for the memory usage of image uploads of (almost) the maximum content length of 4 MB.
+
+The upload is decoded chunk by chunk into a temporary file and only the header of the image is read before it is
+validated. For comparison, the upload is processed like before: the data URL prefix is removed with a copy of the
+whole string, the data is decoded at once, written to a temporary file and hashed.
+
+The peak memory is measured with tracemalloc, which only covers the allocations of Python objects. The pixel
+buffers of Pillow are not included, they are the same for both (and limited by "MAX_IMAGE_PIXELS"). The base64
+string itself is allocated before the measurement, because it is part of the parsed request in both cases.
+"""
+
+import base64
+import hashlib
+import io
+import os
+import random
+import shutil
+import tempfile
+import tracemalloc
+from typing import Callable, Tuple
+
+from PIL import Image
+
+from benchmarks import setup_database, timed
+from shop_db2.api import app
+from shop_db2.helpers.uploads import insert_image
+
+REPEAT = 5
+# Edge lengths of the uploaded images. Random pixels can't be compressed, so the largest image is almost 4 MB.
+IMAGE_SIZES = [250, 500, 1000]
+
+
+def _upload(size: int) -> str:
+    """Returns a PNG image with random pixels as base64 data URL, like it is sent by the frontend."""
+    rng = random.Random(size)
+    data = io.BytesIO()
+    Image.frombytes("RGB", (size, size), rng.randbytes(size * size * 3)).save(data, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(data.getvalue()).decode()
+
+
+def _insert_image_before(value: str) -> str:
+    """Validates and stores the image the way "insert_image" did before."""
+    temporary_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
+    data = base64.b64decode(value.replace("data:image/png;base64,", ""))
+    temporary_file.write(data)
+    temporary_file.close()
+    image = Image.open(temporary_file.name)
+    assert image.format == "PNG" and image.width == image.height
+    image.load()
+    filename = f"{hashlib.sha256(data).hexdigest()[:32]}.png"
+    shutil.move(temporary_file.name, os.path.join(app.config["UPLOAD_FOLDER"], filename))
+    return filename
+
+
+def _peak_memory(func: Callable[[], str]) -> Tuple[float, str]:
+    """Returns the peak memory in MiB of all Python objects allocated by the function and its result."""
+    tracemalloc.start()
+    try:
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak / 2**20, result
+
+
+def main() -> None:
+    setup_database()
+    upload_folder = tempfile.mkdtemp()
+    app.config["UPLOAD_FOLDER"] = upload_folder + "/"
+    try:
+        print(
+            f"{'upload [MB]':>11} | {'before [MiB]':>12} | {'streamed [MiB]':>14} | "
+            f"{'before [ms]':>11} | {'streamed [ms]':>13}"
+        )
+        for size in IMAGE_SIZES:
+            value = _upload(size)
+            file = {"filename": "image.png", "value": value}
+            # The thumbnails are created once and reused by all further uploads of the same image
+            insert_image(file)
+
+            before_mib, before = _peak_memory(lambda: _insert_image_before(value))
+            streamed_mib, streamed = _peak_memory(lambda: insert_image(file))
+            assert before == streamed
+            before_ms, _ = timed(lambda: _insert_image_before(value), REPEAT)
+            streamed_ms, _ = timed(lambda: insert_image(file), REPEAT)
+            print(
+                f"{len(value) / 1e6:>11.2f} | {before_mib:>12.2f} | {streamed_mib:>14.2f} | "
+                f"{before_ms:>11.3f} | {streamed_ms:>13.3f}"
+            )
+    finally:
+        shutil.rmtree(upload_folder)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Benchmark for the insertion of a batch of purchases.
+
+The batch pipeline resolves all users, ranks and products of the batch once and inserts the purchases in bulk, so
+the number of statements does not depend on the batch size. For comparison, the same purchases are inserted one by
+one via the ORM, which queries the product price and the user for every single purchase.
+"""
+
+from typing import Any, Callable, List
+
+from sqlalchemy import event
+
+from benchmarks import setup_database, timed
+from shop_db2.api import db
+from shop_db2.helpers.purchases import insert_purchases
+from shop_db2.models import Purchase, User
+
+BATCH_SIZES = [10, 100, 1_000]
+REPEAT = 5
+
+
+def _count_statements(func: Callable[[], None]) -> int:
+    """Returns the number of statements which are sent to the database by the given function."""
+    statements: List[str] = []
+
+    def _record(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", _record)
+    try:
+        func()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", _record)
+    return len(statements)
+
+
+def main() -> None:
+    setup_database()
+    admin = User.query.filter_by(id=1).first()
+    print(
+        f"{'batch size':>10} | {'batch [ms]':>12} | {'statements':>10} | {'one by one [ms]':>15} | {'statements':>10}"
+    )
+    for size in BATCH_SIZES:
+
+        def _batch() -> None:
+            insert_purchases(admin, [{"user_id": 1, "product_id": 1, "amount": 1} for _ in range(size)])
+            db.session.rollback()
+
+        def _one_by_one() -> None:
+            for _ in range(size):
+                db.session.add(Purchase(user_id=1, product_id=1, amount=1, admin_id=1))
+                db.session.flush()
+            db.session.rollback()
+
+        batch_ms, _ = timed(_batch, REPEAT)
+        single_ms, _ = timed(_one_by_one, REPEAT)
+        batch_statements = _count_statements(_batch)
+        single_statements = _count_statements(_one_by_one)
+        print(f"{size:>10} | {batch_ms:>12.3f} | {batch_statements:>10} | {single_ms:>15.3f} | {single_statements:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Benchmark for the user search with a growing number of users.
+
+The full-text search looks the search term up in the FTS5 index, whereas the string filter ("LIKE '%term%'") has
+to scan the whole users table for every keystroke. Both are run via the query parameters of the user list with the
+first 20 results, as they are requested by the search box of the terminal.
+"""
+
+import random
+
+from werkzeug.datastructures import ImmutableMultiDict
+
+from benchmarks import setup_database, timed
+from shop_db2.api import db
+from shop_db2.helpers.query import QueryFromRequestParameters
+from shop_db2.models import User
+
+USER_COUNTS = [1_000, 10_000, 50_000]
+REPEAT = 50
+SYLLABLES = ["an", "be", "chri", "da", "el", "fa", "ger", "hen", "ja", "ko", "li", "ma", "ni", "or", "pe", "ri", "sa"]
+# The search terms as they are typed
+TERMS = ["m", "ma", "mar", "mart", "marti"]
+
+
+def _name(rng: random.Random) -> str:
+    return "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+
+
+def _list_users(arguments: dict) -> int:
+    query = QueryFromRequestParameters(User, ImmutableMultiDict(arguments), ["id", "firstname", "lastname"])
+    result, _ = query.result()
+    return len(result)
+
+
+def main() -> None:
+    setup_database()
+    rng = random.Random(42)
+    inserted = 1
+    pagination = '{"page": 1, "perPage": 20}'
+    print(f"{'users':>10} | {'term':>6} | {'search [ms]':>12} | {'filter [ms]':>12} | {'found':>6}")
+    for count in USER_COUNTS:
+        rows = [{"firstname": _name(rng), "lastname": _name(rng), "credit": 0} for _ in range(count - inserted)]
+        db.session.execute(User.__table__.insert(), rows)
+        db.session.commit()
+        inserted = count
+
+        for term in TERMS:
+            search_ms, found = timed(lambda: _list_users({"search": term, "pagination": pagination}), REPEAT)
+            arguments = {"filter": f'{{"lastname": "{term}"}}', "pagination": pagination}
+            filter_ms, _ = timed(lambda: _list_users(arguments), REPEAT)
+            print(f"{count:>10} | {term:>6} | {search_ms:>12.3f} | {filter_ms:>12.3f} | {found:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""Benchmark for the serialization of the purchase list.
+
+The compiled serializer reads all fields of a purchase with a single attribute getter and the JSON encoder of the
+application uses orjson (if installed). For comparison, the purchases are converted with one getattr call per field
+and encoded with the standard flask JSON encoder, which was the only way before. Both produce the same output.
+"""
+
+import datetime
+import json
+from typing import Any, Dict, List
+
+from flask.json import JSONEncoder as FlaskJSONEncoder
+
+from benchmarks import setup_database, timed
+from shop_db2.api import db
+from shop_db2.helpers.serializers import JSONEncoder, serialize
+from shop_db2.models import Purchase
+
+LIST_LENGTHS = [1_000, 10_000, 50_000]
+REPEAT = 5
+FIELDS = ["id", "timestamp", "user_id", "admin_id", "product_id", "productprice", "amount", "revoked", "price"]
+
+
+def _convert_with_getattr(data: List[Any]) -> List[Dict[str, Any]]:
+    """Converts the purchases like "convert_minimal" did before."""
+    return [{field: getattr(item, field, None) for field in FIELDS} for item in data]
+
+
+def _encode(data: Any, encoder: type) -> str:
+    """Encodes the data with the same arguments as "jsonify" for compact output."""
+    return json.dumps(data, cls=encoder, sort_keys=True, separators=(",", ":"))
+
+
+def main() -> None:
+    setup_database()
+    inserted = 0
+    print(
+        f"{'purchases':>10} | {'getattr [ms]':>12} | {'flask json [ms]':>15} | "
+        f"{'serializer [ms]':>15} | {'app json [ms]':>13}"
+    )
+    for length in LIST_LENGTHS:
+        now = datetime.datetime.now()
+        rows = [
+            {"timestamp": now, "user_id": 1, "product_id": 1, "productprice": 300, "amount": 1, "revoked": False}
+            for _ in range(length - inserted)
+        ]
+        db.session.execute(Purchase.__table__.insert(), rows)
+        db.session.commit()
+        inserted = length
+        purchases = Purchase.query.all()
+
+        getattr_ms, old = timed(lambda: _convert_with_getattr(purchases), REPEAT)
+        serializer_ms, new = timed(lambda: serialize(purchases, FIELDS), REPEAT)
+        flask_json_ms, old_json = timed(lambda: _encode(old, FlaskJSONEncoder), REPEAT)
+        app_json_ms, new_json = timed(lambda: _encode(new, JSONEncoder), REPEAT)
+        assert old_json == new_json
+
+        print(
+            f"{length:>10} | {getattr_ms:>12.3f} | {flask_json_ms:>15.3f} | "
+            f"{serializer_ms:>15.3f} | {app_json_ms:>13.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
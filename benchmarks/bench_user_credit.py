@@ -0,0 +1,48 @@
+"""Benchmark for the credit lookup of a user with a growing purchase history.
+
+The persisted credit is read in constant time, whereas the aggregation over the full history (which was executed on
+every user load before) grows linearly with the number of purchases.
+"""
+
+import datetime
+
+from benchmarks import setup_database, timed
+from shop_db2.api import db
+from shop_db2.helpers.users import rebuild_user_credits
+from shop_db2.models import Purchase, User
+from shop_db2.models.user_credit import credit_expression
+
+HISTORY_LENGTHS = [100, 1_000, 10_000, 100_000]
+REPEAT = 200
+
+
+def main() -> None:
+    setup_database()
+    inserted = 0
+    print(f"{'purchases':>10} | {'persisted credit [ms]':>22} | {'aggregated credit [ms]':>22}")
+    for length in HISTORY_LENGTHS:
+        now = datetime.datetime.now()
+        rows = [
+            {"timestamp": now, "user_id": 1, "product_id": 1, "productprice": 300, "amount": 1, "revoked": False}
+            for _ in range(length - inserted)
+        ]
+        db.session.execute(Purchase.__table__.insert(), rows)
+        db.session.commit()
+        rebuild_user_credits()
+        inserted = length
+
+        def _persisted() -> int:
+            db.session.expire_all()
+            return User.query.filter_by(id=1).first().credit
+
+        def _aggregated() -> int:
+            return db.session.query(credit_expression(User.id)).filter(User.id == 1).scalar()
+
+        persisted_ms, persisted = timed(_persisted, REPEAT)
+        aggregated_ms, aggregated = timed(_aggregated, REPEAT)
+        assert persisted == aggregated == -300 * length
+        print(f"{length:>10} | {persisted_ms:>22.3f} | {aggregated_ms:>22.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -14,8 +14,27 @@ class BaseConfig(object):
     UPLOAD_FOLDER = PATH + "/src/shop_db2/uploads/"
     MAX_CONTENT_LENGTH = 4 * 1024 * 1024
     VALID_EXTENSIONS = ["png"]
+    # The edge lengths in pixels of the thumbnails which are created for each uploaded image
+    THUMBNAIL_SIZES = [64, 128, 256]
+    # Images with more pixels are rejected (before they are decoded), larger images are downscaled to this edge length
+    # before they are stored (None to keep the original size)
+    MAX_IMAGE_PIXELS = 4096 * 4096
+    MAX_IMAGE_SIZE = 1024
     MINIMUM_PASSWORD_LENGTH = 6
+    # The bcrypt work factor (log2 of the number of rounds) for newly hashed passwords
+    BCRYPT_LOG_ROUNDS = 12
+    # The lifetime of a login token and the time after the login in which a token can be refreshed without a password
+    TOKEN_LIFETIME_MINUTES = 60
+    TOKEN_REFRESH_WINDOW_MINUTES = 7 * 24 * 60
     MAINTENANCE = False
+    # The time in milliseconds a database connection waits for a lock and the number of retries of a request whose
+    # transaction failed because the database was locked by another worker
+    SQLITE_BUSY_TIMEOUT = 5000
+    DATABASE_RETRIES = 3
+    # The strategy to count the items of paginated lists ("exact", "cached" or "none") and the maximum age of a
+    # cached count in seconds (see "helpers/query.py")
+    QUERY_COUNT_STRATEGY = "exact"
+    QUERY_COUNT_CACHE_TIMEOUT = 60
 
 
 class ProductiveConfig(BaseConfig):
@@ -24,6 +43,9 @@ class ProductiveConfig(BaseConfig):
     ENV = "productive"
     DATABASE_PATH = PATH + "/src/shop_db2/shop.db"
     SQLALCHEMY_DATABASE_URI = "sqlite:///" + DATABASE_PATH
+    # The number of gunicorn worker processes. Note that a change of the maintenance mode only takes effect in the
+    # worker which handles the request until the other workers are restarted.
+    WORKERS = 1
 
 
 class DevelopmentConfig(BaseConfig):
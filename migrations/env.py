@@ -62,6 +62,13 @@ def run_migrations_online():
 
     """
 
+    # the full-text search indexes are virtual tables which are created by the migrations and can't be
+    # compared with the models, so they are excluded from the auto-migration
+    def include_object(object, name, type_, reflected, compare_to):
+        from shop_db2.models.search import is_search_index_table
+
+        return not (type_ == "table" and is_search_index_table(name))
+
     # this callback is used to prevent an auto-migration from being generated
     # when there are no changes to the schema
     # reference: http://alembic.zzzcomputing.com/en/latest/cookbook.html
@@ -83,6 +90,7 @@ def run_migrations_online():
             connection=connection,
             target_metadata=target_metadata,
             process_revision_directives=process_revision_directives,
+            include_object=include_object,
             **current_app.extensions["migrate"].configure_args
         )
 
@@ -0,0 +1,29 @@
+"""change counters of all tables
+
+Revision ID: a6d2e9f4c817
+Revises: f3c9d1e7a2b4
+Create Date: 2026-10-18 18:12:45.093126
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "a6d2e9f4c817"
+down_revision = "f3c9d1e7a2b4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "tableversions",
+        sa.Column("name", sa.String(length=64), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade():
+    op.drop_table("tableversions")
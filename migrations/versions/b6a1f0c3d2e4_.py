@@ -0,0 +1,49 @@
+"""persisted user credit
+
+Revision ID: b6a1f0c3d2e4
+Revises: 0f534f276238
+Create Date: 2026-10-18 09:12:41.318027
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "b6a1f0c3d2e4"
+down_revision = "0f534f276238"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column("users", sa.Column("credit", sa.Integer(), nullable=False, server_default="0"))
+
+    # Calculate the credit of all existing users from their full history
+    op.execute(
+        """
+        UPDATE users SET credit = (
+            SELECT COALESCE(SUM(replenishments.total_price), 0)
+            FROM replenishments
+            JOIN replenishmentcollections ON replenishmentcollections.id = replenishments.replcoll_id
+            WHERE replenishmentcollections.seller_id = users.id
+            AND replenishmentcollections.revoked = 0
+            AND replenishments.revoked = 0
+        ) + (
+            SELECT COALESCE(SUM(deposits.amount), 0)
+            FROM deposits
+            WHERE deposits.user_id = users.id
+            AND deposits.revoked = 0
+        ) - (
+            SELECT COALESCE(SUM(purchases.amount * purchases.productprice), 0)
+            FROM purchases
+            WHERE purchases.user_id = users.id
+            AND purchases.revoked = 0
+        )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_column("credit")
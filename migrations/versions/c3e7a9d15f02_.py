@@ -0,0 +1,46 @@
+"""current rank pointer on users
+
+Revision ID: c3e7a9d15f02
+Revises: b6a1f0c3d2e4
+Create Date: 2026-10-18 10:03:27.551904
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "c3e7a9d15f02"
+down_revision = "b6a1f0c3d2e4"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.add_column(sa.Column("rank_id", sa.Integer(), nullable=True))
+        batch_op.create_foreign_key(
+            constraint_name="fk_rank_id",
+            referent_table="ranks",
+            local_cols=["rank_id"],
+            remote_cols=["id"],
+        )
+
+    # The current rank of each user is the rank of its latest rank update
+    op.execute(
+        """
+        UPDATE users SET rank_id = (
+            SELECT rankupdates.rank_id
+            FROM rankupdates
+            WHERE rankupdates.user_id = users.id
+            ORDER BY rankupdates.id DESC
+            LIMIT 1
+        )
+        """
+    )
+
+
+def downgrade():
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_constraint("fk_rank_id", type_="foreignkey")
+        batch_op.drop_column("rank_id")
@@ -0,0 +1,47 @@
+"""indexes for foreign keys and filter paths
+
+Revision ID: d5a2c8e61b37
+Revises: c3e7a9d15f02
+Create Date: 2026-10-18 11:24:09.803316
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "d5a2c8e61b37"
+down_revision = "c3e7a9d15f02"
+branch_labels = None
+depends_on = None
+
+# All indexes as (name, table, columns)
+indexes = [
+    ("ix_adminupdates_user_id", "adminupdates", ["user_id"]),
+    ("ix_depositrevokes_deposit_id", "depositrevokes", ["deposit_id"]),
+    ("ix_deposits_user_id_revoked", "deposits", ["user_id", "revoked"]),
+    ("ix_product_tag_assignments_product_id", "product_tag_assignments", ["product_id"]),
+    ("ix_product_tag_assignments_tag_id", "product_tag_assignments", ["tag_id"]),
+    ("ix_productprices_product_id_timestamp", "productprices", ["product_id", "timestamp"]),
+    ("ix_purchaserevokes_purchase_id", "purchaserevokes", ["purchase_id"]),
+    ("ix_purchases_product_id_revoked_timestamp", "purchases", ["product_id", "revoked", "timestamp"]),
+    ("ix_purchases_user_id_revoked", "purchases", ["user_id", "revoked"]),
+    ("ix_rankupdates_user_id", "rankupdates", ["user_id"]),
+    ("ix_replenishmentcollectionrevoke_replcoll_id", "replenishmentcollectionrevoke", ["replcoll_id"]),
+    ("ix_replenishmentcollections_seller_id", "replenishmentcollections", ["seller_id"]),
+    ("ix_replenishmentrevoke_repl_id", "replenishmentrevoke", ["repl_id"]),
+    ("ix_replenishments_product_id_revoked", "replenishments", ["product_id", "revoked"]),
+    ("ix_replenishments_replcoll_id", "replenishments", ["replcoll_id"]),
+    ("ix_stocktakingcollectionrevokes_collection_id", "stocktakingcollectionrevokes", ["collection_id"]),
+    ("ix_stocktakings_collection_id", "stocktakings", ["collection_id"]),
+    ("ix_stocktakings_product_id", "stocktakings", ["product_id"]),
+]
+
+
+def upgrade():
+    for name, table, columns in indexes:
+        op.create_index(name, table, columns, unique=False)
+
+
+def downgrade():
+    for name, table, _ in reversed(indexes):
+        op.drop_index(name, table_name=table)
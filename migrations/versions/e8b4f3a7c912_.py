@@ -0,0 +1,68 @@
+"""daily financial rollups
+
+Revision ID: e8b4f3a7c912
+Revises: d5a2c8e61b37
+Create Date: 2026-10-18 14:02:37.551284
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "e8b4f3a7c912"
+down_revision = "d5a2c8e61b37"
+branch_labels = None
+depends_on = None
+
+# The day and the value of all existing entries as (source query, positive category, negative category)
+sources = [
+    (
+        "SELECT date(timestamp) AS day, amount * productprice AS value FROM purchases WHERE revoked = 0",
+        "purchase_income",
+        "purchase_refund",
+    ),
+    (
+        "SELECT date(timestamp) AS day, amount AS value FROM deposits WHERE revoked = 0",
+        "deposit_in",
+        "deposit_out",
+    ),
+    (
+        """
+        SELECT date(replenishmentcollections.timestamp) AS day, SUM(replenishments.total_price) AS value
+        FROM replenishmentcollections
+        JOIN replenishments ON replenishmentcollections.id = replenishments.replcoll_id
+        WHERE replenishmentcollections.revoked = 0
+        AND replenishments.revoked = 0
+        GROUP BY replenishmentcollections.id
+        """,
+        "replenishment_spending",
+        "replenishment_income",
+    ),
+]
+
+
+def upgrade():
+    op.create_table(
+        "financialrollups",
+        sa.Column("date", sa.Date(), nullable=False),
+        sa.Column("category", sa.String(length=32), nullable=False),
+        sa.Column("amount", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("date", "category"),
+    )
+
+    # Calculate the rollups of all existing purchases, deposits and replenishmentcollections. The balances between
+    # the stocktakings can't be calculated in SQL, they are added by "python Manager.py check_financial_rollups
+    # --rebuild".
+    for source, positive, negative in sources:
+        for category, condition, value in [(positive, "value >= 0", "value"), (negative, "value < 0", "-value")]:
+            op.execute(
+                f"""
+                INSERT INTO financialrollups (date, category, amount)
+                SELECT day, '{category}', SUM({value}) FROM ({source}) WHERE {condition} GROUP BY day
+                """
+            )
+
+
+def downgrade():
+    op.drop_table("financialrollups")
@@ -0,0 +1,46 @@
+"""full-text search indexes of users and products
+
+Revision ID: f3c9d1e7a2b4
+Revises: e8b4f3a7c912
+Create Date: 2026-10-18 16:41:12.208417
+
+"""
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "f3c9d1e7a2b4"
+down_revision = "e8b4f3a7c912"
+branch_labels = None
+depends_on = None
+
+# The search indexes as (name of the index, indexed table, indexed columns)
+indexes = [
+    ("users_search", "users", ["firstname", "lastname"]),
+    ("products_search", "products", ["name", "barcode"]),
+]
+
+
+def upgrade():
+    for index, source, columns in indexes:
+        names = ", ".join(columns)
+        new = ", ".join(f"new.{name}" for name in columns)
+        old = ", ".join(f"old.{name}" for name in columns)
+        delete = f"INSERT INTO {index}({index}, rowid, {names}) VALUES ('delete', old.id, {old});"
+        insert = f"INSERT INTO {index}(rowid, {names}) VALUES (new.id, {new});"
+        op.execute(
+            f"CREATE VIRTUAL TABLE {index} USING fts5({names}, content='{source}', content_rowid='id', "
+            f"tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+        )
+        op.execute(f"CREATE TRIGGER {index}_insert AFTER INSERT ON {source} BEGIN {insert} END")
+        op.execute(f"CREATE TRIGGER {index}_delete AFTER DELETE ON {source} BEGIN {delete} END")
+        op.execute(f"CREATE TRIGGER {index}_update AFTER UPDATE OF {names} ON {source} BEGIN {delete} {insert} END")
+        # Index all existing entries
+        op.execute(f"INSERT INTO {index}({index}) VALUES ('rebuild')")
+
+
+def downgrade():
+    for index, _, _ in indexes:
+        for trigger in ["insert", "delete", "update"]:
+            op.execute(f"DROP TRIGGER IF EXISTS {index}_{trigger}")
+        op.execute(f"DROP TABLE IF EXISTS {index}")
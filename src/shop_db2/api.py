@@ -5,11 +5,13 @@ __author__ = "g3n35i5"
 from flask import Flask, jsonify
 from flask_bcrypt import Bcrypt
 
+from shop_db2.helpers.serializers import JSONEncoder
 from shop_db2.shared import db
 
 import configuration as config  # isort: skip
 
 app = Flask(__name__)
+app.json_encoder = JSONEncoder
 
 # Default app settings (to suppress unittest warnings) will be overwritten.
 app.config.from_object(config.BaseConfig)
@@ -107,3 +109,10 @@ import shop_db2.routes.tags  # noqa: E402
 # User routes
 # noinspection PyUnresolvedReferences
 import shop_db2.routes.users  # noqa: E402
+
+# Database setup: SQLite connection settings and retries of transactions which failed due to a locked database.
+# All routes have to be imported before, so that they can be wrapped.
+from shop_db2.helpers.database import retry_on_busy  # noqa: E402
+
+for _endpoint, _view_function in app.view_functions.items():
+    app.view_functions[_endpoint] = retry_on_busy(_view_function)
@@ -114,6 +114,12 @@ class FileTooLarge(ShopdbException):
     code = 401
 
 
+class ImageTooLarge(ShopdbException):
+    type = "error"
+    message = "The image has too many pixels."
+    code = 401
+
+
 class InvalidAmount(ShopdbException):
     type = "error"
     message = "The quantity to be purchased is not permitted."
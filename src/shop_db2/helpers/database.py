@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import random
+import sqlite3
+import time
+from functools import wraps
+from typing import Any, Callable
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+
+from shop_db2.api import app, db
+
+# SQLite allows only one writer at a time. To run multiple workers on the same database file, the database is
+# switched to the write-ahead log (readers don't block the writer and vice versa) and a connection waits up to
+# "SQLITE_BUSY_TIMEOUT" milliseconds for a lock before it fails. If a transaction still fails because the database
+# is locked, the whole request is rolled back and executed again, at most "DATABASE_RETRIES" times.
+
+
+@event.listens_for(Engine, "connect")
+def _configure_sqlite_connection(dbapi_connection: Any, _: Any) -> None:
+    """Enables the write-ahead log and sets the busy timeout of every new SQLite connection."""
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout={:d}".format(app.config.get("SQLITE_BUSY_TIMEOUT", 5000)))
+    cursor.close()
+
+
+def is_database_locked(error: OperationalError) -> bool:
+    """Returns whether the error has been raised because the database was locked by another connection."""
+    message = str(error.orig).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def retry_on_busy(func: Callable) -> Callable:
+    """This decorator executes the wrapped function again if its transaction
+    failed because the database was locked by another worker. Before each
+    retry, the transaction is rolled back and a short random delay prevents
+    the workers from colliding again.
+
+    :param func:              Is the wrapped function.
+
+    :return:                  The wrapped function.
+
+    :raises OperationalError: If the database is still locked after the last
+                              retry or the error has another reason.
+    """
+
+    @wraps(func)
+    def decorator(*args: Any, **kwargs: Any) -> Any:
+        retries = app.config.get("DATABASE_RETRIES", 3)
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == retries or not is_database_locked(error):
+                    raise
+                db.session.rollback()
+                time.sleep(random.uniform(0.01, 0.05) * 2**attempt)  # nosec
+        return None  # pragma: no cover
+
+    return decorator
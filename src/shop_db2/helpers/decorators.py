@@ -2,15 +2,18 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
+import hashlib
 from functools import wraps
-from typing import Any, Callable
+from typing import Any, Callable, Optional, Tuple, Type
 
 import jwt
-from flask import Response, request
+from flask import Response, g, request
+from sqlalchemy.orm import load_only
 
 import shop_db2.exceptions as exc
 from shop_db2.api import app
 from shop_db2.models import User
+from shop_db2.models.table_version import get_table_versions
 
 
 def checkIfUserIsValid(func: Callable) -> Callable:
@@ -46,6 +49,52 @@ def checkIfUserIsValid(func: Callable) -> Callable:
     return decorator
 
 
+def _resolve_admin() -> Tuple[Optional[User], Optional[Type[exc.ShopdbException]], bool]:
+    """Resolves the administrator of the current request from the token in the request header. The token is
+    decoded and the administrator is loaded only once per request, the result is stored in flask.g and reused by
+    all decorators (and the before request hook).
+
+    Only the columns required to check the administrator privileges are loaded. All other (expensive) column
+    properties are deferred and get loaded on first access.
+
+    :return: A tuple with the administrator (or None), the exception to be raised if an administrator is required
+             (or None) and whether this exception must also be raised if the administrator is optional.
+    """
+    if "principal" in g:
+        return g.principal
+
+    # Does the request header contain a token?
+    token = request.headers.get("token")
+    if token is None:
+        g.principal = (None, exc.UnauthorizedAccess, False)
+        return g.principal
+
+    # Is the token valid?
+    try:
+        data = jwt.decode(token, app.config["SECRET_KEY"])
+    except jwt.exceptions.DecodeError:
+        g.principal = (None, exc.TokenIsInvalid, False)
+        return g.principal
+    except jwt.ExpiredSignatureError:
+        g.principal = (None, exc.TokenHasExpired, False)
+        return g.principal
+
+    # If there is no admin object in the token and does the user does have
+    # admin rights?
+    try:
+        admin_id = data["user"]["id"]
+    except KeyError:
+        g.principal = (None, exc.TokenIsInvalid, True)
+        return g.principal
+
+    admin = User.query.options(load_only(User.id, User.is_admin)).filter(User.id == admin_id).first()
+    if admin is None or admin.is_admin is not True:
+        g.principal = (None, exc.UnauthorizedAccess, False)
+    else:
+        g.principal = (admin, None, False)
+    return g.principal
+
+
 def adminRequired(func: Callable) -> Callable:
     """This function checks whether a valid token is contained in the request.
     If this is not the case, or the user has no admin rights, the request
@@ -67,30 +116,9 @@ def adminRequired(func: Callable) -> Callable:
 
     @wraps(func)
     def decorated(*args: Any, **kwargs: Any) -> Any:
-        # Does the request header contain a token?
-        try:
-            token = request.headers["token"]
-        except KeyError as error:
-            raise exc.UnauthorizedAccess() from error
-
-        # Is the token valid?
-        try:
-            data = jwt.decode(token, app.config["SECRET_KEY"])
-        except jwt.exceptions.DecodeError as error:
-            raise exc.TokenIsInvalid() from error
-        except jwt.ExpiredSignatureError as error:
-            raise exc.TokenHasExpired() from error
-
-        # If there is no admin object in the token and does the user does have
-        # admin rights?
-        try:
-            admin_id = data["user"]["id"]
-            admin = User.query.filter(User.id == admin_id).first()
-            assert admin.is_admin is True
-        except KeyError as error:
-            raise exc.TokenIsInvalid() from error
-        except AssertionError as error:
-            raise exc.UnauthorizedAccess() from error
+        admin, error, _ = _resolve_admin()
+        if error is not None:
+            raise error()
 
         # At this point it was verified that the request comes from an
         # admin and the request is executed. In addition, the user is
@@ -112,41 +140,16 @@ def adminOptional(func: Callable) -> Callable:
                              additional parameter admin, if present.
                              Otherwise, the parameter admin is None.
 
-    :raises TokenIsInvalid:  If the token cannot be decoded.
-    :raises TokenHasExpired: If the token has been expired.
     :raises TokenIsInvalid:  If no user object could be found in the decoded
                              token.
     """
 
     @wraps(func)
     def decorated(*args: Any, **kwargs: Any) -> Any:
-        # Does the request header contain a token?
-        try:
-            token = request.headers["token"]
-        except KeyError:
-            return func(admin=None, *args, **kwargs)
-
-        # Is the token valid?
-        try:
-            data = jwt.decode(token, app.config["SECRET_KEY"])
-        except (jwt.exceptions.DecodeError, jwt.ExpiredSignatureError):
-            return func(admin=None, *args, **kwargs)
-
-        # If there is no admin object in the token and does the user does have
-        # admin rights?
-        try:
-            admin_id = data["user"]["id"]
-            admin = User.query.filter(User.id == admin_id).first()
-            assert admin.is_admin is True
-        except KeyError as error:
-            raise exc.TokenIsInvalid() from error
-        except AssertionError:
-            return func(admin=None, *args, **kwargs)
+        admin, error, always_raise = _resolve_admin()
+        if error is not None and always_raise:
+            raise error()
 
-        # At this point it was verified that the request comes from an
-        # admin and the request is executed. In addition, the user is
-        # forwarded to the following function so that the administrator
-        # responsible for any changes in the database can be traced.
         return func(admin=admin, *args, **kwargs)
 
     return decorated
@@ -176,3 +179,50 @@ def deprecate_route(message: str = "") -> Callable:
         return _wrapper
 
     return _decorator
+
+
+def _set_etag(response: Response, etag: str) -> Response:
+    """Adds the ETag to the response. Clients may store the response, but have to revalidate it on every use."""
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response
+
+
+def etag_from_tables(*tables: str) -> Callable:
+    """This decorator answers conditional GET requests of routes whose responses only depend on the given tables
+    and the query parameters. The ETag is derived from the change counters of these tables (see
+    "models/table_version.py"), the path and the query string, so it is known before the response is created. If
+    the client already has the current version ("If-None-Match"), the route is not executed at all and an empty
+    response with the status code 304 is returned.
+
+    Requests of administrators are always answered in full, because they may get more (and more volatile) data.
+
+    The change counters are read before the route is executed. If the data changes in between, the response is
+    sent with the old ETag and requested again next time, but outdated data is never confirmed.
+
+    :param tables: Are the names of all tables the responses depend on.
+    """
+
+    def _decorator(func: Callable) -> Callable:
+        @wraps(func)
+        def _wrapper(*args: Any, **kwargs: Any) -> Any:
+            if kwargs.get("admin") is not None:
+                return func(*args, **kwargs)
+
+            versions = get_table_versions(tables)
+            key = "|".join([request.path, request.query_string.decode("latin-1")])
+            key += "|" + ",".join(f"{name}={version}" for name, version in versions.items())
+            etag = hashlib.sha256(key.encode()).hexdigest()[:32]
+
+            if request.if_none_match.contains_weak(etag):
+                return _set_etag(app.response_class(status=304), etag)
+
+            data = func(*args, **kwargs)
+            response = data[0] if isinstance(data, tuple) else data
+            if isinstance(response, Response) and response.status_code == 200:
+                _set_etag(response, etag)
+            return data
+
+        return _wrapper
+
+    return _decorator
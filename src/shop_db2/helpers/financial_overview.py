@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, or_
+
+import shop_db2.exceptions as exc
+from shop_db2.api import db
+from shop_db2.helpers.stocktakings import _get_balance_between_stocktakings
+from shop_db2.models import FinancialRollup, StocktakingCollection
+from shop_db2.models.financial_rollup import CATEGORIES, STOCKTAKING_LOSS, STOCKTAKING_PROFIT, raw_financial_rollups
+
+# The formats of the time series buckets.
+BUCKET_FORMATS = {"day": "%Y-%m-%d", "month": "%Y-%m", "year": "%Y"}
+
+
+def _in_range(query, start: Optional[datetime], end: Optional[datetime]):
+    """Restricts the query to all rollups of the days in the time range.
+    Missing boundaries are not restricted.
+    """
+    if start is not None:
+        query = query.filter(FinancialRollup.date >= start.date())
+    if end is not None:
+        query = query.filter(FinancialRollup.date <= end.date())
+    return query
+
+
+def _get_stocktaking_balance(start: Optional[datetime], end: Optional[datetime]) -> Tuple[int, int]:
+    """Returns the profit and the loss between the first and the last
+    stocktakingcollection in the time range. If there is no or only one
+    stocktakingcollection, both values are 0.
+    """
+    criteria = []
+    if start is not None:
+        criteria.append(StocktakingCollection.timestamp >= datetime.combine(start.date(), datetime.min.time()))
+    if end is not None:
+        criteria.append(
+            StocktakingCollection.timestamp < datetime.combine(end.date() + timedelta(days=1), datetime.min.time())
+        )
+    # The first and the last stocktakingcollection are loaded with a single query.
+    first_id = db.session.query(func.min(StocktakingCollection.id)).filter(*criteria).as_scalar()
+    last_id = db.session.query(func.max(StocktakingCollection.id)).filter(*criteria).as_scalar()
+    collections = (
+        StocktakingCollection.query.filter(
+            or_(StocktakingCollection.id == first_id, StocktakingCollection.id == last_id)
+        )
+        .order_by(StocktakingCollection.id)
+        .all()
+    )
+    if len(collections) < 2:
+        return 0, 0
+
+    balance = _get_balance_between_stocktakings(collections[0], collections[-1])
+    return balance["profit"], balance["loss"]
+
+
+def get_financial_overview_buckets(start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, int]:
+    """Calculates all income and expense buckets of the financial overview
+    from the daily financial rollups. Since there is only one rollup per day
+    and category, the costs only depend on the number of days in the time
+    range and not on the number of entries.
+
+    The stocktaking profit and loss are the balance between the first and
+    the last stocktakingcollection in the time range, like they have always
+    been. They are not the sum of the balances between all consecutive
+    stocktakingcollections in the stocktaking rollups, because the
+    differences of the single periods may cancel each other out.
+
+    :param start: Is the (optional) start of the time range. The whole day
+                  is included.
+    :param end:   Is the (optional) end of the time range. The whole day is
+                  included.
+
+    :return:      A dictionary with the sums of all rollup categories.
+    """
+    query = db.session.query(FinancialRollup.category, func.sum(FinancialRollup.amount))
+    query = _in_range(query, start, end).group_by(FinancialRollup.category)
+    buckets = dict.fromkeys(CATEGORIES, 0)
+    buckets.update(dict(query.all()))
+    buckets[STOCKTAKING_PROFIT], buckets[STOCKTAKING_LOSS] = _get_stocktaking_balance(start, end)
+    return buckets
+
+
+def get_financial_overview_series(
+    bucket: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> Dict[str, Dict[str, int]]:
+    """Calculates the income and expense buckets of the financial overview
+    for each day, month or year in the time range.
+
+    :param bucket:       Is the length of a period, either "day", "month" or
+                         "year".
+    :param start:        Is the (optional) start of the time range.
+    :param end:          Is the (optional) end of the time range.
+
+    :return:             A dictionary mapping the periods in chronological
+                         order to the sums of all rollup categories. Periods
+                         without any rollups are omitted.
+
+    :raises InvalidData: If the bucket is unknown.
+    """
+    if bucket not in BUCKET_FORMATS:
+        raise exc.InvalidData()
+
+    period = func.strftime(BUCKET_FORMATS[bucket], FinancialRollup.date)
+    query = db.session.query(period, FinancialRollup.category, func.sum(FinancialRollup.amount))
+    query = _in_range(query, start, end).group_by(period, FinancialRollup.category).order_by(period)
+
+    series: Dict[str, Dict[str, int]] = {}
+    for key, category, amount in query.all():
+        series.setdefault(key, dict.fromkeys(CATEGORIES, 0))[category] = amount
+    return series
+
+
+def get_inconsistent_financial_rollups() -> List[Dict]:
+    """Compares the persisted financial rollups with the rollups calculated
+    from the full history of all purchases, deposits,
+    replenishmentcollections and stocktakingcollections.
+
+    :return: A list with the day, the category, the persisted amount and the
+             expected amount of all wrong rollups.
+    """
+    persisted = {(row.date, row.category): row.amount for row in FinancialRollup.query.all()}
+    expected = raw_financial_rollups()
+    inconsistent = []
+    for day, category in sorted(set(persisted) | set(expected)):
+        amount = persisted.get((day, category), 0)
+        expected_amount = expected.get((day, category), 0)
+        if amount != expected_amount:
+            inconsistent.append({"date": day, "category": category, "amount": amount, "expected": expected_amount})
+    return inconsistent
+
+
+def rebuild_financial_rollups() -> int:
+    """Recalculates all financial rollups from the full history.
+    This is only necessary if the database has been modified without the
+    application, the rollups are kept up to date on every change otherwise.
+
+    :return: The number of corrected rollups.
+    """
+    inconsistent = get_inconsistent_financial_rollups()
+    rows = [
+        {"date": day, "category": category, "amount": amount}
+        for (day, category), amount in raw_financial_rollups().items()
+        if amount != 0
+    ]
+    table = FinancialRollup.__table__
+    db.session.execute(table.delete())
+    if rows:
+        db.session.execute(table.insert(), rows)
+    db.session.commit()
+    return len(inconsistent)
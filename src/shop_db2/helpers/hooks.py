@@ -5,6 +5,7 @@ __author__ = "g3n35i5"
 import datetime
 import logging
 import time
+from typing import Optional
 
 from flask import g, request
 from flask.wrappers import Response
@@ -67,3 +68,13 @@ def after_request_hook(response: Response) -> Response:
         )
 
     return response
+
+
+@app.teardown_request
+def teardown_request_hook(_: Optional[BaseException]) -> None:
+    """This function gets executed after each request, even if it failed. It
+    discards the administrator which has been resolved for the request (see
+    "helpers/decorators.py"), because the application context and flask.g
+    may outlive a single request (e.g. in the unittests).
+    """
+    g.pop("principal", None)
@@ -2,14 +2,63 @@
 
 
 import datetime
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
 
-from sqlalchemy import and_
+from sqlalchemy import event, func, or_, select
 
 import shop_db2.exceptions as exc
-import shop_db2.helpers.purchases as purchase_helpers
-import shop_db2.helpers.replenishments as replenishment_helpers
-import shop_db2.helpers.stocktakings as stocktaking_helpers
-from shop_db2.models import Product, ProductPrice
+from shop_db2.models import (
+    Product,
+    ProductPrice,
+    Purchase,
+    Replenishment,
+    ReplenishmentCollection,
+    Stocktaking,
+    StocktakingCollection,
+)
+
+# In-process map of the barcodes to the ids of their products (see "get_product_by_barcode")
+_product_ids_by_barcode: Dict[str, int] = {}
+
+
+@event.listens_for(Product.barcode, "set")
+def _invalidate_barcodes(_: Product, value: Optional[str], oldvalue: Any, __: Any) -> None:
+    """Removes the old and the new barcode of a product from the barcode map whenever a barcode is set, e.g. by
+    "Product.set_barcode" or when a product is created.
+    """
+    for barcode in (value, oldvalue):
+        if isinstance(barcode, str):
+            _product_ids_by_barcode.pop(barcode, None)
+
+
+def get_product_by_barcode(barcode: str, *options: Any) -> Product:
+    """Returns the product with exactly this barcode. Known barcodes are resolved via the barcode map, so the
+    product is loaded by its primary key. Unknown barcodes are looked up via the unique index of the barcodes.
+    Either way, only one query is necessary.
+
+    The barcode map is kept per worker process. Since the barcode of a product may have been changed by another
+    worker, the barcode of the loaded product is checked again.
+
+    :param barcode:        Is the barcode of the product.
+    :param options:        Are the loader options for the product query.
+
+    :return:               The product.
+
+    :raises EntryNotFound: If there is no product with this barcode.
+    """
+    product_id = _product_ids_by_barcode.get(barcode)
+    if product_id is not None:
+        product = Product.query.options(*options).filter(Product.id == product_id).first()
+        if product is not None and product.barcode == barcode:
+            return product
+        _product_ids_by_barcode.pop(barcode, None)
+
+    product = Product.query.options(*options).filter(Product.barcode == barcode).first()
+    if product is None:
+        raise exc.EntryNotFound()
+    _product_ids_by_barcode[barcode] = product.id
+    return product
 
 
 def _shift_date_to_begin_of_day(date: datetime.datetime) -> datetime.datetime:
@@ -30,13 +79,14 @@ def _shift_date_to_end_of_day(date: datetime.datetime) -> datetime.datetime:
     return date.replace(hour=23, minute=59, second=59, microsecond=999999)
 
 
-def _get_product_mean_price_in_time_range(product_id: int, start: datetime.datetime, end: datetime.datetime) -> int:
-    """This function calculates the mean price in a given range of time.
+def _check_time_range(start: datetime.datetime, end: datetime.datetime) -> None:
+    """This function checks whether the start and end dates define a valid range of time.
 
-    :param product_id: Is the product id.
-    :param start:      Is the start date.
-    :param end:        Is the end date.
-    :return:           The mean product price in the given time range.
+    :param start: Is the start date.
+    :param end:   Is the end date.
+    :return:      None
+
+    :raises InvalidData: If the dates are no date objects or the end date does not lie after the start date.
     """
     # Check if start and end dates are date objects.
     if not all([isinstance(d, datetime.datetime) for d in [start, end]]):
@@ -46,97 +96,194 @@ def _get_product_mean_price_in_time_range(product_id: int, start: datetime.datet
     if end <= start:
         raise exc.InvalidData()
 
-    # Check the product id
-    if not Product.query.filter_by(id=product_id).first():
-        raise exc.EntryNotFound()
 
-    # Get product price at the time of the first stocktaking.
-    res1 = (
-        ProductPrice.query.filter(ProductPrice.product_id == product_id)
-        .filter(ProductPrice.timestamp <= start)
-        .order_by(ProductPrice.timestamp.desc())
-        .first()
-    )
+def _calculate_mean_price(
+    changes: List[Tuple[datetime.datetime, int]], start: datetime.datetime, end: datetime.datetime
+) -> int:
+    """This function calculates the mean price of a product from its price changes in a given range of time.
 
-    # Get all price changes in the range between the two stocktakings
-    res2 = (
-        ProductPrice.query.filter(ProductPrice.product_id == product_id)
-        .filter(and_(ProductPrice.timestamp < end, ProductPrice.timestamp > start))
-        .order_by(ProductPrice.timestamp)
+    :param changes: Is the list of all price changes as (timestamp, price) tuples in chronological order. The first
+                    entry is the price which was valid at the start date.
+    :param start:   Is the start date.
+    :param end:     Is the end date.
+    :return:        The mean product price in the given time range.
+    """
+    # The prices are weighted with a granularity of whole days. Every day after the start day up to (and including)
+    # the day after the end day is counted once.
+    first_day = _shift_date_to_begin_of_day(start) + datetime.timedelta(days=1)
+    last_day = _shift_date_to_begin_of_day(end) + datetime.timedelta(days=1)
+
+    # Map the beginning of the day of all changes to the price. If there are multiple changes
+    # on the same day, the first one is taken.
+    prices: Dict[datetime.datetime, int] = {}
+    for timestamp, price in changes:
+        prices.setdefault(_shift_date_to_begin_of_day(timestamp), price)
+
+    # A price change becomes effective on the day after it has been made. Changes made on the start day
+    # or before are already covered by the first price.
+    current_price = changes[0][1]
+    interval_start = first_day
+    sum_price = 0
+    for day in sorted(day for day in prices if first_day <= day < last_day):
+        sum_price += ((day - interval_start).days + 1) * current_price
+        current_price = prices[day]
+        interval_start = day + datetime.timedelta(days=1)
+    sum_price += ((last_day - interval_start).days + 1) * current_price
+
+    day_count = (last_day - first_day).days + 1
+
+    # Return the mean product price as integer.
+    return int(round(sum_price / day_count))
+
+
+def _get_product_mean_prices_in_time_range(
+    product_ids: List[int], start: datetime.datetime, end: datetime.datetime
+) -> Dict[int, int]:
+    """This function calculates the mean prices of multiple products in a given range of time. All price changes
+    of all products are queried at once.
+
+    :param product_ids: Is the list of the product ids.
+    :param start:       Is the start date.
+    :param end:         Is the end date.
+    :return:            A dictionary mapping the product ids to their mean price in the given time range.
+    """
+    _check_time_range(start, end)
+
+    # Get all price changes of all products until the end date in chronological order.
+    rows = (
+        ProductPrice.query.with_entities(ProductPrice.product_id, ProductPrice.timestamp, ProductPrice.price)
+        .filter(ProductPrice.product_id.in_(product_ids))
+        .filter(ProductPrice.timestamp < end)
+        .order_by(ProductPrice.product_id, ProductPrice.timestamp, ProductPrice.id)
         .all()
     )
+    history: Dict[int, List[Tuple[datetime.datetime, int]]] = defaultdict(list)
+    for product_id, timestamp, price in rows:
+        history[product_id].append((timestamp, price))
+
+    mean_prices = {}
+    current_prices = None
+    for product_id in product_ids:
+        # Get the product price at the start date and all price changes in the time range.
+        before = [change for change in history[product_id] if change[0] <= start]
+        changes = before[-1:] + [change for change in history[product_id] if change[0] > start]
+
+        # If no price could be determined, take the current price.
+        if not before:
+            if current_prices is None:
+                query = Product.query.with_entities(Product.id, Product.price).filter(Product.id.in_(product_ids))
+                current_prices = dict(query.all())
+            mean_prices[product_id] = current_prices[product_id]
+        # If there are no resulting changes, return the first price.
+        elif len(changes) == 1:
+            mean_prices[product_id] = changes[0][1]
+        # Iterate over all days in the time range and calculate the mean price
+        else:
+            mean_prices[product_id] = _calculate_mean_price(changes, start, end)
+
+    return mean_prices
 
-    # Get a list of all product price changes
-    changes = [res1] + res2
-
-    # If no price could be determined, take the current price.
-    if not changes or not changes[0]:
-        return Product.query.filter_by(id=product_id).first().price
-    # If there are no resulting changes, return the first price.
-    elif len(changes) == 1:
-        return changes[0].price
-
-    # Iterate over all days in the time range and calculate the mean price
-    else:
-        # Get the timestamp of the first entry.
-        first = changes[0].timestamp
-
-        # Shift the first timestamp to the beginning of the day and the last
-        # timestamp to the end of the day.
-        first = _shift_date_to_begin_of_day(first)
-        start = _shift_date_to_begin_of_day(start)
-        end = _shift_date_to_end_of_day(end)
-
-        # Shift the timestamp of all changes to the beginning of the day.
-        for item in changes:
-            item.timestamp = _shift_date_to_begin_of_day(item.timestamp)
-
-        # Set the current date to the first entry.
-        current_date = first
-        current_price = changes[0].price
-        day_count = 0
-        sum_price = 0
-
-        # Iterate over all days and increment the day count and sum all prices.
-        while current_date <= end:
-            current_date += datetime.timedelta(days=1)
-            if current_date <= start:
-                continue
-            day_count += 1
-            sum_price += current_price
-            if current_date in list(map(lambda x: x.timestamp, changes)):
-                current_price = next(item for item in changes if item.timestamp == current_date).price
-
-        # Return the mean product price as integer.
-        return int(round(sum_price / day_count))
 
+def _get_product_mean_price_in_time_range(product_id: int, start: datetime.datetime, end: datetime.datetime) -> int:
+    """This function calculates the mean price in a given range of time.
 
-def get_theoretical_stock_of_product(product_id: int) -> int:
-    """Returns the theoretical stock level of a product.
+    :param product_id: Is the product id.
+    :param start:      Is the start date.
+    :param end:        Is the end date.
+    :return:           The mean product price in the given time range.
+    """
+    _check_time_range(start, end)
+
+    # Check the product id
+    if not Product.query.filter_by(id=product_id).first():
+        raise exc.EntryNotFound()
+
+    return _get_product_mean_prices_in_time_range([product_id], start, end)[product_id]
+
+
+def get_theoretical_stock_of_products(product_ids: Optional[List[int]] = None) -> Dict[int, int]:
+    """Returns the theoretical stock levels of multiple products.
 
     The theoretical stock level of a product is the result of the number
     determined in the last stocktaking minus the sum of the amount of purchases
     that were not revoked plus the sum of the amount of replenishments since then.
+    The stock levels of all products are determined with a fixed number of queries.
+
+    :param product_ids: Is the list of the product ids. If it is None, the stock levels of all products are returned.
+    :return:            A dictionary mapping the product ids to their theoretical stock level.
     """
-    # Get the latest stocktaking of a product
-    latest_stocktaking = stocktaking_helpers.get_latest_stocktaking_of_product(product_id)
-
-    # If there has been a stocktaking, it defines the start timestamp.
-    # Otherwise, we have to take all purchases of this product into account.
-    if latest_stocktaking is not None:
-        start = latest_stocktaking.stocktakingcollection.timestamp
-        stocktaking_count = latest_stocktaking.count
-    else:
-        start = datetime.datetime.min
-        stocktaking_count = 0
+
+    def _filter_products(query: Any, column: Any) -> Any:
+        return query if product_ids is None else query.filter(column.in_(product_ids))
+
+    # Get the latest (non revoked) stocktaking of each product. If there has been a stocktaking, it defines the
+    # start timestamp. Otherwise, we have to take all purchases of this product into account.
+    ranked = _filter_products(
+        Stocktaking.query.with_entities(
+            Stocktaking.product_id,
+            Stocktaking.count,
+            StocktakingCollection.timestamp,
+            func.row_number()
+            .over(partition_by=Stocktaking.product_id, order_by=Stocktaking.id.desc())
+            .label("position"),
+        )
+        .join(StocktakingCollection, StocktakingCollection.id == Stocktaking.collection_id)
+        .filter(StocktakingCollection.revoked.is_(False)),
+        Stocktaking.product_id,
+    ).subquery()
+    latest = (
+        select([ranked.c.product_id, ranked.c.count, ranked.c.timestamp]).where(ranked.c.position == 1).alias("latest")
+    )
 
     end = datetime.datetime.utcnow()
 
-    # Get the sum of all purchase amounts in the selected interval
-    sum_purchase_amount = purchase_helpers.get_purchase_amount_in_interval(product_id, start, end)
+    # Get the stocktaking count of all products
+    stocks = dict(
+        _filter_products(
+            Product.query.with_entities(Product.id, func.coalesce(latest.c.count, 0)).outerjoin(
+                latest, latest.c.product_id == Product.id
+            ),
+            Product.id,
+        ).all()
+    )
 
-    # Get the sum of all refund amounts in the selected interval
-    sum_replenishment_amount = replenishment_helpers.get_replenishment_amount_in_interval(product_id, start, end)
+    # Get the sum of all purchase amounts since the latest stocktaking
+    purchases = _filter_products(
+        Purchase.query.with_entities(Purchase.product_id, func.sum(Purchase.amount))
+        .outerjoin(latest, latest.c.product_id == Purchase.product_id)
+        .filter(Purchase.revoked.is_(False))
+        .filter(or_(latest.c.timestamp.is_(None), Purchase.timestamp >= latest.c.timestamp))
+        .filter(Purchase.timestamp <= end)
+        .group_by(Purchase.product_id),
+        Purchase.product_id,
+    )
+    for product_id, amount in purchases:
+        if product_id in stocks:
+            stocks[product_id] -= amount
+
+    # Get the sum of all refund amounts since the latest stocktaking
+    replenishments = _filter_products(
+        Replenishment.query.with_entities(Replenishment.product_id, func.sum(Replenishment.amount))
+        .join(ReplenishmentCollection, ReplenishmentCollection.id == Replenishment.replcoll_id)
+        .outerjoin(latest, latest.c.product_id == Replenishment.product_id)
+        .filter(ReplenishmentCollection.revoked.is_(False))
+        .filter(or_(latest.c.timestamp.is_(None), ReplenishmentCollection.timestamp >= latest.c.timestamp))
+        .filter(ReplenishmentCollection.timestamp <= end)
+        .group_by(Replenishment.product_id),
+        Replenishment.product_id,
+    )
+    for product_id, amount in replenishments:
+        if product_id in stocks:
+            stocks[product_id] += amount
 
-    # Theoretical stock level
-    return stocktaking_count - sum_purchase_amount + sum_replenishment_amount
+    return stocks
+
+
+def get_theoretical_stock_of_product(product_id: int) -> int:
+    """Returns the theoretical stock level of a product.
+
+    The theoretical stock level of a product is the result of the number
+    determined in the last stocktaking minus the sum of the amount of purchases
+    that were not revoked plus the sum of the amount of replenishments since then.
+    """
+    return get_theoretical_stock_of_products([product_id]).get(product_id, 0)
@@ -3,9 +3,10 @@
 __author__ = "g3n35i5"
 
 import datetime
-from typing import Optional
+from typing import List, Optional
 
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import func
 
 import shop_db2.exceptions as exc
@@ -13,6 +14,8 @@ from shop_db2.api import db
 from shop_db2.helpers.utils import parse_timestamp
 from shop_db2.helpers.validators import check_fields_and_types
 from shop_db2.models import Product, Purchase, Rank, User
+from shop_db2.models.financial_rollup import add_to_financial_rollups
+from shop_db2.models.user_credit import add_to_user_credits
 
 
 def get_purchase_amount_in_interval(product_id: int, start: datetime.datetime, end: datetime.datetime) -> int:
@@ -28,11 +31,15 @@ def get_purchase_amount_in_interval(product_id: int, start: datetime.datetime, e
     return result[0] or 0
 
 
-def insert_purchase(admin: Optional[User], data: dict) -> None:
-    """This helper function creates a single purchase without doing a commit.
+def insert_purchases(admin: Optional[User], data: List[dict]) -> None:
+    """This helper function creates multiple purchases at once without doing a commit. All referenced users,
+    products and ranks are queried only once for the whole batch and the purchases are inserted in bulk. The
+    debt limit of each user is checked against the sum of all purchases of the user in the batch.
+
+    If a single purchase is invalid, none of the purchases get inserted.
 
     :param admin:                Is the administrator user, determined by @adminOptional.
-    :param data:                 Is the purchase data.
+    :param data:                 Is the list of the purchase data.
 
     :return:                     None
     """
@@ -40,60 +47,84 @@ def insert_purchase(admin: Optional[User], data: dict) -> None:
     optional = {"timestamp": str}
 
     # If the request is not made by an administrator, the timestamp can't be set
-    if admin is None and "timestamp" in data:
+    if admin is None and any("timestamp" in item for item in data):
         raise exc.ForbiddenField()
 
-    check_fields_and_types(data, required, optional)
-
-    # Check user
-    user = User.query.filter_by(id=data["user_id"]).first()
-    if not user:
-        raise exc.EntryNotFound()
-
-    # Check if the user has been verified.
-    if not user.is_verified:
-        raise exc.UserIsNotVerified()
-
-    # Check if the user is inactive
-    if not user.active:
-        raise exc.UserIsInactive()
-
-    # Check the user rank. If it is a system user, only administrators are allowed to insert purchases
-    if user.rank.is_system_user and admin is None:
-        raise exc.UnauthorizedAccess()
-
-    # Parse the timestamp
-    data = parse_timestamp(data, required=False)
-
-    # Check product
-    product = Product.query.filter_by(id=data["product_id"]).first()
-    if not product:
-        raise exc.EntryNotFound()
-    if not admin and not product.active:
-        raise exc.EntryIsInactive()
-
-    # Check weather the product is for sale if the request is not made by an administrator
-    if not admin and any(map(lambda tag: not tag.is_for_sale, product.tags)):
-        raise exc.EntryIsNotForSale()
-
-    # Check amount
-    if data["amount"] <= 0:
-        raise exc.InvalidAmount()
-
-    # If the purchase is made by an administrator, the credit limit
-    # may be exceeded.
-    if not admin:
-        limit = Rank.query.filter_by(id=user.rank_id).first().debt_limit
-        current_credit = user.credit
-        future_credit = current_credit - (product.price * data["amount"])
-        if future_credit < limit:
+    for item in data:
+        check_fields_and_types(item, required, optional)
+
+    if not data:
+        return
+
+    # Query all users, ranks and products of the batch at once
+    users = {user.id: user for user in User.query.filter(User.id.in_({item["user_id"] for item in data})).all()}
+    rank_ids = {user.rank_id for user in users.values()}
+    ranks = {rank.id: rank for rank in Rank.query.filter(Rank.id.in_(rank_ids)).all()}
+    products = {
+        product.id: product
+        for product in Product.query.options(selectinload(Product.tags))
+        .filter(Product.id.in_({item["product_id"] for item in data}))
+        .all()
+    }
+
+    # The credit of each user after all purchases of the batch which have been checked so far
+    credits = {user_id: user.credit for user_id, user in users.items()}
+    rows = []
+
+    for item in data:
+        # Check user
+        user = users.get(item["user_id"])
+        if not user:
+            raise exc.EntryNotFound()
+
+        # Check if the user has been verified.
+        if not user.is_verified:
+            raise exc.UserIsNotVerified()
+
+        # Check if the user is inactive
+        if not user.active:
+            raise exc.UserIsInactive()
+
+        # Check the user rank. If it is a system user, only administrators are allowed to insert purchases
+        if user.is_system_user and admin is None:
+            raise exc.UnauthorizedAccess()
+
+        # Parse the timestamp
+        item = parse_timestamp(item, required=False)
+
+        # Check product
+        product = products.get(item["product_id"])
+        if not product:
+            raise exc.EntryNotFound()
+        if not admin and not product.active:
+            raise exc.EntryIsInactive()
+
+        # Check weather the product is for sale if the request is not made by an administrator
+        if not admin and not product.is_for_sale:
+            raise exc.EntryIsNotForSale()
+
+        # Check amount
+        if item["amount"] <= 0:
+            raise exc.InvalidAmount()
+
+        # If the purchase is made by an administrator, the credit limit
+        # may be exceeded.
+        credits[user.id] -= product.price * item["amount"]
+        if not admin and credits[user.id] < ranks[user.rank_id].debt_limit:
             raise exc.InsufficientCredit()
 
-    try:
+        row = dict(item, productprice=product.price)
         if admin:
-            purchase = Purchase(admin_id=admin.id, **data)
-        else:
-            purchase = Purchase(**data)
-        db.session.add(purchase)
+            row["admin_id"] = admin.id
+        rows.append(row)
+
+    try:
+        db.session.bulk_insert_mappings(Purchase, rows)
     except IntegrityError:
         raise exc.CouldNotCreateEntry()
+
+    # Bulk inserts bypass the session, so the user credits and the financial rollups have to be updated explicitly.
+    # Purchases without a timestamp get the current (UTC) time of the database.
+    add_to_user_credits({user_id: credit - users[user_id].credit for user_id, credit in credits.items()})
+    now = datetime.datetime.utcnow()
+    add_to_financial_rollups([(row.get("timestamp", now), row["amount"] * row["productprice"]) for row in rows])
@@ -2,22 +2,100 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
+import base64
+import binascii
 import json
 import re
-from typing import Dict, List, Optional, Tuple
-
-from sqlalchemy import func, types
-from sqlalchemy.sql.expression import BinaryExpression
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, event, func, literal, or_, types
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import defer
+from sqlalchemy.sql.ddl import DDLElement
+from sqlalchemy.sql.expression import BinaryExpression, ColumnElement
+from sqlalchemy.sql.schema import Column
+from sqlalchemy.sql.util import find_tables
 from werkzeug.datastructures import ImmutableMultiDict
 
 import shop_db2.exceptions as exc
-from shop_db2.api import db
+from shop_db2.api import app, db
+from shop_db2.helpers.serializers import STREAM_BATCH_SIZE
+from shop_db2.models.search import get_search_index, search_condition
+from shop_db2.models.table_version import on_modified_tables
 
+# The strategies to determine the total number of items of a paginated list:
+#   - "exact":  The items are counted on every request.
+#   - "cached": The count is cached per table and filters until a transaction which modifies one of the involved
+#               tables is committed. The cache is kept per worker process, so the counts additionally expire after
+#               "QUERY_COUNT_CACHE_TIMEOUT" seconds to pick up the changes of other workers.
+#   - "none":   The items are not counted at all, the total is "*" in the Content-Range header.
+COUNT_EXACT = "exact"
+COUNT_CACHED = "cached"
+COUNT_NONE = "none"
+COUNT_STRATEGIES = [COUNT_EXACT, COUNT_CACHED, COUNT_NONE]
 
-class QueryFromRequestParameters:
-    __valid_fields_and_types__ = {"filter": dict, "pagination": dict, "sort": dict}
+# Cached counts: (count query, parameters) -> (count, time of the count, involved tables)
+_count_cache: Dict[Tuple, Tuple[int, float, FrozenSet[str]]] = {}
+
+
+@event.listens_for(Engine, "before_execute")
+def _clear_counts_on_schema_changes(conn: Any, clauseelement: Any, *_: Any) -> None:
+    """Schema changes invalidate all cached counts immediately."""
+    if isinstance(clauseelement, DDLElement):
+        _count_cache.clear()
+
+
+@on_modified_tables
+def _invalidate_counts(modified: Set[str]) -> None:
+    """Drops all cached counts which involve a table modified by a committed transaction."""
+    # Derived columns are recorded as "table.column"
+    modified = {name.split(".")[0] for name in modified}
+    for key, (_, _, tables) in list(_count_cache.items()):
+        if tables & modified:
+            _count_cache.pop(key, None)
+
+
+def encode_cursor(value: Any, identifier: int) -> str:
+    """Encodes the position of an entry in a sorted list into an opaque cursor.
+
+    :param value:      Is the sorting value of the entry.
+    :param identifier: Is the id of the entry.
+
+    :return:           The cursor as url safe string.
+    """
+    data = json.dumps([value, identifier], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, int]:
+    """Decodes a cursor created with "encode_cursor".
 
-    def __init__(self, model: db.Model, arguments: ImmutableMultiDict, fields: Optional[List[str]] = None) -> None:
+    :param cursor:                  Is the opaque cursor.
+
+    :return:                        The value of the sorting column and the id of the entry.
+
+    :raises InvalidQueryParameters: If the cursor is corrupt.
+    """
+    try:
+        value, identifier = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        assert isinstance(identifier, int) and not isinstance(identifier, bool)
+        assert value is None or isinstance(value, (str, int, float, bool))
+    except (AssertionError, TypeError, ValueError, binascii.Error) as error:
+        raise exc.InvalidQueryParameters() from error
+    return value, identifier
+
+
+class QueryFromRequestParameters:
+    __valid_fields_and_types__ = {"cursor": str, "filter": dict, "pagination": dict, "search": str, "sort": dict}
+
+    def __init__(
+        self,
+        model: db.Model,
+        arguments: ImmutableMultiDict,
+        fields: Optional[List[str]] = None,
+        count_strategy: Optional[str] = None,
+    ) -> None:
         """
         Queries the database model with the given arguments
 
@@ -25,7 +103,13 @@ class QueryFromRequestParameters:
             model: The database model to query.
             arguments: The query arguments.
             fields: The fields to query. Defaults to None.
+            count_strategy: The strategy to count the items of a paginated list (see COUNT_STRATEGIES).
+                Defaults to the configuration value "QUERY_COUNT_STRATEGY".
         """
+        # Strategy to determine the total number of items
+        self._count_strategy = count_strategy or app.config.get("QUERY_COUNT_STRATEGY", COUNT_EXACT)
+        if self._count_strategy not in COUNT_STRATEGIES:
+            raise ValueError(f"Invalid count strategy: {self._count_strategy}")
         # Database table
         self._model: db.Model = model
         # Column mapper for validation and column access
@@ -39,8 +123,34 @@ class QueryFromRequestParameters:
         # Validate request arguments
         self._validate_arguments()
 
+        # Full-text search index of the model (only if the search parameter is given)
+        self._search_index = get_search_index(self._model) if self.search is not None else None
+
         # Prepare base query
         self._query = db.session.query(self._model)
+        if fields:
+            deferred = self._deferred_column_properties(fields)
+            if deferred:
+                self._query = self._query.options(*[defer(key) for key in deferred])
+
+    def _deferred_column_properties(self, fields: List[str]) -> List[str]:
+        """Determines all column properties of the model which are calculated with an SQL expression
+        (e.g. a correlated subquery) and are not part of the requested fields. These are not loaded, as
+        they are not returned anyway. Filters and sorting are applied in SQL and don't require the loaded
+        values. The plain table columns are always loaded, as they don't cost anything extra.
+
+        :param fields: Are the fields which are returned by the route.
+
+        :return:       The keys of all column properties to be deferred.
+        """
+        deferred = []
+        for prop in self._model.__mapper__.column_attrs:
+            expression = prop.columns[0]
+            if isinstance(expression, Column) and expression.table is self._model.__table__:
+                continue
+            if prop.key not in fields:
+                deferred.append(prop.key)
+        return deferred
 
     def _parse_arguments(self) -> None:
         """This function parses the input ImmutableMultiDict into a vanilla python dictionary.
@@ -62,6 +172,11 @@ class QueryFromRequestParameters:
             if not argument_key in self.__valid_fields_and_types__:
                 raise exc.InvalidQueryParameters()
 
+            # The cursor is an opaque string and the search is a plain text, both must not be modified
+            if argument_key in ["cursor", "search"]:
+                parsed_arguments[argument_key] = argument_value
+                continue
+
             # Clean possible non-JSON conforming quoting
             try:
                 argument_value = argument_value.strip("'<>() ").replace("'", '"')
@@ -157,6 +272,20 @@ class QueryFromRequestParameters:
                 assert re.fullmatch(regex_sanitize_pattern, self.sorting.get("field", ""))
                 assert re.fullmatch(regex_sanitize_pattern, self.sorting.get("order", ""))
 
+            # Validate the search
+            if self.search is not None:
+                # The model must be searchable and the search text must contain at least one word
+                assert get_search_index(self._model) is not None
+                assert search_condition(get_search_index(self._model), self.search) is not None
+
+            # Validate the cursor
+            if self.cursor is not None:
+                # The page size is taken from the pagination, so it must be given as well
+                assert self.pagination is not None
+                # An empty cursor requests the first page, all other cursors must be valid
+                if self.cursor:
+                    decode_cursor(self.cursor)
+
         except AssertionError as error:
             raise exc.InvalidQueryParameters() from error
 
@@ -170,6 +299,16 @@ class QueryFromRequestParameters:
         self._query = self._query.filter(expression)
         return self
 
+    def options(self, *options: Any) -> "QueryFromRequestParameters":
+        """This method applies sqlalchemy loader options (e.g. selectinload) to the base query
+
+        :param options: Are the loader options which are to be applied to the base query.
+
+        :return:        The QueryFromRequestParameters with the loader options
+        """
+        self._query = self._query.options(*options)
+        return self
+
     @property
     def pagination(self) -> Optional[dict]:
         """:return: The pagination parameters if they exist"""
@@ -185,10 +324,122 @@ class QueryFromRequestParameters:
         """:return: The sorting parameters if they exist"""
         return self._arguments.get("sort", None)
 
-    def result(self) -> Tuple:
+    @property
+    def search(self) -> Optional[str]:
+        """:return: The search text if it exists"""
+        return self._arguments.get("search", None)
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """:return: The cursor if it exists"""
+        return self._arguments.get("cursor", None)
+
+    def _sort_column(self) -> Tuple[Any, ColumnElement]:
+        """:return: The column to be sorted by and the expression which is used for sorting."""
+        # Only perform the lowercase operation if the column type is not "types.Integer"
+        # If the column to be sorted by is of the type "types.integer", the lowercase function
+        # must not be used, otherwise integers are sorted by the scheme
+        # "1, 10, 11, 12, ..., 2, 21, 22, ... 3..."
+        column = self._column_mapper[self.sorting.get("field")]
+        if not isinstance(column.type, types.Integer):
+            return column, func.lower(column)
+        return column, column
+
+    def _keyset_page(self, per_page: int) -> Tuple[List, Optional[str]]:
+        """Queries the page which follows the cursor. Instead of skipping all previous entries with an offset,
+        the query continues directly after the last entry of the previous page, using the sorting value and the
+        id of this entry. Therefore, every page is as fast as the first one and no count is required.
+
+        The sorting value is stored in the cursor exactly as it is returned by the database, so that it can be
+        compared without any conversion. SQLite sorts NULL values before all other values, this is taken into
+        account for nullable sort columns.
+
+        :param per_page: Is the number of entries per page.
+
+        :return:         The entries of the page and the cursor of the next page, if there is one.
+        """
+        identifier_column = self._model.__mapper__.primary_key[0]
+        if self.sorting is not None:
+            column, expression = self._sort_column()
+            descending = self.sorting.get("order", "").lower() == "desc"
+        else:
+            column, expression = None, None
+            descending = False
+
+        if self.cursor:
+            value, identifier = decode_cursor(self.cursor)
+            after_identifier = identifier_column < identifier if descending else identifier_column > identifier
+            if column is None:
+                condition = after_identifier
+            elif value is None:
+                same_value = and_(column.is_(None), after_identifier)
+                condition = same_value if descending else or_(same_value, column.isnot(None))
+            else:
+                key = literal(value)
+                after_value = expression < key if descending else expression > key
+                condition = or_(after_value, and_(expression == key, after_identifier))
+                if descending and getattr(column, "nullable", True):
+                    condition = or_(condition, column.is_(None))
+            self._query = self._query.filter(condition)
+
+        order = [expression, identifier_column] if expression is not None else [identifier_column]
+        self._query = self._query.order_by(*[o.desc() if descending else o.asc() for o in order])
+        if expression is not None:
+            self._query = self._query.add_columns(expression.label("cursor_value"))
+
+        # Query one more entry than requested to know whether there is a next page
+        rows = self._query.limit(per_page + 1).all()
+        data = [row[0] for row in rows] if expression is not None else rows
+        if len(data) <= per_page:
+            return data, None
+
+        last = data[per_page - 1]
+        value = rows[per_page - 1].cursor_value if expression is not None else None
+        return data[:per_page], encode_cursor(value, getattr(last, identifier_column.key))
+
+    def _count(self) -> Optional[int]:
+        """Counts all items which match the filters according to the count strategy. Only the primary keys are
+        counted, so that the correlated subqueries of column properties are not executed.
+
+        :return: The number of items or None if they are not counted.
+        """
+        if self._count_strategy == COUNT_NONE:
+            return None
+
+        identifier_column = self._model.__mapper__.primary_key[0]
+        query = db.session.query(func.count(identifier_column)).select_from(self._model)
+        if self._search_index is not None:
+            query = query.join(self._search_index, self._search_index.c.rowid == identifier_column)
+        whereclause = self._query.whereclause
+        if whereclause is not None:
+            query = query.filter(whereclause)
+
+        if self._count_strategy == COUNT_EXACT:
+            return query.scalar()
+
+        compiled = query.statement.compile()
+        key = (str(compiled), tuple(sorted(compiled.params.items())))
+        timeout = app.config.get("QUERY_COUNT_CACHE_TIMEOUT", 60)
+        cached = _count_cache.get(key)
+        if cached is not None and time.time() - cached[1] < timeout:
+            return cached[0]
+
+        tables = {self._model.__table__.name}
+        if whereclause is not None:
+            tables.update(table.name for table in find_tables(whereclause) if hasattr(table, "name"))
+        count = query.scalar()
+        _count_cache[key] = (count, time.time(), frozenset(tables))
+        return count
+
+    def result(self, stream: bool = False) -> Tuple:
         """Applies all filters to the query and returns the result
 
-        :return: The queried data and the content-range header entry.
+        :param stream: If set and the list is not paginated, the items are not loaded at once. Instead, the query
+                       is returned, which loads the items in batches of STREAM_BATCH_SIZE while it is iterated.
+                       The items are counted in advance to determine the content-range.
+
+        :return:       The queried data and the header entries of the response. For cursor based pagination, the
+                       headers contain the cursor of the next page (if it exists), otherwise the content-range.
         """
         # Apply all filters
         if self.filters is not None:
@@ -203,35 +454,54 @@ class QueryFromRequestParameters:
                 else:
                     self._query = self._query.filter(self._column_mapper[filter_field].in_(tuple(filter_value)))
 
+        # Apply the full-text search. Only the entries found in the search index are joined.
+        if self._search_index is not None:
+            identifier_column = self._model.__mapper__.primary_key[0]
+            self._query = self._query.join(self._search_index, self._search_index.c.rowid == identifier_column)
+            self._query = self._query.filter(search_condition(self._search_index, self.search))
+
+        # Apply the cursor based pagination if it exists
+        if self.cursor is not None:
+            data, next_cursor = self._keyset_page(self.pagination["perPage"])
+            return data, {"Next-Cursor": next_cursor} if next_cursor is not None else {}
+
         # Apply sorting
         if self.sorting is not None:
-            # Only perform the lowercase operation if the column type is not "types.Integer"
-            # If the column to be sorted by is of the type "types.integer", the lowercase function
-            # must not be used, otherwise integers are sorted by the scheme
-            # "1, 10, 11, 12, ..., 2, 21, 22, ... 3..."
-            column = self._column_mapper[self.sorting.get("field")]
-            if not isinstance(column.type, types.Integer):
-                column = func.lower(column)
+            _, column = self._sort_column()
 
             if self.sorting.get("order", "").lower() == "asc":
                 self._query = self._query.order_by(column.asc())
             else:
                 self._query = self._query.order_by(column.desc())
 
+        # Without explicit sorting, the search results are ordered by their relevance
+        elif self._search_index is not None:
+            self._query = self._query.order_by(self._search_index.c.rank)
+
         # Apply the pagination if it exists
         if self.pagination is not None:
             page = self.pagination["page"]
             per_page = self.pagination["perPage"]
-            self._query = self._query.paginate(page=page, per_page=per_page, error_out=False)
-            data = self._query.items
             range_start = (page - 1) * per_page
             range_end = page * per_page - 1
-            total_items = self._query.total
+            data = self._query.limit(per_page).offset(range_start).all()
+            # A partially filled page is the last one, so the total is known without counting
+            if 0 < len(data) < per_page or (page == 1 and not data):
+                total_items = range_start + len(data)
+            else:
+                total_items = self._count()
+
+        # Stream the query. The items are counted up front, because the headers are sent before the items.
+        elif stream:
+            data = self._query.yield_per(STREAM_BATCH_SIZE)
+            total_items = self._count()
+            range_start = 0
+            range_end = "*" if total_items is None else total_items
 
-        # Perform a standard query
+        # Perform a standard query. All items are loaded, so they don't have to be counted.
         else:
             data = self._query.all()
-            total_items = self._query.count()
+            total_items = len(data)
             range_start = 0
             range_end = total_items
 
@@ -239,6 +509,8 @@ class QueryFromRequestParameters:
         # The value must be the total number of resources in the collection.
         # This allows the client interface to know how many pages of resources there are in total,
         # and build the pagination controls.
-        content_range = f"{self._model.__table__.name}: {range_start}-{range_end}/{total_items}"
+        # If the items are not counted, the total is unknown ("*").
+        total = "*" if total_items is None else total_items
+        content_range = f"{self._model.__table__.name}: {range_start}-{range_end}/{total}"
 
-        return data, content_range
+        return data, {"Content-Range": content_range}
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import datetime
+import re
+from itertools import islice
+from operator import attrgetter, itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from flask import Response, current_app, jsonify, stream_with_context
+from flask.json import JSONEncoder as FlaskJSONEncoder
+from flask.json import dumps
+from sqlalchemy import inspect
+from sqlalchemy.orm import Mapper
+
+# orjson is a dependency of shop-db2. The flask JSON encoder is only used if it can't be installed on a platform.
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# The number of items which are loaded and serialized at once while a list is streamed
+STREAM_BATCH_SIZE = 1000
+
+# Compiled serializers: (class of the items, fields) -> function which converts an item into a dictionary
+_serializers: Dict[Tuple[type, Tuple[str, ...]], Callable[[Any], Dict[str, Any]]] = {}
+
+# All characters which are escaped by the standard JSON encoder if "ensure_ascii" is set
+_NON_ASCII = re.compile(r"[^\x00-\x7e]")
+
+# Names of the weekdays and months in the HTTP date format
+_WEEKDAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+def _has_attribute(cls: type, field: str) -> bool:
+    """Checks whether the class defines the attribute. The attribute is not accessed, because hybrid properties
+    would evaluate their class level expression.
+    """
+    return any(field in vars(klass) for klass in cls.__mro__)
+
+
+def _tuple_getter(factory: Callable, keys: Sequence[Any]) -> Callable[[Any], Tuple]:
+    """Returns an attribute or item getter which always returns a tuple, regardless of the number of keys."""
+    if not keys:
+        return lambda _: ()
+    if len(keys) == 1:
+        getter = factory(keys[0])
+        return lambda obj: (getter(obj),)
+    return factory(*keys)
+
+
+def _compile(cls: type, fields: Tuple[str, ...]) -> Callable[[Any], Dict[str, Any]]:
+    """Compiles the serializer for the class and the fields.
+
+    The loaded column values of an ORM entity are read directly from its state dictionary, which is much faster
+    than the instrumented attributes. Only if one of them is not loaded (e.g. deferred or expired), the attributes
+    are accessed. All other fields (e.g. hybrid properties) are read as attributes.
+    """
+    if not all(_has_attribute(cls, field) for field in fields):
+        return lambda item: {field: getattr(item, field, None) for field in fields}
+
+    mapper = inspect(cls, raiseerr=False)
+    column_keys = set(mapper.column_attrs.keys()) if isinstance(mapper, Mapper) else set()
+    columns = tuple(field for field in fields if field in column_keys)
+    others = tuple(field for field in fields if field not in column_keys)
+    read_loaded_columns = _tuple_getter(itemgetter, columns)
+    read_columns = _tuple_getter(attrgetter, columns)
+    read_others = _tuple_getter(attrgetter, others)
+    # Restores the order of the fields from the concatenation of the columns and all other fields
+    order = columns + others
+    reorder = _tuple_getter(itemgetter, [order.index(field) for field in fields])
+
+    if not columns:
+        return lambda item: dict(zip(fields, read_others(item)))
+
+    def serializer(item: Any) -> Dict[str, Any]:
+        try:
+            values = read_loaded_columns(item.__dict__)
+        except KeyError:
+            values = read_columns(item)
+        return dict(zip(fields, reorder(values + read_others(item))))
+
+    return serializer
+
+
+def get_serializer(cls: type, fields: Sequence[str]) -> Callable[[Any], Dict[str, Any]]:
+    """Returns the serializer which converts an item of the class into a dictionary with the given fields. The
+    serializer is compiled once per class and fields and works for ORM entities as well as for projected rows.
+    Fields which are not defined by the class are set to None.
+
+    :param cls:    Is the class of the items, e.g. the database model.
+    :param fields: Are the fields of the dictionary.
+
+    :return:       The serializer.
+    """
+    key = (cls, tuple(fields))
+    serializer = _serializers.get(key)
+    if serializer is None:
+        serializer = _serializers[key] = _compile(cls, key[1])
+    return serializer
+
+
+def serialize(data: Any, fields: Sequence[str]) -> List[Dict[str, Any]]:
+    """Converts all items into dictionaries with the given fields.
+
+    :param data:   Is a single item or a list of items.
+    :param fields: Are the fields of the dictionaries.
+
+    :return:       A list with the dictionaries of all items.
+    """
+    if not isinstance(data, list):
+        data = [data]
+
+    out = []
+    cls, serializer = None, None
+    for item in data:
+        if type(item) is not cls:
+            cls = type(item)
+            serializer = get_serializer(cls, fields)
+        out.append(serializer(item))
+    return out
+
+
+def _stream_json_list(items: Iterable, fields: Sequence[str], batch_size: int) -> Iterator[str]:
+    """Yields the JSON array of all serialized items in chunks of "batch_size" items. The concatenated chunks are
+    identical to the compact output of "jsonify".
+    """
+    iterator = iter(items)
+    yield "["
+    separator = ""
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            break
+        # Remove the brackets of the encoded batch to join it with the other batches
+        yield separator + dumps(serialize(batch, fields), separators=(",", ":"))[1:-1]
+        separator = ","
+    yield "]\n"
+
+
+def json_list_response(data: Iterable, fields: Sequence[str], batch_size: int = STREAM_BATCH_SIZE) -> Response:
+    """Creates the JSON response with the serialized items. A list of items is converted at once, all other
+    iterables (e.g. a streamed query) are serialized and sent in batches, so that the memory usage does not depend
+    on the number of items. Pretty printed responses are never streamed.
+
+    :param data:       Are the items of the response.
+    :param fields:     Are the fields of the items.
+    :param batch_size: Is the number of items which are serialized at once while streaming.
+
+    :return:           The response.
+    """
+    if isinstance(data, list) or current_app.config["JSONIFY_PRETTYPRINT_REGULAR"] or current_app.debug:
+        return jsonify(serialize(list(data), fields))
+
+    return current_app.response_class(
+        stream_with_context(_stream_json_list(data, fields, batch_size)),
+        mimetype=current_app.config["JSONIFY_MIMETYPE"],
+    )
+
+
+def _escape_character(match: "re.Match") -> str:
+    """Escapes a non-ASCII character exactly like the standard JSON encoder."""
+    code = ord(match.group(0))
+    if code < 0x10000:
+        return "\\u{0:04x}".format(code)
+    code -= 0x10000
+    return "\\u{0:04x}\\u{1:04x}".format(0xD800 | ((code >> 10) & 0x3FF), 0xDC00 | (code & 0x3FF))
+
+
+def _http_date(value: datetime.date) -> str:
+    """Formats a date or a datetime exactly like "werkzeug.http.http_date", but without the detour via a time
+    tuple. Timezone aware datetimes are converted to UTC, naive ones are expected to be in UTC already.
+    """
+    if isinstance(value, datetime.datetime):
+        offset = value.utcoffset()
+        if offset:
+            value = value - offset
+        hour, minute, second = value.hour, value.minute, value.second
+    else:
+        hour, minute, second = 0, 0, 0
+    return "%s, %02d %s %s %02d:%02d:%02d GMT" % (
+        _WEEKDAYS[value.weekday()],
+        value.day,
+        _MONTHS[value.month - 1],
+        value.year,
+        hour,
+        minute,
+        second,
+    )
+
+
+class JSONEncoder(FlaskJSONEncoder):
+    """A JSON encoder which serializes the compact responses of the API with orjson, if it is installed. The
+    output is identical to the one of the flask encoder: Dates and datetimes are converted to the HTTP date
+    format, the keys are sorted according to "JSON_SORT_KEYS" and non-ASCII characters are escaped according to
+    "JSON_AS_ASCII". Output which is not compact (e.g. pretty printed) and all data which orjson cannot serialize
+    exactly like the standard encoder (e.g. dictionaries with non-string keys) are handled by the flask encoder.
+    """
+
+    def default(self, o: Any) -> Any:
+        if isinstance(o, datetime.date):
+            return _http_date(o)
+        return super().default(o)
+
+    def encode(self, o: Any) -> str:
+        compact = self.indent is None and self.item_separator == "," and self.key_separator == ":"
+        if orjson is None or not compact:
+            return super().encode(o)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            result = orjson.dumps(o, default=self.default, option=option).decode()
+        except (orjson.JSONEncodeError, TypeError):
+            return super().encode(o)
+
+        if self.ensure_ascii and (not result.isascii() or "\x7f" in result):
+            result = _NON_ASCII.sub(_escape_character, result)
+        return result
@@ -5,7 +5,7 @@ from typing import Dict, Optional
 from sqlalchemy import and_, func
 
 from shop_db2.api import db
-from shop_db2.helpers.products import _get_product_mean_price_in_time_range
+from shop_db2.helpers.products import _get_product_mean_prices_in_time_range
 from shop_db2.models import (
     Product,
     Purchase,
@@ -22,84 +22,66 @@ def _get_balance_between_stocktakings(start: StocktakingCollection, end: Stockta
         return None
 
     # Get a list of all product ids.
-    products = Product.query.filter(Product.countable.is_(True)).all()
-    product_ids = [p.id for p in products]
-
-    start_product_ids = [s.product_id for s in start.stocktakings]
-    end_product_ids = [s.product_id for s in end.stocktakings]
-
-    out = {"profit": 0, "loss": 0, "balance": 0, "products": {}}
-
-    for _id in product_ids:
-        # Case 1: The product is active for the entire period of time.
-        if _id in start_product_ids and _id in end_product_ids:
-            s = next(s for s in start.stocktakings if s.product_id == _id).count
-            e = next(s for s in end.stocktakings if s.product_id == _id).count
-        # Case 2: The product has been set to inactive since the first
-        # stocktaking.
-        elif _id in start_product_ids and _id not in end_product_ids:
-            s = next(s for s in start.stocktakings if s.product_id == _id).count
-            e = 0
-        # Case 3: The product did not exist during the first stocktaking.
-        elif _id not in start_product_ids and _id in end_product_ids:
-            s = 0
-            e = next(s for s in end.stocktakings if s.product_id == _id).count
-        # Case 4: The product has not been recorded in either stocktaking.
-        else:
-            s = 0
-            e = 0
-
-        # Determine how often the product was purchased in the period and at
-        # what price.
-        res = (
-            db.session.query(func.sum(Purchase.amount), func.sum(Purchase.price))
-            .filter(Purchase.product_id == _id)
-            .filter(Purchase.revoked.is_(False))
-            .filter(
-                and_(
-                    Purchase.timestamp < end.timestamp,
-                    Purchase.timestamp >= start.timestamp,
-                )
+    product_ids = [row.id for row in db.session.query(Product.id).filter(Product.countable.is_(True))]
+
+    # Get the counts of both stocktakings. If a product has not been recorded in a stocktaking (because it was
+    # inactive or did not exist yet), its count is zero.
+    start_counts = {s.product_id: s.count for s in start.stocktakings}
+    end_counts = {s.product_id: s.count for s in end.stocktakings}
+
+    # Determine how often each product was purchased in the period and at
+    # what price.
+    purchases = {
+        row[0]: row[1:]
+        for row in db.session.query(Purchase.product_id, func.sum(Purchase.amount), func.sum(Purchase.price))
+        .filter(Purchase.revoked.is_(False))
+        .filter(
+            and_(
+                Purchase.timestamp < end.timestamp,
+                Purchase.timestamp >= start.timestamp,
             )
-            .first()
         )
-
-        purchase_count = res[0] or 0
-        purchase_sum_price = res[1] or 0
-
-        # Determine how often the product was refilled in the time span and
-        # how much was spent on it.
-        res = (
-            db.session.query(func.sum(Replenishment.amount), func.sum(Replenishment.total_price))
-            .join(
-                ReplenishmentCollection,
-                ReplenishmentCollection.id == Replenishment.replcoll_id,
-            )
-            .filter(Replenishment.product_id == _id)
-            .filter(Replenishment.revoked.is_(False))
-            .filter(ReplenishmentCollection.revoked.is_(False))
-            .filter(
-                and_(
-                    ReplenishmentCollection.timestamp < end.timestamp,
-                    ReplenishmentCollection.timestamp >= start.timestamp,
-                )
+        .group_by(Purchase.product_id)
+    }
+
+    # Determine how often each product was refilled in the time span and
+    # how much was spent on it.
+    replenishments = {
+        row[0]: row[1:]
+        for row in db.session.query(
+            Replenishment.product_id, func.sum(Replenishment.amount), func.sum(Replenishment.total_price)
+        )
+        .join(
+            ReplenishmentCollection,
+            ReplenishmentCollection.id == Replenishment.replcoll_id,
+        )
+        .filter(Replenishment.revoked.is_(False))
+        .filter(ReplenishmentCollection.revoked.is_(False))
+        .filter(
+            and_(
+                ReplenishmentCollection.timestamp < end.timestamp,
+                ReplenishmentCollection.timestamp >= start.timestamp,
             )
-            .first()
         )
+        .group_by(Replenishment.product_id)
+    }
 
-        # Determine how often this product has been replenished during
-        # this period.
-        replenish_count = res[0] or 0
-        replenish_sum_price = res[1] or 0
+    # Get the mean prices of all products.
+    mean_prices = _get_product_mean_prices_in_time_range(product_ids, start.timestamp, end.timestamp)
 
-        # Get the mean product price.
-        mean_price = _get_product_mean_price_in_time_range(_id, start.timestamp, end.timestamp)
+    out = {"profit": 0, "loss": 0, "balance": 0, "products": {}}
+
+    for _id in product_ids:
+        s = start_counts.get(_id, 0)
+        e = end_counts.get(_id, 0)
+        purchase_count, purchase_sum_price = purchases.get(_id, (0, 0))
+        replenish_count, replenish_sum_price = replenishments.get(_id, (0, 0))
 
         # Determine the number of products not purchased.
         difference = -(s - purchase_count + replenish_count - e)
 
         # Determine the balance
-        balance = difference * mean_price
+        balance = difference * mean_prices[_id]
 
         # Increase the overall balance
         out["balance"] += balance
@@ -4,19 +4,154 @@ __author__ = "g3n35i5"
 
 import base64
 import binascii
+import hashlib
 import os
 import random
 import shutil
 import tempfile
+from typing import Any, BinaryIO, List, Optional, Tuple
 
 from PIL import Image
 
 import shop_db2.exceptions as exc
+from shop_db2.api import app, db
 
 import configuration as config  # isort: skip
 
 
+# Uploaded images are stored under the hash of their content, so a file name never refers to another image and
+# can be cached forever by the clients. For each image, smaller variants with the edge lengths "THUMBNAIL_SIZES"
+# are stored in "<UPLOAD_FOLDER>/thumbnails/<size>/" under the same name. Images which are not larger than a
+# thumbnail size don't get a variant of this size.
+DEFAULT_IMAGE = "default.png"
+THUMBNAIL_FOLDER = "thumbnails"
+
+# Uploads are decoded into a temporary file and hashed in chunks of this many base64 characters (or bytes), so that
+# an upload is never held in memory as a whole more than once (as part of the request).
+_DECODE_CHUNK_SIZE = 64 * 1024
+
+
+def _name_stem(content_hash: Any) -> str:
+    """Returns the name (without extension) of an image with the given content hash."""
+    return content_hash.hexdigest()[:32]
+
+
+def thumbnail_sizes() -> List[int]:
+    """Returns all thumbnail sizes in ascending order."""
+    return sorted(app.config.get("THUMBNAIL_SIZES", [64, 128, 256]))
+
+
+def thumbnail_folder(size: int) -> str:
+    """Returns the folder which contains the thumbnails with the given size."""
+    return os.path.join(app.config["UPLOAD_FOLDER"], THUMBNAIL_FOLDER, str(size))
+
+
+def get_thumbnail_size(size: int) -> Optional[int]:
+    """Returns the smallest thumbnail size which is at least as large as the requested size.
+
+    :param size: Is the requested edge length of an image.
+
+    :return:     The thumbnail size or None, if the requested size is larger than all thumbnails.
+    """
+    return next((thumbnail for thumbnail in thumbnail_sizes() if thumbnail >= size), None)
+
+
+def missing_thumbnails(image: Image.Image, filename: str) -> List[int]:
+    """Returns the sizes of all thumbnails of an image which have not been created yet.
+
+    :param image:    Is the (quadratic) image.
+    :param filename: Is the file name of the image.
+
+    :return:         The list of missing thumbnail sizes.
+    """
+    return [
+        size
+        for size in thumbnail_sizes()
+        if size < image.width and not os.path.isfile(os.path.join(thumbnail_folder(size), filename))
+    ]
+
+
+def create_thumbnails(image: Image.Image, filename: str) -> int:
+    """Creates all missing thumbnails of an image. Each thumbnail is written to a temporary file first and then
+    renamed, so that an incomplete thumbnail is never delivered.
+
+    :param image:    Is the (quadratic) image.
+    :param filename: Is the file name of the image.
+
+    :return:         The number of created thumbnails.
+    """
+    sizes = missing_thumbnails(image, filename)
+    image_format = image.format
+    if sizes and image.mode not in ["RGB", "RGBA"]:
+        image = image.convert("RGBA")
+    for size in sizes:
+        os.makedirs(thumbnail_folder(size), exist_ok=True)
+        handle, temporary_path = tempfile.mkstemp(dir=thumbnail_folder(size), suffix=".tmp")
+        os.close(handle)
+        image.resize((size, size), Image.LANCZOS).save(temporary_path, format=image_format, optimize=True)
+        os.replace(temporary_path, os.path.join(thumbnail_folder(size), filename))
+    return len(sizes)
+
+
+def _decode_base64_to_file(value: str, file: BinaryIO) -> str:
+    """Decodes the base64 encoded image data chunk by chunk into the file, so that the decoded image is never held
+    in memory as a whole. A leading data URL prefix (e.g. "data:image/png;base64,") and whitespace are skipped.
+
+    :param value:           Is the base64 encoded image data.
+    :param file:            Is the file the decoded data is written to.
+
+    :return:                The hash based name stem of the decoded data (see "_name_stem").
+
+    :raises binascii.Error: If the data is not valid base64.
+    """
+    start = 0
+    if value.startswith("data:"):
+        start = value.find(",", 0, 256) + 1
+        if start == 0:
+            raise binascii.Error("Invalid data URL")
+
+    content_hash = hashlib.sha256()
+    pending = ""
+    for offset in range(start, len(value), _DECODE_CHUNK_SIZE):
+        chunk = pending + "".join(value[offset : offset + _DECODE_CHUNK_SIZE].split())
+        usable = len(chunk) - len(chunk) % 4
+        data = base64.b64decode(chunk[:usable], validate=True)
+        content_hash.update(data)
+        file.write(data)
+        pending = chunk[usable:]
+    if pending:
+        raise binascii.Error("Incorrect padding")
+    return _name_stem(content_hash)
+
+
+def _file_hash(path: str) -> str:
+    """Returns the hash based name stem of a file (see "_name_stem"), which is read chunk by chunk."""
+    content_hash = hashlib.sha256()
+    with open(path, "rb") as file:
+        for data in iter(lambda: file.read(_DECODE_CHUNK_SIZE), b""):
+            content_hash.update(data)
+    return _name_stem(content_hash)
+
+
 def insert_image(file: dict) -> str:
+    """Validates an uploaded image and stores it (and its thumbnails) in the upload folder.
+
+    The image is decoded into a temporary file in chunks. Its type and dimensions are checked with the header
+    only, before any pixel data is decoded, so that images with too many pixels (e.g. decompression bombs) are
+    rejected early. The temporary file is removed in any case.
+
+    :param file:                  Is the uploaded file with its "filename" and base64 encoded "value".
+
+    :return:                      The name of the stored image.
+
+    :raises NoFileIncluded:       If there is no file or no image data.
+    :raises InvalidFilename:      If the file name is invalid.
+    :raises InvalidFileType:      If the file (extension) is not a valid image type.
+    :raises FileTooLarge:         If the file is larger than "MAX_CONTENT_LENGTH".
+    :raises BrokenImage:          If the image can't be decoded.
+    :raises ImageTooLarge:        If the image has more than "MAX_IMAGE_PIXELS" pixels.
+    :raises ImageMustBeQuadratic: If the image is not quadratic.
+    """
     if not file:
         raise exc.NoFileIncluded()
 
@@ -45,30 +180,126 @@ def insert_image(file: dict) -> str:
     if len(file["value"]) > config.BaseConfig.MAX_CONTENT_LENGTH:
         raise exc.FileTooLarge()
 
-    # Check if the image is a valid image file.
+    # The temporary file is created in the upload folder, so it can be renamed to its destination.
+    handle, temporary_path = tempfile.mkstemp(dir=app.config["UPLOAD_FOLDER"], suffix=".tmp")
     try:
-        # Save the image to a temporary file.
-        temporary_file = tempfile.NamedTemporaryFile(delete=False, suffix=f".{extension}")
-        base64_data = file["value"].replace("data:image/png;base64,", "")
-        temporary_file.write(base64.b64decode(base64_data))
-        temporary_file.close()
-        image = Image.open(temporary_file.name)
+        # Check if the image is a valid image file. Only the header is read.
+        try:
+            with os.fdopen(handle, "wb") as temporary_file:
+                name = _decode_base64_to_file(file["value"], temporary_file)
+            image = Image.open(temporary_path)
+        # An invalid file will lead to an exception.
+        except (IOError, SyntaxError, binascii.Error) as error:
+            raise exc.BrokenImage() from error
+        except Image.DecompressionBombError as error:
+            raise exc.ImageTooLarge() from error
 
-    # An invalid file will lead to an exception.
-    except (IOError, binascii.Error) as error:
-        raise exc.BrokenImage() from error
+        with image:
+            _check_image_header(image)
+            # Decode the image. Broken pixel data leads to an exception.
+            try:
+                image.load()
+            except (IOError, SyntaxError) as error:
+                raise exc.BrokenImage() from error
+            return _store_image(image, temporary_path, name, extension)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
 
+
+def _check_image_header(image: Image.Image) -> None:
+    """Checks the type and the dimensions of an image, which are read from its header.
+
+    :param image:                 Is the opened (but not yet decoded) image.
+
+    :raises InvalidFileType:      If the image is not of a valid type.
+    :raises ImageTooLarge:        If the image has more than "MAX_IMAGE_PIXELS" pixels.
+    :raises ImageMustBeQuadratic: If the image is not quadratic.
+    """
     # Check the real extension again
     if image.format not in [x.upper() for x in config.BaseConfig.VALID_EXTENSIONS]:
         raise exc.InvalidFileType()
 
-    # Check aspect ratio
+    # Check the number of pixels, so that decompression bombs are never decoded
     width, height = image.size
+    if width * height > app.config.get("MAX_IMAGE_PIXELS", 4096 * 4096):
+        raise exc.ImageTooLarge()
+
+    # Check aspect ratio
     if width != height:
         raise exc.ImageMustBeQuadratic()
 
-    # Move the temporary image to its destination path.
-    destination_filename = os.path.basename(temporary_file.name)
-    destination_path = os.path.join(config.BaseConfig.UPLOAD_FOLDER, destination_filename)
-    shutil.move(temporary_file.name, destination_path)
+
+def _store_image(image: Image.Image, temporary_path: str, name: str, extension: str) -> str:
+    """Downscales the decoded image if it is larger than "MAX_IMAGE_SIZE" and stores it and its thumbnails under
+    the hash of its content. If the same image has been uploaded before, the existing file is used.
+
+    :param image:          Is the decoded image.
+    :param temporary_path: Is the path of the temporary file which contains the image.
+    :param name:           Is the hash based name stem of the temporary file.
+    :param extension:      Is the file extension of the image.
+
+    :return:               The name of the stored image.
+    """
+    max_size = app.config.get("MAX_IMAGE_SIZE")
+    if max_size is not None and image.width > max_size:
+        image_format = image.format
+        if image.mode not in ["RGB", "RGBA"]:
+            image = image.convert("RGBA")
+        image = image.resize((max_size, max_size), Image.LANCZOS)
+        image.save(temporary_path, format=image_format, optimize=True)
+        image.format = image_format
+        name = _file_hash(temporary_path)
+
+    destination_filename = f"{name}.{extension}"
+    create_thumbnails(image, destination_filename)
+    destination_path = os.path.join(app.config["UPLOAD_FOLDER"], destination_filename)
+    if not os.path.isfile(destination_path):
+        os.replace(temporary_path, destination_path)
     return destination_filename
+
+
+def backfill_images(rebuild: bool = True) -> Tuple[int, int]:
+    """Stores all images which have been uploaded before the introduction of content hashed file names under the
+    hash of their content and creates all missing thumbnails, including those of the default image. If the same
+    image has been uploaded several times, only the first upload is renamed.
+
+    The files are copied to their new names and the old files are only removed after the new names have been
+    committed, so the uploads always refer to an existing file.
+
+    :param rebuild: If not set, the images are only checked and nothing is changed.
+
+    :return:        The number of (to be) renamed uploads and the number of (to be) created thumbnails.
+    """
+    from shop_db2.models import Upload
+
+    folder = app.config["UPLOAD_FOLDER"]
+    filenames = {filename for filename, in db.session.query(Upload.filename)}
+    replaced: List[str] = []
+    thumbnails = 0
+    for upload in Upload.query.order_by(Upload.id).all():
+        path = os.path.join(folder, upload.filename)
+        if not os.path.isfile(path):
+            continue
+        filename = f"{_file_hash(path)}{os.path.splitext(upload.filename)[1].lower()}"
+        if filename in filenames:
+            filename = upload.filename
+        else:
+            filenames.add(filename)
+            replaced.append(path)
+            if rebuild:
+                shutil.copyfile(path, os.path.join(folder, filename))
+                upload.filename = filename
+        with Image.open(path) as image:
+            thumbnails += create_thumbnails(image, filename) if rebuild else len(missing_thumbnails(image, filename))
+
+    with Image.open(os.path.join(folder, DEFAULT_IMAGE)) as image:
+        thumbnails += (
+            create_thumbnails(image, DEFAULT_IMAGE) if rebuild else len(missing_thumbnails(image, DEFAULT_IMAGE))
+        )
+
+    if rebuild:
+        db.session.commit()
+        for path in replaced:
+            os.remove(path)
+    return len(replaced), thumbnails
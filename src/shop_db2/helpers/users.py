@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
-from typing import Any, Dict
+from typing import Any, Dict, List
 
 from sqlalchemy.exc import IntegrityError
 
@@ -10,6 +10,19 @@ import shop_db2.exceptions as exc
 from shop_db2.api import app, bcrypt, db
 from shop_db2.helpers.validators import check_fields_and_types
 from shop_db2.models import User
+from shop_db2.models.user_credit import credit_expression
+
+
+def hash_password(password: str) -> bytes:
+    """Returns the salted bcrypt hash of the password. The work factor is
+    taken from the "BCRYPT_LOG_ROUNDS" setting of the application, so it can
+    be adjusted without affecting the existing password hashes.
+
+    :param password: Is the plain password.
+
+    :return:         The password hash.
+    """
+    return bcrypt.generate_password_hash(password, rounds=app.config.get("BCRYPT_LOG_ROUNDS"))
 
 
 def insert_user(data: Dict[str, Any]) -> None:
@@ -47,7 +60,7 @@ def insert_user(data: Dict[str, Any]) -> None:
         if len(password) < app.config["MINIMUM_PASSWORD_LENGTH"]:
             raise exc.PasswordTooShort()
 
-        password = bcrypt.generate_password_hash(data["password"])
+        password = hash_password(data["password"])
 
     # Try to create the user.
     if "firstname" in data:
@@ -59,3 +72,29 @@ def insert_user(data: Dict[str, Any]) -> None:
         db.session.add(user)
     except IntegrityError as error:
         raise exc.CouldNotCreateEntry() from error
+
+
+def get_inconsistent_user_credits() -> List[Dict[str, int]]:
+    """Compares the persisted credit of all users with the credit calculated
+    from their full purchase, deposit and replenishment history.
+
+    :return: A list with the user id, the persisted credit and the expected
+             credit of all users whose persisted credit is wrong.
+    """
+    expected = credit_expression(User.id).label("expected")
+    result = db.session.query(User.id, User.credit, expected).filter(User.credit != expected).all()
+    return [{"id": row.id, "credit": row.credit, "expected": row.expected} for row in result]
+
+
+def rebuild_user_credits() -> int:
+    """Recalculates the persisted credit of all users from their full history.
+    This is only necessary if the database has been modified without the
+    application, the credit is kept up to date on every change otherwise.
+
+    :return: The number of corrected users.
+    """
+    inconsistent = get_inconsistent_user_credits()
+    table = User.__table__
+    db.session.execute(table.update().values(credit=credit_expression(table.c.id)))
+    db.session.commit()
+    return len(inconsistent)
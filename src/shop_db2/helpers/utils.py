@@ -10,6 +10,7 @@ import dateutil.parser
 from flask import request
 
 import shop_db2.exceptions as exc
+from shop_db2.helpers.serializers import serialize
 
 
 def json_body() -> Any:
@@ -34,21 +35,7 @@ def convert_minimal(data: Any, fields: List[str]) -> List[Any]:
 
     :return:       A dictionary with all requested attributes.
     """
-    if not isinstance(data, list):
-        data = [data]
-
-    if len(data) == 0:
-        return []
-    out = []
-
-    for item in data:
-        element = {}
-        for field in fields:
-            element[field] = getattr(item, field, None)
-
-        out.append(element)
-
-    return out
+    return serialize(data, fields)
 
 
 def parse_timestamp(data: dict, required: bool) -> dict:
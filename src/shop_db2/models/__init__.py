@@ -17,3 +17,15 @@ from .tag import Tag
 from .upload import Upload
 from .user import User
 from .user_verification import UserVerification
+
+# Session hooks which keep the persisted user credit up to date
+from . import user_credit  # noqa: E402  isort: skip
+
+# Session hooks which keep the daily financial rollups up to date
+from .financial_rollup import FinancialRollup  # noqa: E402  isort: skip
+
+# Full-text search indexes of users and products
+from . import search  # noqa: E402  isort: skip
+
+# Change counters of all tables
+from .table_version import TableVersion  # noqa: E402  isort: skip
@@ -16,7 +16,7 @@ class AdminUpdate(db.Model):
     timestamp = db.Column(db.DateTime, default=func.now(), nullable=False)
     is_admin = db.Column(db.Boolean, nullable=False)
     admin_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
 
     @validates("admin_id")
     def validate_admin(self, _: str, admin_id: int) -> int:
@@ -24,7 +24,7 @@ class AdminUpdate(db.Model):
 
         # If there are no admins in the database, the first user can promote
         # himself
-        if not User.query.filter(User.is_admin is True).all():
+        if not db.session.query(User.query.filter(User.is_admin.is_(True)).exists()).scalar():
             return admin_id
 
         user = User.query.filter(User.id == admin_id).first()
@@ -15,12 +15,13 @@ from .revoke import Revoke
 class DepositRevoke(Revoke, db.Model):
     __tablename__ = "depositrevokes"
 
-    deposit_id = db.Column(db.Integer, db.ForeignKey("deposits.id"), nullable=False)
+    deposit_id = db.Column(db.Integer, db.ForeignKey("deposits.id"), nullable=False, index=True)
 
 
 class Deposit(db.Model):
     __tablename__ = "deposits"
     __updateable_fields__ = {"revoked": bool}
+    __table_args__ = (db.Index("ix_deposits_user_id_revoked", "user_id", "revoked"),)
 
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=func.now(), nullable=False)
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import datetime
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import bindparam, case, event, func, select
+from sqlalchemy.orm import Session, attributes
+
+from shop_db2.shared import db
+
+from .deposit import Deposit
+from .product import Product
+from .product_price import ProductPrice
+from .purchase import Purchase
+from .replenishment import Replenishment, ReplenishmentCollection
+from .stocktaking import Stocktaking, StocktakingCollection
+from .user_credit import _load_previous_value, _value
+
+# The financial rollups contain the sum of all financial movements per day and category. They are kept up to date by
+# the session hooks below, just like the persisted user credits (see "user_credit.py"), so that financial reports
+# over long time ranges only have to read one row per day and category instead of every single entry.
+
+# Purchases with a positive and a negative price.
+PURCHASE_INCOME = "purchase_income"
+PURCHASE_REFUND = "purchase_refund"
+# Deposits with a positive and a negative amount.
+DEPOSIT_IN = "deposit_in"
+DEPOSIT_OUT = "deposit_out"
+# Replenishmentcollections with a positive and a negative price.
+REPLENISHMENT_SPENDING = "replenishment_spending"
+REPLENISHMENT_INCOME = "replenishment_income"
+# Profits and losses between two consecutive stocktakingcollections, booked on the day of the later one.
+STOCKTAKING_PROFIT = "stocktaking_profit"
+STOCKTAKING_LOSS = "stocktaking_loss"
+
+CATEGORIES = [
+    PURCHASE_INCOME,
+    PURCHASE_REFUND,
+    DEPOSIT_IN,
+    DEPOSIT_OUT,
+    REPLENISHMENT_SPENDING,
+    REPLENISHMENT_INCOME,
+    STOCKTAKING_PROFIT,
+    STOCKTAKING_LOSS,
+]
+
+STOCKTAKING_CATEGORIES = [STOCKTAKING_PROFIT, STOCKTAKING_LOSS]
+
+# A rollup key consists of the day and the category.
+Key = Tuple[datetime.date, str]
+# The stocktaking periods affected by changed product prices are all periods which end after the first or start
+# before the second timestamp (see "_price_change_range").
+PriceRange = Tuple[datetime.datetime, datetime.datetime]
+
+
+class FinancialRollup(db.Model):
+    __tablename__ = "financialrollups"
+
+    date = db.Column(db.Date, primary_key=True)
+    category = db.Column(db.String(32), primary_key=True)
+    amount = db.Column(db.Integer, nullable=False, default=0)
+
+
+for _attribute in [Purchase.timestamp, Deposit.timestamp, ReplenishmentCollection.timestamp, ProductPrice.timestamp]:
+    event.listen(_attribute, "set", _load_previous_value, active_history=True)
+
+
+def _naive(timestamp: datetime.datetime) -> datetime.datetime:
+    """Returns the timestamp as it is stored in the database, which drops the time zone of parsed timestamps."""
+    return timestamp.replace(tzinfo=None)
+
+
+def _signed_contribution(day: datetime.date, value: int, positive: str, negative: str) -> Tuple[Key, int]:
+    """Returns the rollup key and the amount of a value, depending on its sign."""
+    if value >= 0:
+        return (day, positive), value
+    return (day, negative), -value
+
+
+def _purchase_contribution(purchase: Purchase, old: bool) -> Optional[Tuple[Key, int]]:
+    """Returns the rollup key and amount of a purchase or None, if it is revoked."""
+    if _value(purchase, "revoked", old):
+        return None
+    price = _value(purchase, "amount", old) * _value(purchase, "productprice", old)
+    day = _value(purchase, "timestamp", old).date()
+    return _signed_contribution(day, price, PURCHASE_INCOME, PURCHASE_REFUND)
+
+
+def _deposit_contribution(deposit: Deposit, old: bool) -> Optional[Tuple[Key, int]]:
+    """Returns the rollup key and amount of a deposit or None, if it is revoked."""
+    if _value(deposit, "revoked", old):
+        return None
+    day = _value(deposit, "timestamp", old).date()
+    return _signed_contribution(day, _value(deposit, "amount", old), DEPOSIT_IN, DEPOSIT_OUT)
+
+
+def _load_timestamps(session: Session, objects: Iterable[Any]) -> None:
+    """Loads the timestamps of all given objects with a single query per model. The timestamps of new entries are
+    set by the database and have to be loaded after their insert, which would cost one query per entry otherwise.
+    """
+    missing: Dict[Any, Dict[int, Any]] = defaultdict(dict)
+    for obj in objects:
+        if "timestamp" not in obj.__dict__:
+            missing[type(obj)][obj.id] = obj
+
+    for model, objs in missing.items():
+        for _id, timestamp in session.execute(
+            select([model.id, model.timestamp]).where(model.id.in_(list(objs.keys())))
+        ).fetchall():
+            attributes.set_committed_value(objs[_id], "timestamp", timestamp)
+
+
+def _price_change_range(session: Session, prices: List[Tuple[ProductPrice, bool, bool]]) -> Optional[PriceRange]:
+    """Determines the stocktaking periods whose mean prices are affected by the changed product prices.
+
+    A price is valid from its timestamp until the next price change, so it affects all periods ending after it.
+    Periods before the first price of a product fall back to its current price, which can be changed by any price
+    entry of the product, so all periods starting before the first price are affected as well.
+
+    :return: The timestamp after which the affected periods end and the timestamp before which they start or None,
+             if there are no changed product prices.
+    """
+    if not prices:
+        return None
+
+    _load_timestamps(session, [obj for obj, _, has_new in prices if has_new])
+    since = min(
+        _naive(_value(obj, "timestamp", old))
+        for obj, has_old, has_new in prices
+        for old, active in [(True, has_old), (False, has_new)]
+        if active
+    )
+
+    product_ids = {_value(obj, "product_id", old) for obj, *_ in prices for old in [True, False]}
+    table = ProductPrice.__table__
+    first_prices = dict(
+        session.execute(
+            select([table.c.product_id, func.min(table.c.timestamp)])
+            .where(table.c.product_id.in_(list(product_ids)))
+            .group_by(table.c.product_id)
+        ).fetchall()
+    )
+    # Products without any price are valued at their (missing) current price in all periods.
+    before = max(first_prices.get(product_id, datetime.datetime.max) for product_id in product_ids)
+    return since, before
+
+
+def _collect_rollup_deltas(
+    session: Session,
+) -> Tuple[Dict[Key, int], Set[datetime.datetime], bool, Optional[PriceRange]]:
+    """Determines the rollup changes caused by the current flush.
+
+    :param session: The session which is being flushed.
+
+    :return:        A dictionary mapping the rollup keys to their delta, the timestamps of all changed entries,
+                    whether all stocktaking periods are affected and the stocktaking periods affected by changed
+                    product prices (see "_price_change_range").
+    """
+    deltas: Dict[Key, int] = defaultdict(int)
+    timestamps: Set[datetime.datetime] = set()
+
+    def _objects(*models: Any) -> Iterable[Tuple[Any, bool, bool]]:
+        for obj in session.new:
+            if isinstance(obj, models):
+                yield obj, False, True
+        for obj in session.dirty:
+            if isinstance(obj, models) and session.is_modified(obj, include_collections=False):
+                yield obj, True, True
+        for obj in session.deleted:
+            if isinstance(obj, models):
+                yield obj, True, False
+
+    _load_timestamps(session, [obj for obj, *_ in _objects(Purchase, Deposit, ReplenishmentCollection)])
+
+    # Purchases and deposits are booked on their own day.
+    for obj, has_old, has_new in _objects(Purchase, Deposit):
+        contribution = _purchase_contribution if isinstance(obj, Purchase) else _deposit_contribution
+        for old, sign, active in [(True, -1, has_old), (False, 1, has_new)]:
+            result = contribution(obj, old=old) if active else None
+            if result is not None:
+                key, amount = result
+                deltas[key] += sign * amount
+                if isinstance(obj, Purchase):
+                    timestamps.add(_naive(_value(obj, "timestamp", old)))
+
+    # The category of a replenishmentcollection depends on the sign of its total price, so the prices before and
+    # after the flush are required. The price after the flush is queried, the price before is derived from it with
+    # the changes of all replenishments in the flush.
+    price_changes: Dict[int, int] = defaultdict(int)
+    for obj, has_old, has_new in _objects(Replenishment):
+        if has_old and not _value(obj, "revoked", old=True):
+            price_changes[obj.replcoll_id] -= _value(obj, "total_price", old=True)
+        if has_new and not _value(obj, "revoked", old=False):
+            price_changes[obj.replcoll_id] += _value(obj, "total_price", old=False)
+    for obj, *_ in _objects(ReplenishmentCollection):
+        price_changes.setdefault(obj.id, 0)
+
+    if price_changes:
+        table = Replenishment.__table__
+        prices = dict(
+            session.execute(
+                select([table.c.replcoll_id, func.sum(table.c.total_price)])
+                .where(table.c.replcoll_id.in_(list(price_changes.keys())))
+                .where(table.c.revoked.is_(False))
+                .group_by(table.c.replcoll_id)
+            ).fetchall()
+        )
+        collections = ReplenishmentCollection.query.filter(ReplenishmentCollection.id.in_(list(price_changes.keys())))
+        for collection in collections.all():
+            price = prices.get(collection.id, 0)
+            was_active = collection not in session.new and not _value(collection, "revoked", old=True)
+            is_active = collection not in session.deleted and not _value(collection, "revoked", old=False)
+            for old, sign, active, value in [
+                (True, -1, was_active, price - price_changes[collection.id]),
+                (False, 1, is_active, price),
+            ]:
+                if not active:
+                    continue
+                timestamp = _value(collection, "timestamp", old)
+                key, amount = _signed_contribution(
+                    timestamp.date(), value, REPLENISHMENT_SPENDING, REPLENISHMENT_INCOME
+                )
+                deltas[key] += sign * amount
+                timestamps.add(_naive(timestamp))
+
+    # The balances of all stocktaking periods only take the countable products into account.
+    stocktakings_changed = any(True for _ in _objects(Stocktaking, StocktakingCollection)) or any(
+        attributes.get_history(obj, "countable").has_changes() for obj, has_old, _ in _objects(Product) if has_old
+    )
+    price_range = _price_change_range(session, list(_objects(ProductPrice)))
+    return deltas, timestamps, stocktakings_changed, price_range
+
+
+def _get_rollups(session: Session, keys: Iterable[Key]) -> Dict[Key, int]:
+    """Returns the persisted amounts of all given rollup keys which exist."""
+    keys = set(keys)
+    table = FinancialRollup.__table__
+    result = session.execute(
+        select([table.c.date, table.c.category, table.c.amount]).where(table.c.date.in_(list({day for day, _ in keys})))
+    ).fetchall()
+    return {(row.date, row.category): row.amount for row in result if (row.date, row.category) in keys}
+
+
+def _execute_rollup_update(session: Session, deltas: Dict[Key, int]) -> None:
+    """Adds the deltas to the rollups. Existing rollups are updated with a single (executemany) UPDATE statement,
+    missing rollups are created with a single (executemany) INSERT statement.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta != 0}
+    if not deltas:
+        return
+    existing = _get_rollups(session, deltas.keys())
+    table = FinancialRollup.__table__
+
+    updates = [{"_date": day, "_category": category, "_delta": deltas[day, category]} for day, category in existing]
+    if updates:
+        statement = (
+            table.update()
+            .where(table.c.date == bindparam("_date"))
+            .where(table.c.category == bindparam("_category"))
+            .values(amount=table.c.amount + bindparam("_delta"))
+        )
+        session.execute(statement, updates)
+
+    inserts = [
+        {"date": day, "category": category, "amount": delta}
+        for (day, category), delta in deltas.items()
+        if (day, category) not in existing
+    ]
+    if inserts:
+        session.execute(table.insert(), inserts)
+
+
+def _get_stocktaking_pairs(session: Session) -> List[Tuple[StocktakingCollection, StocktakingCollection]]:
+    """Returns all pairs of consecutive, non revoked stocktakingcollections."""
+    collections = (
+        session.query(StocktakingCollection)
+        .filter(StocktakingCollection.revoked.is_(False))
+        .order_by(StocktakingCollection.timestamp, StocktakingCollection.id)
+        .all()
+    )
+    return list(zip(collections, collections[1:]))
+
+
+def calculate_stocktaking_rollups(
+    pairs: List[Tuple[StocktakingCollection, StocktakingCollection]], days: Optional[Set[datetime.date]] = None
+) -> Dict[Key, int]:
+    """Calculates the profit and the loss of all given pairs of stocktakingcollections, booked on the day of the
+    later stocktakingcollection of each pair.
+
+    :param pairs: The pairs of consecutive stocktakingcollections.
+    :param days:  If given, only the pairs which end on one of these days are taken into account.
+
+    :return:      A dictionary mapping the rollup keys to their amount. All keys of the requested days are included,
+                  even if their amount is zero.
+    """
+    from shop_db2.helpers.stocktakings import _get_balance_between_stocktakings
+
+    rollups: Dict[Key, int] = {}
+    for start, end in pairs:
+        day = end.timestamp.date()
+        # Stocktakingcollections at the same time do not span any period.
+        if (days is not None and day not in days) or end.timestamp <= start.timestamp:
+            continue
+        balance = _get_balance_between_stocktakings(start, end)
+        rollups[day, STOCKTAKING_PROFIT] = rollups.get((day, STOCKTAKING_PROFIT), 0) + balance["profit"]
+        rollups[day, STOCKTAKING_LOSS] = rollups.get((day, STOCKTAKING_LOSS), 0) + balance["loss"]
+    for day in days or ():
+        for category in STOCKTAKING_CATEGORIES:
+            rollups.setdefault((day, category), 0)
+    return rollups
+
+
+def _collect_stocktaking_deltas(
+    session: Session,
+    timestamps: Set[datetime.datetime],
+    everything: bool,
+    price_range: Optional[PriceRange] = None,
+) -> Dict:
+    """Recalculates the stocktaking rollups which are affected by the current changes and returns the differences
+    to the persisted rollups. The balance between two stocktakingcollections depends on all purchases and
+    replenishments in between, so it has to be recalculated if one of them lies in a closed stocktaking period.
+    The same applies to the periods whose mean product prices have been changed. If the stocktakings themselves or
+    the countable products have been changed, all stocktaking rollups are recalculated.
+    """
+    if not everything and not timestamps and price_range is None:
+        return {}
+
+    table = StocktakingCollection.__table__
+    latest = session.execute(select([func.max(table.c.timestamp)]).where(table.c.revoked.is_(False))).scalar()
+    if latest is None and not everything:
+        return {}
+    if not everything and price_range is None and min(timestamps) >= latest:
+        return {}
+
+    pairs = _get_stocktaking_pairs(session)
+    if everything:
+        rollup_table = FinancialRollup.__table__
+        days = {
+            row.date
+            for row in session.execute(
+                select([rollup_table.c.date]).where(rollup_table.c.category.in_(STOCKTAKING_CATEGORIES))
+            ).fetchall()
+        }
+        days |= {end.timestamp.date() for _, end in pairs}
+    else:
+        days = {
+            end.timestamp.date()
+            for start, end in pairs
+            if any(start.timestamp <= timestamp < end.timestamp for timestamp in timestamps)
+            or (price_range is not None and (end.timestamp > price_range[0] or start.timestamp < price_range[1]))
+        }
+    if not days:
+        return {}
+
+    # The balance queries the stocktakings of the collections, which must not trigger another flush.
+    with session.no_autoflush:
+        expected = calculate_stocktaking_rollups(pairs, days)
+    current = _get_rollups(session, expected.keys())
+    return {key: amount - current.get(key, 0) for key, amount in expected.items()}
+
+
+@event.listens_for(db.session, "after_flush")
+def _update_financial_rollups(session: Session, _: Any) -> None:
+    """Applies all rollup changes of the current flush to the "financialrollups" table."""
+    deltas, timestamps, stocktakings_changed, price_range = _collect_rollup_deltas(session)
+    _execute_rollup_update(session, deltas)
+    _execute_rollup_update(session, _collect_stocktaking_deltas(session, timestamps, stocktakings_changed, price_range))
+
+
+def add_to_financial_rollups(rows: List[Tuple[datetime.datetime, int]]) -> None:
+    """Books the given purchases in the financial rollups. This is only required for purchases which are inserted
+    in bulk and therefore bypass the session hooks above.
+
+    :param rows: The timestamps and prices of the purchases.
+
+    :return:     None
+    """
+    deltas: Dict[Key, int] = defaultdict(int)
+    for timestamp, price in rows:
+        key, amount = _signed_contribution(timestamp.date(), price, PURCHASE_INCOME, PURCHASE_REFUND)
+        deltas[key] += amount
+    _execute_rollup_update(db.session, deltas)
+    _execute_rollup_update(
+        db.session, _collect_stocktaking_deltas(db.session, {_naive(timestamp) for timestamp, _ in rows}, False)
+    )
+
+
+def raw_financial_rollups() -> Dict[Key, int]:
+    """Calculates the financial rollups from the full history of all purchases, deposits, replenishmentcollections
+    and stocktakingcollections. This is the reference the persisted rollups are checked against.
+
+    :return: A dictionary mapping the rollup keys to their amount.
+    """
+    rollups: Dict[Key, int] = defaultdict(int)
+
+    def _add_signed_sums(query: Any, positive: str, negative: str) -> None:
+        for day, positive_sum, negative_sum in query:
+            day = datetime.date.fromisoformat(day)
+            rollups[day, positive] += positive_sum
+            rollups[day, negative] += negative_sum
+
+    def _signed_sums(value: Any) -> List[Any]:
+        return [
+            func.sum(case([(value >= 0, value)], else_=0)),
+            func.sum(case([(value < 0, -value)], else_=0)),
+        ]
+
+    day = func.date(Purchase.timestamp)
+    _add_signed_sums(
+        db.session.query(day, *_signed_sums(Purchase.price)).filter(Purchase.revoked.is_(False)).group_by(day),
+        PURCHASE_INCOME,
+        PURCHASE_REFUND,
+    )
+
+    day = func.date(Deposit.timestamp)
+    _add_signed_sums(
+        db.session.query(day, *_signed_sums(Deposit.amount)).filter(Deposit.revoked.is_(False)).group_by(day),
+        DEPOSIT_IN,
+        DEPOSIT_OUT,
+    )
+
+    collections = (
+        db.session.query(
+            func.date(ReplenishmentCollection.timestamp).label("day"),
+            func.sum(Replenishment.total_price).label("price"),
+        )
+        .join(Replenishment, ReplenishmentCollection.id == Replenishment.replcoll_id)
+        .filter(Replenishment.revoked.is_(False))
+        .filter(ReplenishmentCollection.revoked.is_(False))
+        .group_by(ReplenishmentCollection.id)
+        .subquery()
+    )
+    _add_signed_sums(
+        db.session.query(collections.c.day, *_signed_sums(collections.c.price)).group_by(collections.c.day),
+        REPLENISHMENT_SPENDING,
+        REPLENISHMENT_INCOME,
+    )
+
+    rollups.update(calculate_stocktaking_rollups(_get_stocktaking_pairs(db.session)))
+    return rollups
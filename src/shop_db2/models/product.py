@@ -7,7 +7,7 @@ from typing import Any, Dict, List, Optional
 
 from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
+from sqlalchemy.ext.hybrid import hybrid_method
 from sqlalchemy.orm import column_property, validates
 
 from shop_db2.exceptions import (
@@ -42,6 +42,7 @@ class Product(db.Model):
     from .product_tag_assignment import product_tag_assignments
     from .purchase import Purchase
     from .replenishment import Replenishment
+    from .upload import Upload
 
     id = db.Column(db.Integer, primary_key=True)
     creation_date = db.Column(db.DateTime, default=func.now(), nullable=False)
@@ -58,6 +59,9 @@ class Product(db.Model):
         backref=db.backref("products", lazy="dynamic"),
     )
 
+    # Column property for the image name
+    imagename = column_property(select([Upload.filename]).where(Upload.id == image_upload_id).as_scalar())
+
     # Column property for the price
     price = column_property(
         select([ProductPrice.price])
@@ -98,15 +102,6 @@ class Product(db.Model):
         """Returns whether this product is for sale for unprivileged users"""
         return all(map(lambda tag: tag.is_for_sale, self.tags))
 
-    @hybrid_property
-    def imagename(self) -> Optional[str]:
-        from .upload import Upload
-
-        upload = Upload.query.filter_by(id=self.image_upload_id).first()
-        if upload:
-            return upload.filename
-        return None
-
     @hybrid_method
     def get_pricehistory(self, start_date: Optional[float] = None, end_date: Optional[float] = None) -> List:
 
@@ -165,10 +160,16 @@ class Product(db.Model):
         try:
             from .upload import Upload
 
-            u = Upload(filename=filename, admin_id=admin_id)
-            db.session.add(u)
-            db.session.flush()
+            # An image which has been uploaded before has the same file name and reuses the existing upload
+            u = Upload.query.filter_by(filename=filename).first()
+            if u is None:
+                u = Upload(filename=filename, admin_id=admin_id)
+                db.session.add(u)
+                db.session.flush()
             self.image_upload_id = u.id
+            # The image name is derived from the upload and must be reloaded on next access
+            db.session.flush()
+            db.session.expire(self, ["imagename"])
         except IntegrityError as error:
             raise CouldNotCreateEntry() from error
 
@@ -13,6 +13,7 @@ from shop_db2.shared import db
 
 class ProductPrice(db.Model):
     __tablename__ = "productprices"
+    __table_args__ = (db.Index("ix_productprices_product_id_timestamp", "product_id", "timestamp"),)
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=func.now(), nullable=False)
     price = db.Column(db.Integer, nullable=False)
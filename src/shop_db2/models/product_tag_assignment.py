@@ -6,6 +6,6 @@ from shop_db2.shared import db
 
 product_tag_assignments = db.Table(
     "product_tag_assignments",
-    db.Column("product_id", db.Integer, db.ForeignKey("products.id")),
-    db.Column("tag_id", db.Integer, db.ForeignKey("tags.id")),
+    db.Column("product_id", db.Integer, db.ForeignKey("products.id"), index=True),
+    db.Column("tag_id", db.Integer, db.ForeignKey("tags.id"), index=True),
 )
@@ -18,12 +18,17 @@ class PurchaseRevoke(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=func.now(), nullable=False)
     revoked = db.Column(db.Boolean, nullable=False)
-    purchase_id = db.Column(db.Integer, db.ForeignKey("purchases.id"), nullable=False)
+    purchase_id = db.Column(db.Integer, db.ForeignKey("purchases.id"), nullable=False, index=True)
 
 
 class Purchase(db.Model):
     __tablename__ = "purchases"
     __updateable_fields__ = {"revoked": bool, "amount": int}
+    __table_args__ = (
+        # Purchases of a user (credit, favorite products) and of a product in a period of time (stock, balance).
+        db.Index("ix_purchases_user_id_revoked", "user_id", "revoked"),
+        db.Index("ix_purchases_product_id_revoked_timestamp", "product_id", "revoked", "timestamp"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=func.now(), nullable=False)
@@ -15,7 +15,7 @@ class RankUpdate(db.Model):
     __tablename__ = "rankupdates"
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=func.now(), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     rank_id = db.Column(db.Integer, db.ForeignKey("ranks.id"), nullable=False)
     admin_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
 
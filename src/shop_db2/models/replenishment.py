@@ -18,15 +18,16 @@ from .revoke import Revoke
 class ReplenishmentRevoke(Revoke, db.Model):
     __tablename__ = "replenishmentrevoke"
 
-    repl_id = db.Column(db.Integer, db.ForeignKey("replenishments.id"), nullable=False)
+    repl_id = db.Column(db.Integer, db.ForeignKey("replenishments.id"), nullable=False, index=True)
 
 
 class Replenishment(db.Model):
     __tablename__ = "replenishments"
     __updateable_fields__ = {"revoked": bool, "amount": int, "total_price": int}
+    __table_args__ = (db.Index("ix_replenishments_product_id_revoked", "product_id", "revoked"),)
 
     id = db.Column(db.Integer, primary_key=True)
-    replcoll_id = db.Column(db.Integer, db.ForeignKey("replenishmentcollections.id"), nullable=False)
+    replcoll_id = db.Column(db.Integer, db.ForeignKey("replenishmentcollections.id"), nullable=False, index=True)
     product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
     revoked = db.Column(db.Boolean, nullable=False, default=False)
     amount = db.Column(db.Integer, nullable=False)
@@ -86,7 +87,7 @@ class Replenishment(db.Model):
 class ReplenishmentCollectionRevoke(Revoke, db.Model):
     __tablename__ = "replenishmentcollectionrevoke"
 
-    replcoll_id = db.Column(db.Integer, db.ForeignKey("replenishmentcollections.id"), nullable=False)
+    replcoll_id = db.Column(db.Integer, db.ForeignKey("replenishmentcollections.id"), nullable=False, index=True)
 
 
 class ReplenishmentCollection(db.Model):
@@ -96,7 +97,7 @@ class ReplenishmentCollection(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     timestamp = db.Column(db.DateTime, default=func.now(), nullable=False)
     admin_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
-    seller_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False)
+    seller_id = db.Column(db.Integer, db.ForeignKey("users.id"), nullable=False, index=True)
     revoked = db.Column(db.Boolean, nullable=False, default=False)
     comment = db.Column(db.String(64), nullable=False)
     replenishments = db.relationship("Replenishment", lazy="dynamic", foreign_keys="Replenishment.replcoll_id")
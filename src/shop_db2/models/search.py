@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import re
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import DDL, event, literal_column
+from sqlalchemy.sql import column, table
+from sqlalchemy.sql.expression import ColumnElement, TableClause
+
+from .product import Product
+from .user import User
+
+# The full-text search indexes (SQLite FTS5) of all searchable models as (name of the index, indexed columns). The
+# indexes are external content tables: they only store the search terms and refer to the rows of the model table
+# by their id. They are kept up to date by triggers on the model table, so that all changes are covered, even if
+# they are not made via the ORM.
+SEARCH_INDEXES: Dict[type, Tuple[str, List[str]]] = {
+    User: ("users_search", ["firstname", "lastname"]),
+    Product: ("products_search", ["name", "barcode"]),
+}
+
+# Characters (e.g. umlauts and accents) are folded, so that "Muller" also finds "Müller". The prefix indexes speed
+# up the search for the first characters of a word, which is what happens while a search term is typed.
+_TOKENIZE = "unicode61 remove_diacritics 2"
+_PREFIX = "1 2 3"
+
+
+def search_index_ddl(index: str, source: str, columns: List[str]) -> List[str]:
+    """Returns all statements to create a search index and the triggers to keep it up to date.
+
+    :param index:   Is the name of the search index.
+    :param source:  Is the name of the indexed table.
+    :param columns: Are the indexed columns.
+
+    :return:        The list of all statements.
+    """
+    names = ", ".join(columns)
+    new = ", ".join(f"new.{name}" for name in columns)
+    old = ", ".join(f"old.{name}" for name in columns)
+    delete = f"INSERT INTO {index}({index}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {index}(rowid, {names}) VALUES (new.id, {new});"
+    return [
+        f"CREATE VIRTUAL TABLE {index} USING fts5({names}, content='{source}', content_rowid='id', "
+        f"tokenize='{_TOKENIZE}', prefix='{_PREFIX}')",
+        f"CREATE TRIGGER {index}_insert AFTER INSERT ON {source} BEGIN {insert} END",
+        f"CREATE TRIGGER {index}_delete AFTER DELETE ON {source} BEGIN {delete} END",
+        f"CREATE TRIGGER {index}_update AFTER UPDATE OF {names} ON {source} BEGIN {delete} {insert} END",
+        f"INSERT INTO {index}({index}) VALUES ('rebuild')",
+    ]
+
+
+def is_search_index_table(name: str) -> bool:
+    """Returns whether the table belongs to a search index. This includes the shadow tables of FTS5."""
+    return any(name == index or name.startswith(f"{index}_") for index, _ in SEARCH_INDEXES.values())
+
+
+def get_search_index(model: type) -> Optional[TableClause]:
+    """Returns the search index of the model (with the id of the indexed row and the rank of a search result).
+
+    :param model: Is the database model.
+
+    :return:      The search index or None if the model is not searchable.
+    """
+    if model not in SEARCH_INDEXES:
+        return None
+    return table(SEARCH_INDEXES[model][0], column("rowid"), column("rank"))
+
+
+def search_condition(index: TableClause, text: str) -> Optional[ColumnElement]:
+    """Creates the condition which matches all entries of the search index which contain all words of the text.
+    The last word may be incomplete. Only the words are passed to the index, so the search syntax of FTS5 can't be
+    used (and abused).
+
+    :param index: Is the search index.
+    :param text:  Is the text to search for.
+
+    :return:      The condition or None if the text does not contain any word.
+    """
+    words = re.findall(r"\w+", text)
+    if not words:
+        return None
+    query = " ".join(f'"{word}"' for word in words) + "*"
+    return literal_column(index.name).op("MATCH")(query)
+
+
+for _model, (_index, _columns) in SEARCH_INDEXES.items():
+    for _statement in search_index_ddl(_index, _model.__tablename__, _columns):
+        event.listen(_model.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+    event.listen(_model.__table__, "before_drop", DDL(f"DROP TABLE IF EXISTS {_index}").execute_if(dialect="sqlite"))
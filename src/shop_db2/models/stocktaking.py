@@ -19,8 +19,8 @@ class Stocktaking(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     count = db.Column(db.Integer, nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False)
-    collection_id = db.Column(db.Integer, db.ForeignKey("stocktakingcollections.id"), nullable=False)
+    product_id = db.Column(db.Integer, db.ForeignKey("products.id"), nullable=False, index=True)
+    collection_id = db.Column(db.Integer, db.ForeignKey("stocktakingcollections.id"), nullable=False, index=True)
 
     @hybrid_method
     def set_count(self, count: int) -> None:
@@ -70,4 +70,4 @@ class StocktakingCollection(db.Model):
 class StocktakingCollectionRevoke(Revoke, db.Model):
     __tablename__ = "stocktakingcollectionrevokes"
 
-    collection_id = db.Column(db.Integer, db.ForeignKey("stocktakingcollections.id"), nullable=False)
+    collection_id = db.Column(db.Integer, db.ForeignKey("stocktakingcollections.id"), nullable=False, index=True)
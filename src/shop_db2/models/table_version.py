@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+from typing import Any, Callable, Dict, Iterable, List, Set
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.dml import Update, UpdateBase
+
+from shop_db2.shared import db
+
+# Every table has a change counter, which is incremented by each committed transaction that modifies the table.
+# Clients can use them to find out cheaply whether a list has changed (see the ETags of the list routes). The
+# counters are stored in the database and incremented in the same transaction as the changes themselves, so they
+# are shared by all workers and can never get ahead of or fall behind the data they describe.
+#
+# All INSERT, UPDATE and DELETE statements are recorded per connection, no matter whether they have been emitted by
+# a flush of the session or executed directly. Only changes which bypass the session (e.g. via "db.engine.execute")
+# are not counted.
+#
+# Columns which only cache values derived from other tables are counted separately, under the name "table.column".
+# Otherwise, e.g. every purchase would change the version of the users table because of the persisted user credit.
+_DERIVED_COLUMNS = {"users": {"credit"}}
+
+# Functions which are called with the names of all tables (or derived columns) modified by a committed transaction
+_commit_listeners: List[Callable[[Set[str]], None]] = []
+
+
+class TableVersion(db.Model):
+    __tablename__ = "tableversions"
+
+    name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+
+_increment_version = text(
+    "INSERT INTO tableversions (name, version) VALUES (:name, 1) "
+    "ON CONFLICT (name) DO UPDATE SET version = version + 1"
+)
+
+
+@event.listens_for(Engine, "before_execute")
+def _record_modified_tables(conn: Any, clauseelement: Any, *_: Any) -> None:
+    """Remembers all tables (or derived columns) which are modified in the current transaction of the connection."""
+    if not isinstance(clauseelement, UpdateBase):
+        return
+    name = clauseelement.table.name
+    if isinstance(clauseelement, Update) and clauseelement.parameters:
+        columns = {getattr(column, "key", column) for column in clauseelement.parameters}
+        if columns <= _DERIVED_COLUMNS.get(name, set()):
+            name = ".".join([name] + sorted(columns))
+    conn.info.setdefault("modified_tables", set()).add(name)
+
+
+@event.listens_for(Engine, "commit")
+def _notify_modified_tables(conn: Any) -> None:
+    """Forgets the modified tables of a committed transaction and passes them to all commit listeners."""
+    modified = conn.info.pop("modified_tables", set())
+    if modified:
+        for listener in _commit_listeners:
+            listener(modified)
+
+
+@event.listens_for(Engine, "rollback")
+def _discard_modified_tables(conn: Any) -> None:
+    """Forgets the modified tables of a transaction which has been rolled back."""
+    conn.info.pop("modified_tables", None)
+
+
+def on_modified_tables(listener: Callable[[Set[str]], None]) -> Callable[[Set[str]], None]:
+    """Registers a function which is called with the names of all tables modified by a committed transaction.
+    Derived columns are passed as "table.column". This can be used as a decorator.
+
+    :param listener: Is the function to call.
+
+    :return:         The function itself.
+    """
+    _commit_listeners.append(listener)
+    return listener
+
+
+@event.listens_for(db.session, "before_commit")
+def _increment_table_versions(session: Session) -> None:
+    """Increments the change counters of all tables modified by the transaction which is about to be committed.
+    The pending changes are flushed first, so that they are recorded as well.
+    """
+    session.flush()
+    modified = session.connection().info.get("modified_tables", set()) - {TableVersion.__tablename__}
+    if modified:
+        session.execute(_increment_version, [{"name": name} for name in sorted(modified)])
+
+
+def get_table_versions(tables: Iterable[str]) -> Dict[str, int]:
+    """Returns the change counters of the given tables. Tables which have never been modified have the version 0.
+
+    :param tables: Are the names of the tables.
+
+    :return:       A dictionary mapping the table names to their version.
+    """
+    tables = sorted(set(tables))
+    rows = db.session.query(TableVersion.name, TableVersion.version).filter(TableVersion.name.in_(tables)).all()
+    versions = dict.fromkeys(tables, 0)
+    versions.update(rows)
+    return versions
@@ -2,9 +2,9 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
-from typing import Dict, Optional
+from typing import Dict
 
-from sqlalchemy import and_, func, select
+from sqlalchemy import func, select
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.hybrid import hybrid_method, hybrid_property
 from sqlalchemy.orm import column_property
@@ -31,11 +31,9 @@ class User(db.Model):
         "imagename": dict,
     }
 
-    from .deposit import Deposit
-    from .purchase import Purchase
+    from .admin_update import AdminUpdate
     from .rank import Rank
-    from .rank_update import RankUpdate
-    from .replenishment import ReplenishmentCollection
+    from .upload import Upload
     from .user_verification import UserVerification
 
     id = db.Column(db.Integer, primary_key=True)
@@ -46,25 +44,32 @@ class User(db.Model):
     is_verified = db.Column(db.Boolean, nullable=False, default=False)
     image_upload_id = db.Column(db.Integer, db.ForeignKey("uploads.id"), nullable=True)
 
+    # Column property for the image name
+    imagename = column_property(select([Upload.filename]).where(Upload.id == image_upload_id).as_scalar())
+
     # Column property for the full name
     fullname = column_property(func.trim(func.coalesce(firstname, "") + " " + lastname))
 
+    # The current rank of the user. The full history of all rank changes is kept in the rankupdates table,
+    # this column always points to the rank of the latest rank update.
+    rank_id = db.Column(db.Integer, db.ForeignKey("ranks.id"), nullable=True)
+
     # Column property for the active state
-    active = column_property(
-        select([Rank.active])
-        .where(and_(RankUpdate.user_id == id, Rank.id == RankUpdate.rank_id))
-        .order_by(RankUpdate.id.desc())
-        .limit(1)
-        .as_scalar()
-    )
+    active = column_property(select([Rank.active]).where(Rank.id == rank_id).as_scalar())
 
     # Column property for the is system user property
-    is_system_user = column_property(
-        select([Rank.is_system_user])
-        .where(and_(RankUpdate.user_id == id, Rank.id == RankUpdate.rank_id))
-        .order_by(RankUpdate.id.desc())
-        .limit(1)
-        .as_scalar()
+    is_system_user = column_property(select([Rank.is_system_user]).where(Rank.id == rank_id).as_scalar())
+
+    # Column property for the admin state. It is defined by the latest admin update of the user.
+    is_admin = column_property(
+        func.coalesce(
+            select([AdminUpdate.is_admin])
+            .where(AdminUpdate.user_id == id)
+            .order_by(AdminUpdate.id.desc())
+            .limit(1)
+            .as_scalar(),
+            False,
+        )
     )
 
     # Column property for the verification_date
@@ -72,46 +77,10 @@ class User(db.Model):
         select([UserVerification.timestamp]).where(UserVerification.user_id == id).limit(1).as_scalar()
     )
 
-    # Column property for the rank_id
-    rank_id = column_property(
-        select([Rank.id])
-        .where(and_(RankUpdate.user_id == id, Rank.id == RankUpdate.rank_id))
-        .order_by(RankUpdate.id.desc())
-        .limit(1)
-        .as_scalar()
-    )
-
-    # Select statement for the sum of all non revoked purchases referring this user.
-    # NOTE: func.coalesce(a, b) returns the first non-null value of (a, b). If there aren't any purchases
-    #       (or deposits, ...) yet, the purchase (deposit, ...) sum is NULL. In this case, 0 gets returned.
-    _purchase_sum = column_property(
-        select([func.coalesce(func.sum(Purchase.price), 0)])
-        .where(Purchase.user_id == id)
-        .where(Purchase.revoked.is_(False))
-        .as_scalar()
-    )
-
-    # Select statement for the sum of all non revoked deposits referring this user.
-    _deposit_sum = column_property(
-        select([func.coalesce(func.sum(Deposit.amount), 0)])
-        .where(Deposit.user_id == id)
-        .where(Deposit.revoked.is_(False))
-        .as_scalar()
-    )
-
-    # Select statement for the sum of all non revoked refunds referring this user.
-    _replenishmentcollection_sum = column_property(
-        select([func.coalesce(func.sum(ReplenishmentCollection.price), 0)])
-        .where(ReplenishmentCollection.seller_id == id)
-        .where(ReplenishmentCollection.revoked.is_(False))
-        .as_scalar()
-    )
-
-    # A users credit is the sum of all amounts that increase his credit (Deposits, ReplenishmentCollections)
-    # and all amounts that decrease it (Purchases)
-    credit = column_property(
-        _replenishmentcollection_sum.expression + _deposit_sum.expression - _purchase_sum.expression
-    )
+    # The credit of a user is the sum of all amounts that increase his credit (Deposits, ReplenishmentCollections)
+    # and all amounts that decrease it (Purchases). It is persisted and kept up to date incrementally on each flush,
+    # see "user_credit.py" for details.
+    credit = db.Column(db.Integer, nullable=False, default=0)
 
     # Link to all purchases of a user.
     purchases = db.relationship("Purchase", lazy="dynamic", foreign_keys="Purchase.user_id")
@@ -127,15 +96,6 @@ class User(db.Model):
     def __repr__(self) -> str:
         return f"<User {self.id}: {self.lastname}, {self.firstname}>"
 
-    @hybrid_property
-    def imagename(self) -> Optional[str]:
-        from .upload import Upload
-
-        upload = Upload.query.filter_by(id=self.image_upload_id).first()
-        if upload:
-            return upload.filename
-        return None
-
     @hybrid_method
     def set_imagename(self, image: Dict, admin_id: int) -> None:
         filename = insert_image(image)
@@ -143,22 +103,19 @@ class User(db.Model):
         try:
             from .upload import Upload
 
-            u = Upload(filename=filename, admin_id=admin_id)
-            db.session.add(u)
-            db.session.flush()
+            # An image which has been uploaded before has the same file name and reuses the existing upload
+            u = Upload.query.filter_by(filename=filename).first()
+            if u is None:
+                u = Upload(filename=filename, admin_id=admin_id)
+                db.session.add(u)
+                db.session.flush()
             self.image_upload_id = u.id
+            # The image name is derived from the upload and must be reloaded on next access
+            db.session.flush()
+            db.session.expire(self, ["imagename"])
         except IntegrityError as error:
             raise CouldNotCreateEntry() from error
 
-    @hybrid_property
-    def is_admin(self) -> bool:
-        from .admin_update import AdminUpdate
-
-        au = AdminUpdate.query.filter_by(user_id=self.id).order_by(AdminUpdate.id.desc()).first()
-        if au is None:
-            return False
-        return au.is_admin
-
     @hybrid_method
     def set_admin(self, is_admin: bool, admin_id: int) -> None:
         from .admin_update import AdminUpdate
@@ -169,6 +126,9 @@ class User(db.Model):
             raise NothingHasChanged()
         au = AdminUpdate(is_admin=is_admin, admin_id=admin_id, user_id=self.id)
         db.session.add(au)
+        # The admin state is derived from the admin updates and must be reloaded on next access
+        db.session.flush()
+        db.session.expire(self, ["is_admin"])
 
     @hybrid_method
     def verify(self, admin_id: int, rank_id: int) -> None:
@@ -188,17 +148,15 @@ class User(db.Model):
         if self.is_verified:
             ru = RankUpdate(rank_id=rank_id, admin_id=admin_id, user_id=self.id)
             db.session.add(ru)
+            self.rank_id = rank_id
         else:
             self.verify(admin_id=admin_id, rank_id=rank_id)
 
     @hybrid_method
     def set_is_admin(self, is_admin, admin_id):
         self.set_admin(is_admin=is_admin, admin_id=admin_id)
-        if not self.is_admin:
-            users = User.query.all()
-            admins = list(filter(lambda x: x.is_admin, users))
-            if not admins:
-                raise NoRemainingAdmin()
+        if not is_admin and User.query.filter(User.is_admin.is_(True)).count() == 0:
+            raise NoRemainingAdmin()
 
     @hybrid_property
     def rank(self):
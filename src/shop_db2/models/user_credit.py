@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import bindparam, event, func, select
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.util import identity_key
+
+from shop_db2.shared import db
+
+from .deposit import Deposit
+from .purchase import Purchase
+from .replenishment import Replenishment, ReplenishmentCollection
+from .user import User
+
+# The credit of a user is persisted in the "users.credit" column. It is kept up to date by the session hooks below,
+# which translate every inserted, changed or deleted purchase, deposit and replenishment into a credit delta and
+# apply it with an "UPDATE users SET credit = credit + delta" in the same transaction as the flush itself.
+
+
+def _load_previous_value(*_: Any) -> None:
+    """Set listener without any functionality. Its only purpose is to enforce the "active history" of the
+    attribute, so the value before a change is loaded even if the attribute has been expired by a commit.
+    """
+
+
+for _attribute in [
+    Purchase.amount,
+    Purchase.revoked,
+    Deposit.amount,
+    Deposit.revoked,
+    Replenishment.total_price,
+    Replenishment.revoked,
+    ReplenishmentCollection.revoked,
+]:
+    event.listen(_attribute, "set", _load_previous_value, active_history=True)
+
+
+def _value(obj: Any, key: str, old: bool) -> Any:
+    """Returns the value of an attribute before (old=True) or after (old=False) the current flush."""
+    history = attributes.get_history(obj, key, passive=attributes.PASSIVE_NO_INITIALIZE)
+    if old:
+        values = history.deleted or history.unchanged
+    else:
+        values = history.added or history.unchanged
+    if values:
+        return values[0]
+    return getattr(obj, key, None)
+
+
+def _purchase_contribution(purchase: Purchase, old: bool) -> Tuple[int, int]:
+    """Returns the user id and the credit contribution of a purchase."""
+    user_id = _value(purchase, "user_id", old)
+    if _value(purchase, "revoked", old):
+        return user_id, 0
+    return user_id, -(_value(purchase, "amount", old) * _value(purchase, "productprice", old))
+
+
+def _deposit_contribution(deposit: Deposit, old: bool) -> Tuple[int, int]:
+    """Returns the user id and the credit contribution of a deposit."""
+    user_id = _value(deposit, "user_id", old)
+    if _value(deposit, "revoked", old):
+        return user_id, 0
+    return user_id, _value(deposit, "amount", old)
+
+
+def _replenishment_contribution(replenishment: Replenishment, old: bool) -> int:
+    """Returns the credit contribution of a replenishment, ignoring the state of its replenishmentcollection."""
+    if _value(replenishment, "revoked", old):
+        return 0
+    return _value(replenishment, "total_price", old)
+
+
+def _collection_state(session: Session, collections: Dict[int, ReplenishmentCollection], replcoll_id: int) -> Tuple:
+    """Returns the seller id and the revoked state of a replenishmentcollection *before* the current flush.
+    New collections are treated as revoked, because they did not contribute to any credit yet.
+    """
+    collection = collections.get(replcoll_id)
+    if collection is not None:
+        if collection in session.new:
+            return collection.seller_id, True
+        return collection.seller_id, _value(collection, "revoked", old=True)
+
+    table = ReplenishmentCollection.__table__
+    row = session.execute(select([table.c.seller_id, table.c.revoked]).where(table.c.id == replcoll_id)).first()
+    return row.seller_id, row.revoked
+
+
+def _collect_credit_deltas(session: Session) -> Dict[int, int]:
+    """Determines the credit changes of all users caused by the current flush.
+
+    :param session: The session which is being flushed.
+
+    :return:        A dictionary mapping user ids to their credit delta.
+    """
+    deltas: Dict[int, int] = defaultdict(int)
+
+    def _objects(*models: Any) -> Iterable[Tuple[Any, bool, bool]]:
+        for obj in session.new:
+            if isinstance(obj, models):
+                yield obj, False, True
+        for obj in session.dirty:
+            if isinstance(obj, models) and session.is_modified(obj, include_collections=False):
+                yield obj, True, True
+        for obj in session.deleted:
+            if isinstance(obj, models):
+                yield obj, True, False
+
+    # Purchases and deposits directly affect a single user.
+    for obj, has_old, has_new in _objects(Purchase, Deposit):
+        contribution = _purchase_contribution if isinstance(obj, Purchase) else _deposit_contribution
+        if has_old:
+            user_id, amount = contribution(obj, old=True)
+            deltas[user_id] -= amount
+        if has_new:
+            user_id, amount = contribution(obj, old=False)
+            deltas[user_id] += amount
+
+    # The credit of a seller is the sum of all non revoked replenishments in all non revoked collections.
+    # Changes of replenishments are weighted with the collection state before the flush, changes of a collection
+    # state are weighted with the replenishment sums after the flush. This way, simultaneous changes of both
+    # (e.g. revoking the last replenishment of a collection) are counted exactly once.
+    collections = {
+        obj.id: obj
+        for obj in set(session.new) | set(session.dirty)
+        if isinstance(obj, ReplenishmentCollection) and obj.id is not None
+    }
+    for obj, has_old, has_new in _objects(Replenishment):
+        seller_id, collection_revoked = _collection_state(session, collections, obj.replcoll_id)
+        if collection_revoked:
+            continue
+        if has_old:
+            deltas[seller_id] -= _replenishment_contribution(obj, old=True)
+        if has_new:
+            deltas[seller_id] += _replenishment_contribution(obj, old=False)
+
+    for collection in collections.values():
+        was_active = collection not in session.new and not _value(collection, "revoked", old=True)
+        is_active = not _value(collection, "revoked", old=False)
+        if was_active == is_active:
+            continue
+        table = Replenishment.__table__
+        price = session.execute(
+            select([func.coalesce(func.sum(table.c.total_price), 0)])
+            .where(table.c.replcoll_id == collection.id)
+            .where(table.c.revoked.is_(False))
+        ).scalar()
+        deltas[collection.seller_id] += price if is_active else -price
+
+    return {user_id: delta for user_id, delta in deltas.items() if user_id is not None and delta != 0}
+
+
+def _execute_credit_update(session: Session, deltas: Dict[int, int]) -> None:
+    """Adds the deltas to the credits of the users with a single (executemany) UPDATE statement."""
+    if not deltas:
+        return
+    table = User.__table__
+    statement = (
+        table.update().where(table.c.id == bindparam("_user_id")).values(credit=table.c.credit + bindparam("_delta"))
+    )
+    session.execute(statement, [{"_user_id": user_id, "_delta": delta} for user_id, delta in deltas.items()])
+
+
+def _expire_credits(session: Session, user_ids: Iterable[int]) -> None:
+    """Expires the credit of all given users which are loaded in the session, so it gets reloaded on next access."""
+    for user_id in user_ids:
+        user: Optional[User] = session.identity_map.get(identity_key(User, user_id))
+        if user is not None:
+            session.expire(user, ["credit"])
+
+
+@event.listens_for(db.session, "after_flush")
+def _update_user_credits(session: Session, _: Any) -> None:
+    """Applies all credit changes of the current flush to the "users.credit" column."""
+    deltas = _collect_credit_deltas(session)
+    _execute_credit_update(session, deltas)
+    session.info.setdefault("credit_changed_user_ids", set()).update(deltas.keys())
+
+
+@event.listens_for(db.session, "after_flush_postexec")
+def _expire_user_credits(session: Session, _: Any) -> None:
+    """Expires the credit of all loaded users whose credit has been changed, so it gets reloaded on next access."""
+    _expire_credits(session, session.info.pop("credit_changed_user_ids", ()))
+
+
+def add_to_user_credits(deltas: Dict[int, int]) -> None:
+    """Adds the given deltas to the persisted user credits. This is only required for rows which are inserted in
+    bulk and therefore bypass the session hooks above.
+
+    :param deltas: A dictionary mapping user ids to their credit delta.
+
+    :return:       None
+    """
+    deltas = {user_id: delta for user_id, delta in deltas.items() if delta != 0}
+    _execute_credit_update(db.session, deltas)
+    _expire_credits(db.session, deltas.keys())
+
+
+def credit_expression(user_id: Any) -> Any:
+    """Returns an SQL expression which calculates the credit of a user from the full history of all purchases,
+    deposits and replenishmentcollections. This is the reference the persisted "users.credit" column is checked
+    against.
+
+    :param user_id: The user id (or a column containing it).
+
+    :return:        The SQL expression for the credit.
+    """
+    # NOTE: func.coalesce(a, b) returns the first non-null value of (a, b). If there aren't any purchases
+    #       (or deposits, ...) yet, the purchase (deposit, ...) sum is NULL. In this case, 0 gets returned.
+    purchase_sum = (
+        select([func.coalesce(func.sum(Purchase.price), 0)])
+        .where(Purchase.user_id == user_id)
+        .where(Purchase.revoked.is_(False))
+        .as_scalar()
+    )
+    deposit_sum = (
+        select([func.coalesce(func.sum(Deposit.amount), 0)])
+        .where(Deposit.user_id == user_id)
+        .where(Deposit.revoked.is_(False))
+        .as_scalar()
+    )
+    replenishmentcollection_sum = (
+        select([func.coalesce(func.sum(ReplenishmentCollection.price), 0)])
+        .where(ReplenishmentCollection.seller_id == user_id)
+        .where(ReplenishmentCollection.revoked.is_(False))
+        .as_scalar()
+    )
+    return replenishmentcollection_sum + deposit_sum - purchase_sum
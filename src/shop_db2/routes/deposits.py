@@ -12,6 +12,7 @@ from shop_db2.api import app, db
 from shop_db2.helpers.decorators import adminRequired
 from shop_db2.helpers.deposits import insert_deposit
 from shop_db2.helpers.query import QueryFromRequestParameters
+from shop_db2.helpers.serializers import json_list_response
 from shop_db2.helpers.updater import generic_update
 from shop_db2.helpers.utils import convert_minimal, json_body
 from shop_db2.helpers.validators import check_fields_and_types
@@ -29,9 +30,10 @@ def list_deposits(admin):
     """
     fields = ["id", "timestamp", "user_id", "amount", "comment", "revoked", "admin_id"]
     query = QueryFromRequestParameters(Deposit, request.args, fields)
-    result, content_range = query.result()
-    response = jsonify(convert_minimal(result, fields))
-    response.headers["Content-Range"] = content_range
+    # Unpaginated lists can be very long, so they are streamed
+    result, headers = query.result(stream=True)
+    response = json_list_response(result, fields)
+    response.headers.extend(headers)
     return response
 
 
@@ -2,61 +2,73 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
-from flask import jsonify
+import datetime
+from typing import Dict, Optional, Tuple
 
+from flask import jsonify, request
+
+import shop_db2.exceptions as exc
 from shop_db2.api import app
 from shop_db2.helpers.decorators import adminRequired
-from shop_db2.helpers.stocktakings import _get_balance_between_stocktakings
-from shop_db2.models import Deposit, Purchase, ReplenishmentCollection, StocktakingCollection
-
-
-@app.route("/financial_overview", methods=["GET"])
-@adminRequired
-def get_financial_overview(admin):
-    """The financial status of the entire project can be retrieved via this route.
-    All purchases, deposits and replenishmentcollections are
-    used for this purpose. The items are cleared once to a number indicating
-    whether the community has debt or surplus money. In addition, the
-    individual items are returned separately in order to get a better
-    breakdown of the items.
-
-    :param admin: Is the administrator user, determined by @adminRequired.
-
-    :return:      A dictionary with the individually calculated values.
+from shop_db2.helpers.financial_overview import get_financial_overview_buckets, get_financial_overview_series
+from shop_db2.models.financial_rollup import (
+    DEPOSIT_IN,
+    DEPOSIT_OUT,
+    PURCHASE_INCOME,
+    PURCHASE_REFUND,
+    REPLENISHMENT_INCOME,
+    REPLENISHMENT_SPENDING,
+    STOCKTAKING_LOSS,
+    STOCKTAKING_PROFIT,
+)
+
+
+def _get_time_range() -> Tuple[Optional[datetime.datetime], Optional[datetime.datetime]]:
+    """Returns the optional time range of the request arguments:
+    - start_date:          Is the unix timestamp of the start date.
+    - end_date:            Is the unix timestamp of the end date.
+
+    :raises WrongType:     If the request args are invalid.
+    :raises InvalidData:   If the start date lies after the end date.
+
+    :return:               The start and the end of the time range. Missing
+                           boundaries are None.
     """
-    # Query all purchases,
-    purchases = Purchase.query.filter(Purchase.revoked.is_(False)).all()
+    try:
+        start = request.args.get("start_date")
+        if start:
+            start = datetime.datetime.fromtimestamp(int(start))
+        end = request.args.get("end_date")
+        if end:
+            end = datetime.datetime.fromtimestamp(int(end))
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise exc.WrongType()
+
+    # Check whether start lies before end date
+    if start and end:
+        if not start <= end:
+            raise exc.InvalidData()
 
-    # Query all deposits.
-    deposits = Deposit.query.filter(Deposit.revoked.is_(False)).all()
+    return start or None, end or None
 
-    # Query all replenishment collections.
-    replcolls = ReplenishmentCollection.query.filter(ReplenishmentCollection.revoked.is_(False)).all()
 
-    # Get the balance between the first and the last stocktaking.
-    # If there is no stocktaking or only one stocktaking, the balance is 0.
-    stock_first = StocktakingCollection.query.order_by(StocktakingCollection.id).first()
-    stock_last = StocktakingCollection.query.order_by(StocktakingCollection.id.desc()).first()
+def _build_financial_overview(buckets: Dict[str, int]) -> Dict:
+    """Clears the income and expense buckets to the financial overview.
 
-    if not all([stock_first, stock_last]) or stock_first is stock_last:
-        pos_stock = 0
-        neg_stock = 0
-    else:
-        balance = _get_balance_between_stocktakings(stock_first, stock_last)
-        pos_stock = balance["profit"]
-        neg_stock = balance["loss"]
+    :param buckets: Is the dictionary with the sums of all rollup categories.
 
+    :return:        A dictionary with the total balance and the individual
+                    incomes and expenses.
+    """
     # Incomes are:
     # - Purchases                    with a positive price
     # - Deposits                     with a positive amount
     # - Replenishmentcollections     with a negative price
     # - Profits between stocktakings
-
-    pos_pur = sum(map(abs, list(filter(lambda x: x >= 0, list(map(lambda x: x.price, purchases))))))
-
-    pos_dep = sum(map(abs, list(filter(lambda x: x >= 0, list(map(lambda x: x.amount, deposits))))))
-
-    neg_rep = sum(map(abs, list(filter(lambda x: x < 0, list(map(lambda x: x.price, replcolls))))))
+    pos_pur = buckets[PURCHASE_INCOME]
+    pos_dep = buckets[DEPOSIT_IN]
+    neg_rep = buckets[REPLENISHMENT_INCOME]
+    pos_stock = buckets[STOCKTAKING_PROFIT]
 
     sum_incomes = sum([pos_pur, pos_dep, neg_rep, pos_stock])
 
@@ -76,11 +88,10 @@ def get_financial_overview(admin):
     # - Turnovers                with a negative amount
     # - Replenishmentcollections with a positive price
     # - Losses between stocktakings
-    neg_pur = sum(map(abs, list(filter(lambda x: x < 0, list(map(lambda x: x.price, purchases))))))
-
-    neg_dep = sum(map(abs, list(filter(lambda x: x < 0, list(map(lambda x: x.amount, deposits))))))
-
-    pos_rep = sum(map(abs, list(filter(lambda x: x >= 0, list(map(lambda x: x.price, replcolls))))))
+    neg_pur = buckets[PURCHASE_REFUND]
+    neg_dep = buckets[DEPOSIT_OUT]
+    pos_rep = buckets[REPLENISHMENT_SPENDING]
+    neg_stock = buckets[STOCKTAKING_LOSS]
 
     sum_expenses = sum([neg_pur, neg_dep, pos_rep, neg_stock])
 
@@ -97,9 +108,65 @@ def get_financial_overview(admin):
     # The total balance is calculated as incomes minus expenses.
     total_balance = sum_incomes - sum_expenses
 
-    financial_overview = {
+    return {
         "total_balance": total_balance,
         "incomes": incomes,
         "expenses": expenses,
     }
-    return jsonify(financial_overview), 200
+
+
+@app.route("/financial_overview", methods=["GET"])
+@adminRequired
+def get_financial_overview(admin):
+    """The financial status of the entire project can be retrieved via this route.
+    All purchases, deposits and replenishmentcollections are
+    used for this purpose. The items are cleared once to a number indicating
+    whether the community has debt or surplus money. In addition, the
+    individual items are returned separately in order to get a better
+    breakdown of the items.
+    The overview can be restricted to a time range (e.g. a fiscal period)
+    with optional request arguments:
+    - start_date:          Is the unix timestamp of the start date.
+    - end_date:            Is the unix timestamp of the end date.
+    Both days are included completely.
+
+    :param admin:          Is the administrator user, determined by
+                           @adminRequired.
+
+    :raises WrongType:     If the request args are invalid.
+    :raises InvalidData:   If the start date lies after the end date.
+
+    :return:               A dictionary with the individually calculated values.
+    """
+    start, end = _get_time_range()
+    buckets = get_financial_overview_buckets(start, end)
+    return jsonify(_build_financial_overview(buckets)), 200
+
+
+@app.route("/financial_overview/series", methods=["GET"])
+@adminRequired
+def get_financial_overview_time_series(admin):
+    """Returns the financial overview for each period of a time series.
+    There are optional request arguments:
+    - bucket:              Is the length of a period, either "day", "month"
+                           (default) or "year".
+    - start_date:          Is the unix timestamp of the start date.
+    - end_date:            Is the unix timestamp of the end date.
+    The stocktaking profit and loss of a period are the sums of the balances
+    between all consecutive stocktakingcollections ending in this period.
+
+    :param admin:          Is the administrator user, determined by
+                           @adminRequired.
+
+    :raises WrongType:     If the request args are invalid.
+    :raises InvalidData:   If the bucket is unknown or the start date lies
+                           after the end date.
+
+    :return:               A list with the financial overview of each period,
+                           in chronological order. Periods without any
+                           entries are omitted.
+    """
+    start, end = _get_time_range()
+    bucket = request.args.get("bucket", "month")
+    series = get_financial_overview_series(bucket, start, end)
+    return jsonify([dict(_build_financial_overview(buckets), bucket=key) for key, buckets in series.items()]), 200
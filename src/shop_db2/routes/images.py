@@ -2,12 +2,30 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
-import os
+from typing import Optional
 
-from flask import send_from_directory
+from flask import request, send_from_directory
+from werkzeug.exceptions import NotFound
 
 import shop_db2.exceptions as exc
 from shop_db2.api import app
+from shop_db2.helpers.uploads import DEFAULT_IMAGE, get_thumbnail_size, thumbnail_folder
+
+# Uploaded images never change, because their names are derived from their content (see "helpers/uploads.py").
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def _requested_size() -> Optional[int]:
+    """Returns the requested edge length of the image (query parameter "size") or None, if it is not given.
+
+    :raises InvalidQueryParameters: If the size is not a positive integer.
+    """
+    size = request.args.get("size")
+    if size is None:
+        return None
+    if not size.isdecimal() or int(size) == 0:
+        raise exc.InvalidQueryParameters()
+    return int(size)
 
 
 @app.route("/images", methods=["GET"], defaults={"imagename": None})
@@ -16,14 +34,42 @@ def get_image(imagename: str):
     """A picture can be requested via this route. If the image is not found or if
     the image name is empty, a default image will be returned.
 
-    :param imagename: Is the name of the requested image.
+    With the query parameter "size", the smallest thumbnail which is at least as
+    large as the requested size is returned instead. If there is no such
+    thumbnail, the original image is returned.
+
+    Uploaded images can be cached forever by the clients. The default image may
+    change with an update, so it has to be revalidated.
 
-    :return:          The requested image or the default image, if applicable.
+    :param imagename:               Is the name of the requested image.
+
+    :return:                        The requested image or the default image, if applicable.
+
+    :raises EntryNotFound:          If the image does not exist.
+    :raises InvalidQueryParameters: If the requested size is invalid.
     """
-    if not imagename:
-        return send_from_directory(app.config["UPLOAD_FOLDER"], "default.png")
-    else:
-        if os.path.isfile(app.config["UPLOAD_FOLDER"] + imagename):
-            return send_from_directory(app.config["UPLOAD_FOLDER"], imagename)
-        else:
-            raise exc.EntryNotFound()
+    size = _requested_size()
+    filename = imagename or DEFAULT_IMAGE
+    immutable = filename != DEFAULT_IMAGE
+    thumbnail_size = get_thumbnail_size(size) if size is not None else None
+
+    response = None
+    if thumbnail_size is not None:
+        try:
+            response = send_from_directory(thumbnail_folder(thumbnail_size), filename, add_etags=not immutable)
+        except NotFound:
+            # Images which are smaller than the thumbnail or have not been processed yet
+            thumbnail_size = None
+    if response is None:
+        try:
+            response = send_from_directory(app.config["UPLOAD_FOLDER"], filename, add_etags=not immutable)
+        except NotFound as error:
+            raise exc.EntryNotFound() from error
+
+    if not immutable:
+        response.headers["Cache-Control"] = "no-cache"
+        return response.make_conditional(request)
+
+    response.set_etag(filename if thumbnail_size is None else f"{filename}-{thumbnail_size}")
+    response.headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    return response.make_conditional(request)
@@ -2,10 +2,11 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
+import calendar
 import datetime
 
 import jwt
-from flask import jsonify
+from flask import jsonify, request
 
 import shop_db2.exceptions as exc
 from shop_db2.api import app, bcrypt
@@ -58,13 +59,85 @@ def login():
     if not bcrypt.check_password_hash(user.password, str(data["password"])):
         raise exc.InvalidCredentials()
 
+    # Return the result.
+    return jsonify({"result": True, "token": _create_token(user, datetime.datetime.utcnow())}), 200
+
+
+@app.route("/login/refresh", methods=["POST"], endpoint="login_refresh")
+def refresh_login():
+    """A valid token can be exchanged for a new one on this route without
+    checking the password again. This is possible until the refresh window
+    since the original login has passed, afterwards the user has to log in
+    again.
+
+    :return:                    A new temporary valid token.
+
+    :raises UnauthorizedAccess: If no token object can be found in the request
+                                header.
+    :raises TokenIsInvalid:     If the token cannot be decoded or does not
+                                contain a user and a login time.
+    :raises TokenHasExpired:    If the token or the refresh window has been
+                                expired.
+    :raises InvalidCredentials: If the user does not exist anymore.
+    :raises UserIsNotVerified:  If the user has not yet been verified.
+    :raises UserIsInactive:     If the user is inactive.
+    """
+    # Does the request header contain a token?
+    try:
+        token = request.headers["token"]
+    except KeyError as error:
+        raise exc.UnauthorizedAccess() from error
+
+    # Is the token valid?
+    try:
+        data = jwt.decode(token, app.config["SECRET_KEY"])
+    except jwt.exceptions.DecodeError as error:
+        raise exc.TokenIsInvalid() from error
+    except jwt.ExpiredSignatureError as error:
+        raise exc.TokenHasExpired() from error
+
+    try:
+        user_id = data["user"]["id"]
+        login_time = datetime.datetime.utcfromtimestamp(data["login"])
+    except (KeyError, TypeError, ValueError, OverflowError) as error:
+        raise exc.TokenIsInvalid() from error
+
+    # Has the refresh window been expired?
+    window = datetime.timedelta(minutes=app.config.get("TOKEN_REFRESH_WINDOW_MINUTES", 7 * 24 * 60))
+    if datetime.datetime.utcnow() > login_time + window:
+        raise exc.TokenHasExpired()
+
+    # The state of the user may have changed since the login.
+    user = User.query.filter_by(id=user_id).first()
+    if not user:
+        raise exc.InvalidCredentials()
+
+    if not user.is_verified:
+        raise exc.UserIsNotVerified()
+
+    if not user.active:
+        raise exc.UserIsInactive()
+
+    return jsonify({"result": True, "token": _create_token(user, login_time)}), 200
+
+
+def _create_token(user: User, login_time: datetime.datetime) -> str:
+    """Creates a token for the user, which is valid for the configured token
+    lifetime.
+
+    :param user:       Is the user who logged in.
+    :param login_time: Is the time of the login with the password. It is
+                       kept in all refreshed tokens to limit the refresh
+                       window.
+
+    :return:           The encoded token.
+    """
     # Create a dictionary object of the user.
     fields = ["id", "firstname", "lastname", "credit", "is_admin"]
     d_user = convert_minimal(user, fields)[0]
 
     # Create a token.
-    exp = datetime.datetime.utcnow() + datetime.timedelta(minutes=60)
-    token = jwt.encode({"user": d_user, "exp": exp}, app.config["SECRET_KEY"])
-
-    # Return the result.
-    return jsonify({"result": True, "token": token.decode("UTF-8")}), 200
+    exp = datetime.datetime.utcnow() + datetime.timedelta(minutes=app.config.get("TOKEN_LIFETIME_MINUTES", 60))
+    login = calendar.timegm(login_time.utctimetuple())
+    token = jwt.encode({"user": d_user, "exp": exp, "login": login}, app.config["SECRET_KEY"])
+    return token.decode("UTF-8")
@@ -2,22 +2,26 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
+from typing import Optional
+
 from flask import jsonify, request
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 
 import shop_db2.exceptions as exc
 import shop_db2.helpers.products as product_helpers
 from shop_db2.api import app, db
-from shop_db2.helpers.decorators import adminOptional, adminRequired
+from shop_db2.helpers.decorators import adminOptional, adminRequired, etag_from_tables
 from shop_db2.helpers.query import QueryFromRequestParameters
 from shop_db2.helpers.updater import generic_update
 from shop_db2.helpers.utils import convert_minimal, json_body
 from shop_db2.helpers.validators import check_fields_and_types
-from shop_db2.models import Product, Tag, product_tag_assignments
+from shop_db2.models import Product, Tag, User, product_tag_assignments
 
 
 @app.route("/products", methods=["GET"])
 @adminOptional
+@etag_from_tables("products", "productprices", "purchases", "replenishments", "uploads", "product_tag_assignments")
 def list_products(admin):
     """Returns a list of all products.
 
@@ -41,13 +45,14 @@ def list_products(admin):
         "creation_date",
     ]
 
-    query = QueryFromRequestParameters(Product, request.args, fields)
-    result, content_range = query.result()
+    # The tags of all listed products are loaded with a single query
+    query = QueryFromRequestParameters(Product, request.args, fields).options(selectinload(Product.tags))
+    result, headers = query.result()
     products = convert_minimal(result, fields)
     for product in products:
         product["tags"] = [t.id for t in product["tags"]]
     response = jsonify(products)
-    response.headers["Content-Range"] = content_range
+    response.headers.extend(headers)
     return response
 
 
@@ -126,25 +131,15 @@ def create_product(admin):
     return jsonify({"message": "Created Product."}), 201
 
 
-@app.route("/products/<int:product_id>", methods=["GET"])
-@adminOptional
-def get_product(admin, product_id):
-    """Returns the product with the requested id.
-
-    :param admin:               Is the administrator user, determined by
-                                @adminOptional.
-    :param product_id:          Is the product id.
+def _convert_product(product: Product, admin: Optional[User]) -> dict:
+    """Converts a product into a dictionary. Non-administrators only get the
+    basic information of inactive products.
 
-    :return:                    The requested product as JSON object.
+    :param product: Is the product to be converted.
+    :param admin:   Is the administrator user or None.
 
-    :raises EntryNotFound:      If the product with this ID does not exist.
-    :raises UnauthorizedAccess: If the product is inactive and the request
-                                does not come from an administrator.
+    :return:        The product as dictionary.
     """
-    product = Product.query.filter(Product.id == product_id).first()
-    if not product:
-        raise exc.EntryNotFound()
-
     if not product.active and not admin:
         fields = [
             "id",
@@ -178,7 +173,65 @@ def get_product(admin, product_id):
     # Convert the product tags
     product["tags"] = [t.id for t in product["tags"]]
 
-    return jsonify(product), 200
+    return product
+
+
+@app.route("/products/<int:product_id>", methods=["GET"])
+@adminOptional
+def get_product(admin, product_id):
+    """Returns the product with the requested id.
+
+    :param admin:               Is the administrator user, determined by
+                                @adminOptional.
+    :param product_id:          Is the product id.
+
+    :return:                    The requested product as JSON object.
+
+    :raises EntryNotFound:      If the product with this ID does not exist.
+    :raises UnauthorizedAccess: If the product is inactive and the request
+                                does not come from an administrator.
+    """
+    product = Product.query.filter(Product.id == product_id).first()
+    if not product:
+        raise exc.EntryNotFound()
+
+    return jsonify(_convert_product(product, admin)), 200
+
+
+@app.route("/products/barcode/<string:barcode>", methods=["GET"])
+@adminOptional
+def get_product_by_barcode(admin, barcode):
+    """Returns the product with exactly the requested barcode. The product
+    and its tags are loaded with a single query.
+
+    :param admin:               Is the administrator user, determined by
+                                @adminOptional.
+    :param barcode:             Is the barcode of the product.
+
+    :return:                    The requested product as JSON object.
+
+    :raises EntryNotFound:      If there is no product with this barcode.
+    """
+    product = product_helpers.get_product_by_barcode(barcode, joinedload(Product.tags))
+    return jsonify(_convert_product(product, admin)), 200
+
+
+@app.route("/products/stock", methods=["GET"])
+def list_product_stocks():
+    """Returns the theoretical stock levels of all countable products. The products can be filtered, sorted
+    and paginated with the same query parameters as the product list.
+
+    The stock levels of all products are determined with a fixed number of queries.
+
+    :return: A dictionary mapping the product ids to their theoretical stock level.
+    """
+    fields = ["id", "name", "barcode", "active"]
+    query = QueryFromRequestParameters(Product, request.args, fields).filter(Product.countable.is_(True))
+    result, headers = query.result()
+    stocks = product_helpers.get_theoretical_stock_of_products([product.id for product in result])
+    response = jsonify({product.id: stocks[product.id] for product in result})
+    response.headers.extend(headers)
+    return response
 
 
 @app.route("/products/<int:product_id>/stock", methods=["GET"])
@@ -13,8 +13,9 @@ from sqlalchemy.sql import exists
 import shop_db2.exceptions as exc
 from shop_db2.api import app, db
 from shop_db2.helpers.decorators import adminOptional
-from shop_db2.helpers.purchases import insert_purchase
+from shop_db2.helpers.purchases import insert_purchases
 from shop_db2.helpers.query import QueryFromRequestParameters
+from shop_db2.helpers.serializers import json_list_response
 from shop_db2.helpers.updater import generic_update
 from shop_db2.helpers.utils import convert_minimal, json_body
 from shop_db2.models import Purchase, PurchaseRevoke
@@ -50,9 +51,10 @@ def list_purchases(admin: None):
     if admin is None:
         query = query.filter(~exists().where(PurchaseRevoke.purchase_id == Purchase.id))
 
-    result, content_range = query.result()
-    response = jsonify(convert_minimal(result, fields))
-    response.headers["Content-Range"] = content_range
+    # Unpaginated lists can be very long, so they are streamed
+    result, headers = query.result(stream=True)
+    response = json_list_response(result, fields)
+    response.headers.extend(headers)
     return response
 
 
@@ -81,10 +83,9 @@ def create_purchase(admin: Optional[User]):
 
     # It is allowed to create multiple purchases at once
     if isinstance(data, list):
-        for purchase in data:
-            insert_purchase(admin, purchase)
+        insert_purchases(admin, data)
     else:
-        insert_purchase(admin, data)
+        insert_purchases(admin, [data])
 
     try:
         db.session.commit()
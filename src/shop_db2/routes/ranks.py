@@ -9,7 +9,7 @@ from sqlalchemy.exc import IntegrityError
 
 import shop_db2.exceptions as exc
 from shop_db2.api import app, db
-from shop_db2.helpers.decorators import adminRequired
+from shop_db2.helpers.decorators import adminRequired, etag_from_tables
 from shop_db2.helpers.query import QueryFromRequestParameters
 from shop_db2.helpers.updater import generic_update
 from shop_db2.helpers.utils import convert_minimal, json_body
@@ -18,6 +18,7 @@ from shop_db2.models import Rank
 
 
 @app.route("/ranks", methods=["GET"])
+@etag_from_tables("ranks")
 def list_ranks():
     """Returns a list of all ranks.
 
@@ -25,9 +26,9 @@ def list_ranks():
     """
     fields = ["id", "name", "debt_limit", "is_system_user"]
     query = QueryFromRequestParameters(Rank, request.args, fields)
-    result, content_range = query.result()
+    result, headers = query.result()
     response = jsonify(convert_minimal(result, fields))
-    response.headers["Content-Range"] = content_range
+    response.headers.extend(headers)
     return response
 
 
@@ -11,6 +11,7 @@ import shop_db2.exceptions as exc
 from shop_db2.api import app, db
 from shop_db2.helpers.decorators import adminRequired
 from shop_db2.helpers.query import QueryFromRequestParameters
+from shop_db2.helpers.serializers import json_list_response
 from shop_db2.helpers.updater import generic_update
 from shop_db2.helpers.utils import convert_minimal, json_body, parse_timestamp
 from shop_db2.helpers.validators import check_fields_and_types
@@ -28,9 +29,9 @@ def list_replenishmentcollections(admin):
     """
     fields = ["id", "timestamp", "admin_id", "seller_id", "price", "revoked", "comment"]
     query = QueryFromRequestParameters(ReplenishmentCollection, request.args, fields)
-    result, content_range = query.result()
+    result, headers = query.result()
     response = jsonify(convert_minimal(result, fields))
-    response.headers["Content-Range"] = content_range
+    response.headers.extend(headers)
     return response
 
 
@@ -45,9 +46,10 @@ def list_replenishments(admin):
     """
     fields = ["id", "product_id", "amount", "total_price", "revoked"]
     query = QueryFromRequestParameters(Replenishment, request.args, fields)
-    result, content_range = query.result()
-    response = jsonify(convert_minimal(result, fields))
-    response.headers["Content-Range"] = content_range
+    # Unpaginated lists can be very long, so they are streamed
+    result, headers = query.result(stream=True)
+    response = json_list_response(result, fields)
+    response.headers.extend(headers)
     return response
 
 
@@ -50,11 +50,12 @@ def get_stocktakingcollection_template():
     if not products:
         raise exc.EntryNotFound()
 
+    # Get the theoretical stock levels of all products at once
+    stocks = product_helpers.get_theoretical_stock_of_products([product.id for product in products])
+
     rows = []
     for product in products:
-        product_name = product.name
-        theoretical_stock = product_helpers.get_theoretical_stock_of_product(product.id)
-        rows.append({"product_name": product_name, "theoretical_stock": theoretical_stock})
+        rows.append({"product_name": product.name, "theoretical_stock": stocks[product.id]})
 
     # Render the template
     rendered = render_template("stocktakingcollections_template.html", rows=rows)
@@ -111,9 +112,9 @@ def list_stocktakingcollections(admin):
     """
     fields = ["id", "timestamp", "admin_id", "revoked"]
     query = QueryFromRequestParameters(StocktakingCollection, request.args, fields)
-    result, content_range = query.result()
+    result, headers = query.result()
     response = jsonify(convert_minimal(result, fields))
-    response.headers["Content-Range"] = content_range
+    response.headers.extend(headers)
     return response
 
 
@@ -8,17 +8,18 @@ from flask import jsonify, request
 from sqlalchemy.exc import IntegrityError
 
 import shop_db2.exceptions as exc
-from shop_db2.api import app, bcrypt, db
-from shop_db2.helpers.decorators import adminOptional, adminRequired, checkIfUserIsValid
+from shop_db2.api import app, db
+from shop_db2.helpers.decorators import adminOptional, adminRequired, checkIfUserIsValid, etag_from_tables
 from shop_db2.helpers.query import QueryFromRequestParameters
 from shop_db2.helpers.updater import generic_update
-from shop_db2.helpers.users import insert_user
+from shop_db2.helpers.users import hash_password, insert_user
 from shop_db2.helpers.utils import convert_minimal, json_body
 from shop_db2.models import User
 
 
 @app.route("/users", methods=["GET"])
 @adminOptional
+@etag_from_tables("users", "ranks", "uploads")
 def list_users(admin: None):
     """Returns a list of all users. If this route is called by an
     administrator, all information is returned. However, if it is called
@@ -57,9 +58,9 @@ def list_users(admin: None):
             .filter(User.is_system_user.is_(False))
         )
 
-    result, content_range = query.result()
+    result, headers = query.result()
     response = jsonify(convert_minimal(result, fields))
-    response.headers["Content-Range"] = content_range
+    response.headers.extend(headers)
     return response
 
 
@@ -234,7 +235,7 @@ def update_user(admin: shop_db2.models.user.User, user_id: int):
 
         # Convert the password into a salted hash
         # DONT YOU DARE TO REMOVE THIS LINE
-        data["password"] = bcrypt.generate_password_hash(data["password"])
+        data["password"] = hash_password(data["password"])
         # DONT YOU DARE TO REMOVE THIS LINE
 
         # All fine, delete repeat_password from the dict and do the rest of the update
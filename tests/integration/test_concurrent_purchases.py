@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+from typing import List
+
+from flask import Flask, json
+
+from shop_db2.api import app, db, set_app
+from shop_db2.helpers.financial_overview import get_inconsistent_financial_rollups
+from shop_db2.helpers.users import get_inconsistent_user_credits
+from shop_db2.models import Product, Purchase, User
+from tests.base import user_data
+from tests.base_api import BaseAPITestCase
+
+import configuration as config  # isort: skip
+
+WORKERS = 4
+PURCHASES_PER_WORKER = 25
+USER_IDS = [1, 2, 3, 5]
+
+
+def _purchase_worker(database_uri: str, token: str, worker: int) -> List[int]:
+    """Inserts purchases via the API in a separate process, which shares the database file with all other workers.
+
+    :return: The status codes of all requests.
+    """
+    set_app(config.UnittestConfig)
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_uri
+    client = app.test_client()
+    headers = {"content-type": "application/json", "token": token}
+    status_codes = []
+    with app.app_context():
+        for index in range(PURCHASES_PER_WORKER):
+            data = {"user_id": USER_IDS[(worker + index) % len(USER_IDS)], "product_id": 1, "amount": 1}
+            res = client.post("/purchases", data=json.dumps(data), headers=headers)
+            status_codes.append(res.status_code)
+    return status_codes
+
+
+class ConcurrentPurchasesTestCase(BaseAPITestCase):
+    def create_app(self) -> Flask:
+        self.directory = tempfile.mkdtemp()
+        self.database_uri = "sqlite:///" + os.path.join(self.directory, "shop.db")
+        set_app(config.UnittestConfig)
+        app.config["SQLALCHEMY_DATABASE_URI"] = self.database_uri
+        return app
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        db.get_engine().dispose()
+        shutil.rmtree(self.directory)
+
+    def test_concurrent_purchases(self) -> None:
+        """Several worker processes insert purchases at the same time. No purchase may get lost and the credits of
+        all users must match their purchases.
+        """
+        res = self.post(url="/login", data={"id": 1, "password": user_data[0]["password"]})
+        token = json.loads(res.data)["token"]
+        credits = {user.id: user.credit for user in User.query.filter(User.id.in_(USER_IDS)).all()}
+        price = Product.query.filter_by(id=1).first().price
+        db.session.commit()
+
+        context = multiprocessing.get_context("spawn")
+        with context.Pool(WORKERS) as pool:
+            results = pool.starmap(_purchase_worker, [(self.database_uri, token, worker) for worker in range(WORKERS)])
+
+        self.assertEqual([code for codes in results for code in codes], [200] * WORKERS * PURCHASES_PER_WORKER)
+
+        db.session.expire_all()
+        self.assertEqual(Purchase.query.count(), WORKERS * PURCHASES_PER_WORKER)
+        for user in User.query.filter(User.id.in_(USER_IDS)).all():
+            count = Purchase.query.filter_by(user_id=user.id).count()
+            self.assertEqual(user.credit, credits[user.id] - count * price)
+        self.assertEqual(get_inconsistent_user_credits(), [])
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+from flask import json
+
+from shop_db2.api import db
+from shop_db2.models import Deposit, Purchase, Tag
+from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
+
+
+class ConditionalRequestsAPITestCase(BaseAPITestCase):
+    def _get(self, url: str, etag: str = None):
+        headers = {"If-None-Match": f'"{etag}"'} if etag is not None else {}
+        return self.client.get(url, headers=headers)
+
+    def test_not_modified_lists(self) -> None:
+        """A list which has not changed must be answered with 304 without querying it"""
+        for url in [
+            "/products",
+            "/tags",
+            "/ranks",
+            "/users",
+            "/products?sort=%7B%22field%22%3A%22name%22%2C%22order%22%3A%22ASC%22%7D",
+        ]:
+            res = self._get(url)
+            self.assertEqual(res.status_code, 200)
+            self.assertEqual(res.headers["Cache-Control"], "no-cache")
+            etag, _ = res.get_etag()
+
+            with record_statements() as statements:
+                res = self._get(url, etag)
+            self.assertEqual(res.status_code, 304)
+            self.assertEqual(res.data, b"")
+            self.assertEqual(res.get_etag(), (etag, False))
+            # Only the table versions have been queried
+            self.assertEqual(len(statements), 1)
+            self.assertIn("tableversions", statements[0])
+
+            # Weak and multiple ETags
+            res = self.client.get(url, headers={"If-None-Match": f'"foo", W/"{etag}"'})
+            self.assertEqual(res.status_code, 304)
+            self.assertEqual(self._get(url, "foo").status_code, 200)
+
+    def test_etags_depend_on_the_query_parameters(self) -> None:
+        """Different query parameters must result in different ETags"""
+        etag, _ = self._get("/tags").get_etag()
+        res = self._get('/tags?filter={"name": "Food"}', etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(json.loads(res.data)), 1)
+        self.assertNotEqual(res.get_etag()[0], etag)
+
+    def test_etags_change_with_the_data(self) -> None:
+        """Changes of a table must change the ETags of all lists which depend on it, but no others"""
+        etags = {url: self._get(url).get_etag()[0] for url in ["/products", "/tags", "/ranks", "/users"]}
+
+        # Deposits are not listed at all
+        db.session.add(Deposit(user_id=1, amount=100, admin_id=1, comment="Foo"))
+        db.session.commit()
+        for url, etag in etags.items():
+            self.assertEqual(self._get(url, etag).status_code, 304)
+
+        # Purchases change the product list, the user credits are not visible for non-administrators
+        db.session.add(Purchase(user_id=1, product_id=1, amount=1))
+        db.session.commit()
+        self.assertEqual(self._get("/tags", etags["/tags"]).status_code, 304)
+        self.assertEqual(self._get("/ranks", etags["/ranks"]).status_code, 304)
+        res = self._get("/products", etags["/products"])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)[0]["purchase_sum"], 300)
+
+        # Changes via the API
+        etag, _ = self._get("/tags").get_etag()
+        self.assertEqual(self.put(url="/tags/1", data={"name": "Bread"}, role="admin").status_code, 201)
+        res = self._get("/tags", etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)[0]["name"], "Bread")
+
+        # Changes without the ORM
+        etag, _ = res.get_etag()
+        db.session.execute(Tag.__table__.update().where(Tag.id == 1).values(name="Cake"))
+        db.session.commit()
+        self.assertEqual(self._get("/tags", etag).status_code, 200)
+
+    def test_no_etags_for_administrators(self) -> None:
+        """Administrators get all users including their credits, so these lists are always sent in full"""
+        res = self.get(url="/users", role="admin")
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn("ETag", res.headers)
+
+        # Failed requests don't have an ETag
+        res = self._get("/tags?sort=foo")
+        self.assertNotIn("ETag", res.headers)
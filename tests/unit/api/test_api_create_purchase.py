@@ -9,8 +9,10 @@ from flask import json
 
 import shop_db2.exceptions as exc
 from shop_db2.api import db
+from shop_db2.helpers.users import get_inconsistent_user_credits
 from shop_db2.models import Product, Purchase, Rank, Tag, User
 from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
 
 
 class CreatePurchaseAPITestCase(BaseAPITestCase):
@@ -126,6 +128,39 @@ class CreatePurchaseAPITestCase(BaseAPITestCase):
         purchases = Purchase.query.all()
         self.assertEqual(0, len(purchases))
 
+    def test_create_multiple_purchases_insufficient_credit(self) -> None:
+        """The debt limit must be checked against the sum of all purchases of a user in the batch, even if each
+        single purchase would not exceed it.
+        """
+        data = [
+            {"user_id": 2, "product_id": 3, "amount": 6},
+            {"user_id": 1, "product_id": 3, "amount": 1},
+            {"user_id": 2, "product_id": 3, "amount": 6},
+        ]
+        res = self.post(url="/purchases", data=data)
+        self.assertException(res, exc.InsufficientCredit)
+        self.assertEqual(0, len(Purchase.query.all()))
+
+        # Each of these purchases can be inserted on its own.
+        res = self.post(url="/purchases", data=data[:2])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(User.query.filter_by(id=1).first().credit, -100)
+        self.assertEqual(User.query.filter_by(id=2).first().credit, -600)
+
+    def test_create_multiple_purchases_with_a_constant_number_of_queries(self) -> None:
+        """Inserting a batch of purchases must not cost any additional queries per purchase."""
+        statement_counts = []
+        for count in [10, 1000]:
+            data = [{"user_id": 1 + index % 3, "product_id": 1 + index % 4, "amount": 1} for index in range(count)]
+            with record_statements() as statements:
+                res = self.post(url="/purchases", data=data, role="admin")
+            self.assertEqual(res.status_code, 200)
+            statement_counts.append(len(statements))
+
+        self.assertEqual(statement_counts[0], statement_counts[1])
+        self.assertEqual(Purchase.query.count(), 1010)
+        self.assertEqual(get_inconsistent_user_credits(), [])
+
     def test_create_purchase_with_timestamp_as_admin(self) -> None:
         """Creating a purchase with a timestamp as administrator"""
         data = {
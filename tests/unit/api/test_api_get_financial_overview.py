@@ -10,6 +10,7 @@ import shop_db2.exceptions as exc
 from shop_db2.api import db
 from shop_db2.models import Deposit, ProductPrice, Purchase, ReplenishmentCollection
 from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
 
 
 class GetFinancialOverviewAPITestCase(BaseAPITestCase):
@@ -170,3 +171,119 @@ class GetFinancialOverviewAPITestCase(BaseAPITestCase):
         self.assertEqual(api_incomes[2]["amount"], positive_replenishmentcollections_price)
         self.assertEqual(api_incomes[3]["name"], "Stocktakings")
         self.assertEqual(api_incomes[3]["amount"], loss_between_stocktakings)
+
+    def test_get_financial_overview_in_time_range(self) -> None:
+        """Only the purchases, deposits and replenishmentcollections within the
+        given time range may be taken into account.
+        """
+        ts = datetime.strptime("2018-01-01 09:00:00", "%Y-%m-%d %H:%M:%S")
+        db.session.add(Purchase(user_id=1, product_id=1, amount=1, timestamp=ts))  # 300
+        db.session.add(Deposit(user_id=1, admin_id=1, comment="Foo", amount=100, timestamp=ts))
+        ts = datetime.strptime("2018-02-01 09:00:00", "%Y-%m-%d %H:%M:%S")
+        db.session.add(Purchase(user_id=1, product_id=2, amount=2, timestamp=ts))  # 100
+        db.session.add(Deposit(user_id=1, admin_id=1, comment="Foo", amount=-50, timestamp=ts))
+        self.insert_default_replenishmentcollections()
+        ReplenishmentCollection.query.filter_by(id=1).first().timestamp = ts
+        ts = datetime.strptime("2018-03-01 09:00:00", "%Y-%m-%d %H:%M:%S")
+        db.session.add(Purchase(user_id=1, product_id=3, amount=3, timestamp=ts))
+        ReplenishmentCollection.query.filter_by(id=2).first().timestamp = ts
+        db.session.commit()
+
+        start = datetime.strptime("2018-01-15 00:00:00", "%Y-%m-%d %H:%M:%S")
+        end = datetime.strptime("2018-02-15 00:00:00", "%Y-%m-%d %H:%M:%S")
+        params = {"start_date": int(start.timestamp()), "end_date": int(end.timestamp())}
+        res = self.get(url="/financial_overview", params=params, role="admin")
+        self.assertEqual(res.status_code, 200)
+        overview = json.loads(res.data)
+        incomes = {item["name"]: item["amount"] for item in overview["incomes"]["items"]}
+        expenses = {item["name"]: item["amount"] for item in overview["expenses"]["items"]}
+        replcoll_price = ReplenishmentCollection.query.filter_by(id=1).first().price
+        self.assertEqual(incomes, {"Purchases": 100, "Deposits": 0, "Replenishments": 0, "Stocktakings": 0})
+        self.assertEqual(
+            expenses, {"Purchases": 0, "Deposits": 50, "Replenishments": replcoll_price, "Stocktakings": 0}
+        )
+        self.assertEqual(overview["total_balance"], 100 - 50 - replcoll_price)
+
+    def test_get_financial_overview_stocktakings(self) -> None:
+        """The stocktaking figures of the overview are the balance between the
+        first and the last stocktakingcollection, while the time series books
+        the balance of each pair of consecutive stocktakingcollections.
+        """
+        product_price = ProductPrice.query.filter_by(product_id=1).first().price
+        for month, count in [(1, 100), (2, 90), (3, 100)]:
+            stocktakings = [{"product_id": 1, "count": count}] + [
+                {"product_id": product_id, "count": 100} for product_id in [2, 3, 4]
+            ]
+            t = datetime(2018, month, 1, 9)
+            data = {"stocktakings": stocktakings, "timestamp": int(t.timestamp())}
+            res = self.post(url="/stocktakingcollections", data=data, role="admin")
+            self.assertEqual(res.status_code, 201)
+
+        def _stocktakings(overview):
+            return overview["incomes"]["items"][3]["amount"], overview["expenses"]["items"][3]["amount"]
+
+        res = self.get(url="/financial_overview", role="admin")
+        self.assertEqual(_stocktakings(json.loads(res.data)), (0, 0))
+
+        # Only the first two stocktakingcollections lie in the time range
+        end = datetime(2018, 2, 1)
+        res = self.get(url="/financial_overview", params={"end_date": int(end.timestamp())}, role="admin")
+        self.assertEqual(_stocktakings(json.loads(res.data)), (0, 10 * product_price))
+
+        res = self.get(url="/financial_overview/series", params={"bucket": "month"}, role="admin")
+        series = json.loads(res.data)
+        self.assertEqual([period["bucket"] for period in series], ["2018-02", "2018-03"])
+        self.assertEqual(
+            [_stocktakings(period) for period in series], [(0, 10 * product_price), (10 * product_price, 0)]
+        )
+
+    def test_get_financial_overview_invalid_time_range(self) -> None:
+        """The time range parameters must be valid unix timestamps and the start
+        date must not lie after the end date.
+        """
+        res = self.get(url="/financial_overview", params={"start_date": "foo"}, role="admin")
+        self.assertException(res, exc.WrongType)
+        res = self.get(url="/financial_overview", params={"start_date": 1000, "end_date": 10}, role="admin")
+        self.assertException(res, exc.InvalidData)
+
+    def test_get_financial_overview_with_a_constant_number_of_queries(self) -> None:
+        """The number of statements must not depend on the number of purchases,
+        deposits and replenishmentcollections.
+        """
+        self.insert_default_purchases()
+        self.insert_default_deposits()
+        self.insert_default_replenishmentcollections()
+        with record_statements() as statements:
+            self.get(url="/financial_overview", role="admin")
+
+        self.insert_default_purchases()
+        self.insert_default_deposits()
+        self.insert_default_replenishmentcollections()
+        with record_statements() as more_statements:
+            res = self.get(url="/financial_overview", role="admin")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(more_statements), len(statements))
+
+    def test_get_financial_overview_series(self) -> None:
+        """The financial overview can be split into monthly (or daily and yearly) periods."""
+        for month, amount in [(1, 100), (1, 200), (2, -50), (4, 300)]:
+            ts = datetime(2018, month, 10, 9)
+            db.session.add(Deposit(user_id=1, admin_id=1, comment="Foo", amount=amount, timestamp=ts))
+        db.session.commit()
+
+        res = self.get(url="/financial_overview/series", params={"bucket": "month"}, role="admin")
+        self.assertEqual(res.status_code, 200)
+        series = json.loads(res.data)
+        self.assertEqual([period["bucket"] for period in series], ["2018-01", "2018-02", "2018-04"])
+        self.assertEqual([period["total_balance"] for period in series], [300, -50, 300])
+        self.assertEqual(series[1]["expenses"]["items"][1], {"name": "Deposits", "amount": 50})
+
+        end = datetime(2018, 3, 1)
+        params = {"bucket": "year", "end_date": int(end.timestamp())}
+        res = self.get(url="/financial_overview/series", params=params, role="admin")
+        self.assertEqual(
+            [(period["bucket"], period["total_balance"]) for period in json.loads(res.data)], [("2018", 250)]
+        )
+
+        res = self.get(url="/financial_overview/series", params={"bucket": "week"}, role="admin")
+        self.assertException(res, exc.InvalidData)
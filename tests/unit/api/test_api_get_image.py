@@ -2,8 +2,19 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
+import base64
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+
 import shop_db2.exceptions as exc
-from shop_db2.api import app
+from shop_db2.api import app, db
+from shop_db2.helpers.uploads import DEFAULT_IMAGE, backfill_images
+from shop_db2.models import Product, Upload, User
 from tests.base_api import BaseAPITestCase
 
 
@@ -32,3 +43,89 @@ class GetImageAPITestCase(BaseAPITestCase):
         with open(filepath, "rb") as image:
             bytes = image.read()
         self.assertEqual(res.data, bytes)
+
+
+class GetImageThumbnailsAPITestCase(BaseAPITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.upload_folder = tempfile.mkdtemp()
+        shutil.copy(os.path.join(app.config["UPLOAD_FOLDER"], DEFAULT_IMAGE), self.upload_folder)
+        app.config["UPLOAD_FOLDER"] = self.upload_folder + "/"
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.upload_folder)
+        super().tearDown()
+
+    @staticmethod
+    def _image(size: int, color: str = "red") -> dict:
+        data = io.BytesIO()
+        Image.new("RGB", (size, size), color).save(data, format="PNG")
+        return {"filename": "image.png", "value": base64.b64encode(data.getvalue()).decode()}
+
+    def _size(self, res) -> int:
+        self.assertEqual(res.status_code, 200)
+        width, height = Image.open(io.BytesIO(res.data)).size
+        self.assertEqual(width, height)
+        return width
+
+    def test_get_image_thumbnails(self) -> None:
+        """The smallest thumbnail which is at least as large as the requested size must be returned"""
+        res = self.put(url="/products/1", data={"imagename": self._image(300)}, role="admin")
+        self.assertEqual(res.status_code, 201)
+        imagename = Product.query.filter_by(id=1).first().imagename
+        with open(os.path.join(self.upload_folder, imagename), "rb") as image:
+            self.assertEqual(imagename, f"{hashlib.sha256(image.read()).hexdigest()[:32]}.png")
+
+        for size, expected in [(None, 300), ("1", 64), ("64", 64), ("65", 128), ("256", 256), ("257", 300)]:
+            res = self.get(f"images/{imagename}", params={"size": size} if size else None)
+            self.assertEqual(self._size(res), expected)
+            self.assertEqual(res.headers["Cache-Control"], "public, max-age=31536000, immutable")
+            etag, _ = res.get_etag()
+            headers = {"If-None-Match": f'"{etag}"'}
+            res = self.client.get(f"images/{imagename}", query_string={"size": size} if size else None, headers=headers)
+            self.assertEqual(res.status_code, 304)
+
+        for size in ["0", "-1", "foo", "²", "1.5"]:
+            self.assertException(self.get(f"images/{imagename}", params={"size": size}), exc.InvalidQueryParameters)
+
+        # Small images don't have thumbnails
+        res = self.put(url="/products/2", data={"imagename": self._image(100)}, role="admin")
+        self.assertEqual(res.status_code, 201)
+        imagename = Product.query.filter_by(id=2).first().imagename
+        self.assertEqual(self._size(self.get(f"images/{imagename}", params={"size": 64})), 64)
+        self.assertEqual(self._size(self.get(f"images/{imagename}", params={"size": 128})), 100)
+
+        # The default image may change, so it has to be revalidated
+        res = self.get("images/", params={"size": 64})
+        self.assertEqual(self._size(res), 1000)
+        self.assertEqual(res.headers["Cache-Control"], "no-cache")
+
+    def test_upload_same_image_twice(self) -> None:
+        """The same image must be stored only once"""
+        for url in ["/products/1", "/users/2"]:
+            self.assertEqual(self.put(url=url, data={"imagename": self._image(100)}, role="admin").status_code, 201)
+        self.assertEqual(Product.query.filter_by(id=1).first().imagename, User.query.filter_by(id=2).first().imagename)
+        self.assertEqual(Upload.query.count(), 1)
+
+    def test_backfill_images(self) -> None:
+        """Existing uploads must be renamed to the hash of their content and get thumbnails"""
+        for name, color in [("legacy_1.png", "red"), ("legacy_2.png", "red"), ("legacy_3.png", "blue")]:
+            with open(os.path.join(self.upload_folder, name), "wb") as file:
+                file.write(base64.b64decode(self._image(200, color)["value"]))
+            db.session.add(Upload(filename=name, admin_id=1))
+        db.session.commit()
+
+        # The second upload contains the same image as the first one and keeps its name. The images are smaller than
+        # the largest thumbnail size, the default image is larger.
+        self.assertEqual(backfill_images(rebuild=False), (2, 3 * 2 + 3))
+        self.assertEqual(len(os.listdir(self.upload_folder)), 4)
+        self.assertEqual(backfill_images(), (2, 3 * 2 + 3))
+        filenames = [upload.filename for upload in Upload.query.order_by(Upload.id).all()]
+        self.assertEqual(filenames[1], "legacy_2.png")
+        self.assertEqual(sorted(os.listdir(self.upload_folder)), sorted(filenames + [DEFAULT_IMAGE, "thumbnails"]))
+        for filename in filenames + [DEFAULT_IMAGE]:
+            self.assertEqual(self._size(self.get(f"images/{filename}", params={"size": 100})), 128)
+
+        # Nothing left to do
+        self.assertEqual(backfill_images(rebuild=False), (0, 0))
+        self.assertEqual(backfill_images(), (0, 0))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+from flask import json
+
+import shop_db2.exceptions as exc
+from shop_db2.api import db
+from shop_db2.models import Product
+from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
+
+
+class GetProductByBarcodeAPITestCase(BaseAPITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.insert_default_tag_assignments()
+        Product.query.filter_by(id=1).first().barcode = "4000417"
+        Product.query.filter_by(id=2).first().barcode = "4000417025005"
+        db.session.commit()
+
+    def test_get_product_by_barcode(self) -> None:
+        """The barcode must match exactly, even if it is the prefix of another barcode"""
+        for barcode, product_id in [("4000417", 1), ("4000417025005", 2)]:
+            res = self.get(url=f"/products/barcode/{barcode}")
+            self.assertEqual(res.status_code, 200)
+            product = json.loads(res.data)
+            self.assertEqual(product, json.loads(self.get(url=f"/products/{product_id}").data))
+
+        # Unknown barcodes and barcode prefixes
+        for barcode in ["400041", "0000000"]:
+            res = self.get(url=f"/products/barcode/{barcode}")
+            self.assertException(res, exc.EntryNotFound)
+
+    def test_get_product_by_barcode_with_a_single_query(self) -> None:
+        """The product and its tags must be loaded with a single query, whether the barcode is known or not"""
+        for _ in range(2):
+            with record_statements() as statements:
+                res = self.get(url="/products/barcode/4000417025005")
+            self.assertEqual(json.loads(res.data)["tags"], [2])
+            self.assertEqual(len(statements), 1)
+
+    def test_get_product_by_barcode_after_barcode_changes(self) -> None:
+        """Changed barcodes and new products must be found immediately"""
+        self.assertEqual(self.get(url="/products/barcode/4000417").status_code, 200)
+
+        # Change the barcode via the API
+        res = self.put(url="/products/1", data={"barcode": "1234"}, role="admin")
+        self.assertEqual(res.status_code, 201)
+        self.assertException(self.get(url="/products/barcode/4000417"), exc.EntryNotFound)
+        self.assertEqual(json.loads(self.get(url="/products/barcode/1234").data)["id"], 1)
+
+        # Move the barcode to another product without the ORM, e.g. by another worker
+        table = Product.__table__
+        db.session.execute(table.update().where(table.c.id == 1).values(barcode=None))
+        db.session.execute(table.update().where(table.c.id == 3).values(barcode="1234"))
+        db.session.commit()
+        self.assertEqual(json.loads(self.get(url="/products/barcode/1234").data)["id"], 3)
+
+        # Create a new product with the barcode of a deleted mapping
+        data = {"name": "Bread", "price": 100, "tags": [1], "barcode": "4000417"}
+        self.assertEqual(self.post(url="/products", data=data, role="admin").status_code, 201)
+        self.assertEqual(json.loads(self.get(url="/products/barcode/4000417").data)["name"], "Bread")
+
+    def test_get_inactive_product_by_barcode(self) -> None:
+        """Non-administrators only get the basic information of inactive products"""
+        Product.query.filter_by(id=1).first().active = False
+        db.session.commit()
+        product = json.loads(self.get(url="/products/barcode/4000417").data)
+        self.assertNotIn("price", product)
+        product = json.loads(self.get(url="/products/barcode/4000417", role="admin").data)
+        self.assertIn("price", product)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+from datetime import datetime
+
+from flask import json
+
+from shop_db2.api import db
+from shop_db2.models import Product, Purchase, Replenishment, StocktakingCollection
+from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
+
+
+class GetProductStockAPITestCase(BaseAPITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.insert_default_stocktakingcollections()
+        self.insert_default_purchases()
+        self.insert_default_replenishmentcollections()
+        StocktakingCollection.query.filter_by(id=1).first().timestamp = datetime(2018, 1, 1, 9)
+        StocktakingCollection.query.filter_by(id=2).first().timestamp = datetime(2018, 3, 1, 9)
+        db.session.commit()
+
+    @staticmethod
+    def expected_stock(product_id: int) -> int:
+        """Returns the expected stock of a product: The count of the latest stocktaking (all purchases and
+        replenishments have been made after it) minus all purchases plus all replenishments.
+        """
+        stocktaking = StocktakingCollection.query.filter_by(id=2).first().stocktakings.filter_by(product_id=product_id)
+        purchases = Purchase.query.filter_by(product_id=product_id, revoked=False).all()
+        replenishments = Replenishment.query.filter_by(product_id=product_id).all()
+        return (
+            stocktaking.first().count
+            - sum(p.amount for p in purchases)
+            + sum(r.amount for r in replenishments if not r.replenishmentcollection.revoked)
+        )
+
+    def test_get_product_stock(self) -> None:
+        """Get the theoretical stock of a single product."""
+        res = self.get(url="/products/1/stock")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), self.expected_stock(1))
+
+    def test_list_product_stocks(self) -> None:
+        """Get the theoretical stock of all countable products at once."""
+        Product.query.filter_by(id=4).first().countable = False
+        db.session.commit()
+
+        res = self.get(url="/products/stock")
+        self.assertEqual(res.status_code, 200)
+        stocks = json.loads(res.data)
+        self.assertEqual(stocks, {str(product_id): self.expected_stock(product_id) for product_id in [1, 2, 3]})
+        self.assertEqual(res.headers["Content-Range"], "products: 0-3/3")
+
+    def test_list_product_stocks_filtered(self) -> None:
+        """The list of the theoretical stocks can be filtered like the product list."""
+        res = self.get(url="/products/stock", params={"filter": {"id": [2, 3]}})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data), {"2": self.expected_stock(2), "3": self.expected_stock(3)})
+
+    def test_list_product_stocks_with_a_constant_number_of_queries(self) -> None:
+        """The theoretical stocks of all products must be determined with a fixed number of queries."""
+        with record_statements() as statements:
+            self.get(url="/products/stock")
+
+        for index in range(5):
+            product = Product(name=f"New product {index}", created_by=1)
+            db.session.add(product)
+            db.session.flush()
+            product.set_price(price=100, admin_id=1)
+            db.session.add(Purchase(user_id=1, product_id=product.id, amount=2))
+        db.session.commit()
+
+        with record_statements() as more_statements:
+            res = self.get(url="/products/stock")
+        stocks = json.loads(res.data)
+        self.assertEqual(len(stocks), 9)
+        self.assertEqual(stocks["9"], -2)
+        self.assertEqual(len(more_statements), len(statements))
@@ -5,8 +5,9 @@ __author__ = "g3n35i5"
 from flask import json
 
 from shop_db2.api import db
-from shop_db2.models import Product, Tag
+from shop_db2.models import Product, Tag, Upload
 from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
 
 
 class ListProductsAPITestCase(BaseAPITestCase):
@@ -39,6 +40,44 @@ class ListProductsAPITestCase(BaseAPITestCase):
             self.assertTrue(products[i]["active"])
         self.assertFalse(products[3]["active"])
 
+    def test_list_products_does_not_query_the_uploads_per_product(self) -> None:
+        """The image names of all products must be loaded together with the products."""
+        for product_id in [1, 3]:
+            db.session.add(Upload(filename=f"product_{product_id}.png", admin_id=1))
+            db.session.flush()
+        Product.query.filter_by(id=1).first().image_upload_id = 1
+        Product.query.filter_by(id=3).first().image_upload_id = 2
+        db.session.commit()
+
+        with record_statements() as statements:
+            res = self.get(url="/products", role="admin")
+        products = json.loads(res.data)
+        self.assertEqual([p["imagename"] for p in products], ["product_1.png", None, "product_3.png", None])
+        self.assertFalse([statement for statement in statements if statement.startswith("SELECT uploads.")])
+
+    def test_list_products_with_a_constant_number_of_queries(self) -> None:
+        """The tags of all listed products must be loaded with a single query and not with one query per product."""
+        self.insert_default_tag_assignments()
+        with record_statements() as statements:
+            res = self.get(url="/products", role="admin")
+        self.assertEqual([p["tags"] for p in json.loads(res.data)], [[1], [2], [3], [4]])
+
+        # Add more products with multiple tags, the number of statements must not change.
+        for index in range(3):
+            product = Product(name=f"New product {index}", created_by=1)
+            db.session.add(product)
+            db.session.flush()
+            product.set_price(price=100, admin_id=1)
+            product.tags = Tag.query.filter(Tag.id.in_([1, 2])).all()
+        db.session.commit()
+
+        with record_statements() as more_statements:
+            res = self.get(url="/products", role="admin")
+        products = json.loads(res.data)
+        self.assertEqual(len(products), 7)
+        self.assertEqual(sorted(products[-1]["tags"]), [1, 2])
+        self.assertEqual(len(more_statements), len(statements))
+
     def test_list_products_with_products_which_are_not_for_sale(self) -> None:
         """This test ensures that the product listing differs between administrators and "normal" users.
         Only if an administrator makes the request, all products should be returned, otherwise only those that
@@ -85,6 +85,21 @@ class ListPurchasesAPITestCase(BaseAPITestCase):
         self.assertEqual(purchases[1]["id"], 4)  # <- Third purchase is revoked!
         self.assertEqual(purchases[2]["id"], 2)
 
+    def test_list_purchases_is_streamed(self) -> None:
+        """Without pagination, the purchases are streamed and counted up front."""
+        self.insert_default_purchases()
+        res = self.get(url="/purchases", role="admin", params={"sort": {"field": "id", "order": "DESC"}})
+        self.assertEqual(res.status_code, 200)
+        # The length of a streamed response is unknown
+        self.assertNotIn("Content-Length", res.headers)
+        self.assertEqual(res.headers["Content-Range"], "purchases: 0-5/5")
+        purchases = json.loads(res.data)
+        self.assertEqual([5, 4, 3, 2, 1], [purchase["id"] for purchase in purchases])
+
+        # Paginated lists are not streamed
+        res = self.get(url="/purchases", role="admin", params={"pagination": {"page": 1, "perPage": 2}})
+        self.assertIn("Content-Length", res.headers)
+
     def test_invalid_parameter(self) -> None:
         res = self.get(url="/purchases", params={"unknown": 2})
         self.assertEqual(res.status_code, 400)
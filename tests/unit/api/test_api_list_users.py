@@ -5,8 +5,9 @@ __author__ = "g3n35i5"
 from flask import json
 
 from shop_db2.api import db
-from shop_db2.models import Rank, User
+from shop_db2.models import Rank, Upload, User
 from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
 
 
 class ListUsersAPITestCase(BaseAPITestCase):
@@ -69,3 +70,43 @@ class ListUsersAPITestCase(BaseAPITestCase):
                 "is_verified",
             ]:
                 assert item in user
+
+    def test_list_users_with_a_constant_number_of_queries(self) -> None:
+        """The image names of all users must be loaded together with the users and not with one query per user."""
+        for user_id in [1, 2]:
+            db.session.add(Upload(filename=f"user_{user_id}.png", admin_id=1))
+            db.session.flush()
+            User.query.filter_by(id=user_id).first().image_upload_id = user_id
+        db.session.commit()
+
+        with record_statements() as statements:
+            res = self.get(url="/users", role="admin")
+        users = json.loads(res.data)
+        self.assertEqual([user["imagename"] for user in users], ["user_1.png", "user_2.png", None, None, None])
+
+        # Add more users with images, the number of statements must not change.
+        for index in range(3):
+            db.session.add(Upload(filename=f"new_user_{index}.png", admin_id=1))
+            db.session.add(User(firstname="New", lastname=f"User {index}", image_upload_id=3 + index))
+        db.session.commit()
+
+        with record_statements() as more_statements:
+            res = self.get(url="/users", role="admin")
+        self.assertEqual(len(json.loads(res.data)), 8)
+        self.assertEqual(len(more_statements), len(statements))
+
+    def test_list_users_only_computes_returned_fields(self) -> None:
+        """The non-administrator listing must not compute the admin state, the verification date or the system
+        user state of all users. The filters are still applied in SQL.
+        """
+        with record_statements() as statements:
+            res = self.get(url="/users")
+        self.assertEqual(len(json.loads(res.data)), 4)
+        selects = [s for s in statements if "\nFROM users" in s]
+        self.assertEqual(len(selects), 1)
+        columns, _, where = selects[0].partition("\nFROM users")
+        self.assertIn("uploads.filename", columns)
+        self.assertNotIn("ranks", columns)
+        self.assertIn("ranks", where)
+        self.assertNotIn("adminupdates", selects[0])
+        self.assertNotIn("userverifications", selects[0])
@@ -2,6 +2,8 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
+import datetime
+
 import jwt
 from flask import json
 
@@ -112,3 +114,71 @@ class LoginAPITestCase(BaseAPITestCase):
         self.assertException(res, exc.InvalidCredentials)
         data = json.loads(res.data)
         assert "token" not in data
+
+    def _login_token(self) -> str:
+        """Returns a token of the administrator."""
+        res = self.post(url="/login", data={"id": 1, "password": user_data[0]["password"]})
+        return json.loads(res.data)["token"]
+
+    def test_login_token_lifetime(self) -> None:
+        """The lifetime of a token can be configured."""
+        self.app.config["TOKEN_LIFETIME_MINUTES"] = 5
+        decode = jwt.decode(self._login_token(), self.app.config["SECRET_KEY"])
+        lifetime = datetime.datetime.utcfromtimestamp(decode["exp"]) - datetime.datetime.utcnow()
+        self.assertLessEqual(lifetime, datetime.timedelta(minutes=5))
+        self.assertGreater(lifetime, datetime.timedelta(minutes=4))
+
+    def test_refresh_login(self) -> None:
+        """A valid token can be exchanged for a new one without a password.
+        The login time of the original token is kept.
+        """
+        token = self._login_token()
+        res = self.client.post("/login/refresh", headers={"token": token})
+        self.assertEqual(res.status_code, 200)
+        data = json.loads(res.data)
+        self.assertTrue(data["result"])
+        original = jwt.decode(token, self.app.config["SECRET_KEY"])
+        refreshed = jwt.decode(data["token"], self.app.config["SECRET_KEY"])
+        self.assertEqual(refreshed["user"], original["user"])
+        self.assertEqual(refreshed["login"], original["login"])
+        self.assertGreaterEqual(refreshed["exp"], original["exp"])
+
+        # The refreshed token can be used like the original one.
+        res = self.client.get("/financial_overview", headers={"token": data["token"]})
+        self.assertEqual(res.status_code, 200)
+
+    def test_refresh_login_without_valid_token(self) -> None:
+        """A token can only be refreshed if it is valid."""
+        res = self.client.post("/login/refresh")
+        self.assertException(res, exc.UnauthorizedAccess)
+        res = self.client.post("/login/refresh", headers={"token": self._login_token() + "manipulated"})
+        self.assertException(res, exc.TokenIsInvalid)
+
+        # Tokens without a login time can't be refreshed.
+        decode = jwt.decode(self._login_token(), self.app.config["SECRET_KEY"])
+        del decode["login"]
+        token = jwt.encode(decode, self.app.config["SECRET_KEY"]).decode("UTF-8")
+        res = self.client.post("/login/refresh", headers={"token": token})
+        self.assertException(res, exc.TokenIsInvalid)
+
+    def test_refresh_login_after_refresh_window(self) -> None:
+        """A token can't be refreshed anymore after the refresh window since the login has passed."""
+        decode = jwt.decode(self._login_token(), self.app.config["SECRET_KEY"])
+        decode["login"] -= 61 * 60
+        token = jwt.encode(decode, self.app.config["SECRET_KEY"]).decode("UTF-8")
+
+        self.app.config["TOKEN_REFRESH_WINDOW_MINUTES"] = 120
+        res = self.client.post("/login/refresh", headers={"token": token})
+        self.assertEqual(res.status_code, 200)
+
+        self.app.config["TOKEN_REFRESH_WINDOW_MINUTES"] = 60
+        res = self.client.post("/login/refresh", headers={"token": token})
+        self.assertException(res, exc.TokenHasExpired)
+
+    def test_refresh_login_as_inactive_user(self) -> None:
+        """The state of the user is checked again on every refresh."""
+        token = self._login_token()
+        User.query.filter_by(id=1).first().set_rank_id(4, 1)
+        db.session.commit()
+        res = self.client.post("/login/refresh", headers={"token": token})
+        self.assertException(res, exc.UserIsInactive)
@@ -5,7 +5,10 @@ __author__ = "g3n35i5"
 from flask import json
 
 import shop_db2.exceptions as exc
+from shop_db2.api import app, db
+from shop_db2.models import Product, Purchase, User
 from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
 
 
 class QueryParametersAPITestCase(BaseAPITestCase):
@@ -136,6 +139,154 @@ class QueryParametersAPITestCase(BaseAPITestCase):
         self.assertEqual(2, len(users))
         self.assertEqual([3, 4], list(map(lambda x: x["id"], users)))
 
+    def _list_with_cursor(self, url: str, params: dict) -> list:
+        """Lists all entries page by page by following the cursors"""
+        pages = []
+        params = dict(params, cursor="")
+        while True:
+            res = self.get(url, role="admin", params=params)
+            self.assertEqual(res.status_code, 200)
+            self.assertNotIn("Content-Range", res.headers)
+            pages.append(json.loads(res.data))
+            if "Next-Cursor" not in res.headers:
+                return pages
+            params["cursor"] = res.headers["Next-Cursor"]
+
+    def test_query_parameters_cursor_pagination(self) -> None:
+        """Test the cursor based pagination with different sort orders"""
+        # Without sorting, the entries are ordered by their id
+        pages = self._list_with_cursor("/users", {"pagination": {"page": 1, "perPage": 2}})
+        self.assertEqual([[1, 2], [3, 4], [5]], [[x["id"] for x in page] for page in pages])
+
+        # A page which ends exactly with the last entry has no next cursor
+        pages = self._list_with_cursor("/users", {"pagination": {"page": 1, "perPage": 5}})
+        self.assertEqual(1, len(pages))
+
+        # Sorting by a nullable string column
+        for order in ["ASC", "DESC"]:
+            params = {"sort": {"field": "firstname", "order": order}, "pagination": {"page": 1, "perPage": 2}}
+            firstnames = [x["firstname"] for page in self._list_with_cursor("/users", params) for x in page]
+            expected = [None, "Bryce", "Daniel", "Mary", "William"]
+            self.assertEqual(expected if order == "ASC" else list(reversed(expected)), firstnames)
+
+        # Sorting by a column with duplicate values and by a timestamp
+        self.insert_default_purchases()
+        for field in ["user_id", "timestamp"]:
+            for order in ["ASC", "DESC"]:
+                params = {"sort": {"field": field, "order": order}, "pagination": {"page": 1, "perPage": 2}}
+                paged = [x["id"] for page in self._list_with_cursor("/purchases", params) for x in page]
+                res = self.get("/purchases", role="admin", params={"sort": {"field": field, "order": order}})
+                purchases = json.loads(res.data)
+                self.assertEqual(sorted(paged), sorted(x["id"] for x in purchases))
+                values = [x[field] for x in purchases]
+                self.assertEqual(values, sorted(values, reverse=order == "DESC"))
+
+    def test_query_parameters_cursor_pagination_queries(self) -> None:
+        """Deeper pages of the cursor based pagination must neither count nor skip entries"""
+        self.insert_default_purchases()
+        params = {"sort": {"field": "id", "order": "DESC"}, "pagination": {"page": 1, "perPage": 2}, "cursor": ""}
+        res = self.get("/purchases", params=params)
+        params["cursor"] = res.headers["Next-Cursor"]
+        with record_statements() as statements:
+            res = self.get("/purchases", params=params)
+        self.assertEqual([3, 2], [x["id"] for x in json.loads(res.data)])
+        selects = [s for s in statements if "FROM purchases" in s]
+        self.assertEqual(1, len(selects))
+        self.assertNotIn("count(", selects[0].lower())
+        self.assertIn("purchases.id < ?", selects[0])
+
+    def test_query_parameters_without_pagination_counts_loaded_items(self) -> None:
+        """Without pagination, the list is queried only once and the loaded items are counted"""
+        with record_statements() as statements:
+            res = self.get("/users", params={"sort": {"field": "id", "order": "ASC"}})
+        self.assertEqual(res.headers["Content-Range"], "users: 0-4/4")
+        self.assertEqual(1, len([s for s in statements if "FROM users" in s]))
+        self.assertFalse(any("count(" in s for s in statements))
+
+    def test_query_parameters_count_strategies(self) -> None:
+        """Test the exact, cached and omitted counts of paginated lists"""
+        self.insert_default_purchases()
+        params = {"sort": {"field": "id", "order": "ASC"}, "pagination": {"page": 1, "perPage": 2}}
+
+        # The exact count is queried for every full page, but only the primary keys are counted
+        with record_statements() as statements:
+            res = self.get("/purchases", params=params)
+        self.assertEqual(res.headers["Content-Range"], "purchases: 0-1/5")
+        counts = [s for s in statements if "count(" in s]
+        self.assertEqual(1, len(counts))
+        self.assertIn("count(purchases.id)", counts[0])
+
+        # A partially filled page is the last one and doesn't have to be counted
+        with record_statements() as statements:
+            res = self.get("/purchases", params={"pagination": {"page": 2, "perPage": 3}})
+        self.assertEqual(res.headers["Content-Range"], "purchases: 3-5/5")
+        self.assertFalse(any("count(" in s for s in statements))
+
+        # Without counting, the total is unknown
+        app.config["QUERY_COUNT_STRATEGY"] = "none"
+        with record_statements() as statements:
+            res = self.get("/purchases", params=params)
+        self.assertEqual(res.headers["Content-Range"], "purchases: 0-1/*")
+        self.assertFalse(any("count(" in s for s in statements))
+
+        # Cached counts are reused until one of the involved tables is modified
+        app.config["QUERY_COUNT_STRATEGY"] = "cached"
+        self.assertEqual(self.get("/purchases", params=params).headers["Content-Range"], "purchases: 0-1/5")
+        with record_statements() as statements:
+            res = self.get("/purchases", params=params)
+        self.assertEqual(res.headers["Content-Range"], "purchases: 0-1/5")
+        self.assertFalse(any("count(" in s for s in statements))
+
+        # Revoked purchases are hidden for non-administrators
+        Purchase.query.filter_by(id=1).first().set_revoked(revoked=True, admin_id=1)
+        db.session.commit()
+        self.assertEqual(self.get("/purchases", params=params).headers["Content-Range"], "purchases: 0-1/4")
+
+        # Expired counts are queried again
+        app.config["QUERY_COUNT_CACHE_TIMEOUT"] = 0
+        with record_statements() as statements:
+            self.get("/purchases", params=params)
+        self.assertTrue(any("count(" in s for s in statements))
+
+    def test_query_parameters_search(self) -> None:
+        """Test the full-text search over users and products"""
+
+        def search(url: str, text: str, **params) -> list:
+            res = self.get(url, role="admin", params=dict(params, search=text))
+            self.assertEqual(res.status_code, 200)
+            return [x["id"] for x in json.loads(res.data)]
+
+        # Complete and incomplete words of the first and the last name, case insensitive
+        self.assertEqual([3, 1], search("/users", "jones", sort={"field": "id", "order": "DESC"}))
+        self.assertEqual([2], search("/users", "mar"))
+        self.assertEqual([2], search("/users", "Smith, M"))
+        self.assertEqual([], search("/users", "Mary Jones"))
+        # FTS5 operators are searched as plain words
+        self.assertEqual([], search("/users", 'Mary OR "Jones'))
+
+        # The search results are ranked by their relevance
+        user = User.query.filter_by(id=5).first()
+        user.firstname, user.lastname = "Jones", "Jones"
+        db.session.commit()
+        self.assertEqual(5, search("/users", "jones")[0])
+
+        # The search index is kept up to date
+        User.query.filter_by(id=2).first().firstname = "Märy"
+        db.session.add(Product(name="Mars bar", barcode="4000417025005", created_by=1))
+        db.session.commit()
+        self.assertEqual([2], search("/users", "mary"))
+        self.assertEqual([5], search("/products", "mar"))
+        self.assertEqual([5], search("/products", "4000417"))
+
+        # The search is combined with filters and pagination
+        self.assertEqual([4], search("/products", "co", filter={"name": "Coke"}))
+        res = self.get("/products", role="admin", params={"search": "co", "pagination": {"page": 1, "perPage": 2}})
+        self.assertEqual(res.headers["Content-Range"], "products: 0-1/3")
+
+        # Only users and products are searchable
+        res = self.get("/purchases", role="admin", params={"search": "co"})
+        self.assertException(res, exc.InvalidQueryParameters())
+
     def test_invalid_query_parameters(self) -> None:
         """This test ensures that only valid query parameters are accepted by the API"""
         param_list = [
@@ -197,6 +348,14 @@ class QueryParametersAPITestCase(BaseAPITestCase):
                     "lastname": "Smith",
                 },
             },
+            # Search without any word
+            {"search": " ,;"},
+            # Cursor without pagination
+            {"cursor": ""},
+            # Corrupt cursor
+            {"cursor": "foo", "pagination": {"page": 1, "perPage": 1}},
+            # Cursor with an invalid id
+            {"cursor": "WyJNYXJ5IiwiMSJd", "pagination": {"page": 1, "perPage": 1}},
         ]
         for params in param_list:
             res = self.get("/users", params=params)
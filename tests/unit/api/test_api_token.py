@@ -10,6 +10,7 @@ from flask import json
 import shop_db2.exceptions as exc
 from tests.base import user_data
 from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
 
 
 class TokenAPITestCase(BaseAPITestCase):
@@ -80,3 +81,22 @@ class TokenAPITestCase(BaseAPITestCase):
         res = self.client.get("/users", data=json.dumps({}), headers=headers)
         self.assertEqual(res.status_code, 401)
         self.assertException(res, exc.TokenIsInvalid)
+
+    def test_token_is_resolved_once_per_request(self) -> None:
+        """The token must be decoded and the administrator must be loaded only once per request, although both the
+        before request hook and the route check for an administrator.
+        """
+        data = {"id": 1, "password": user_data[0]["password"]}
+        res = self.post(url="/login", data=data)
+        headers = {"content-type": "application/json", "token": json.loads(res.data)["token"]}
+
+        with record_statements() as statements:
+            res = self.client.get("/financial_overview", headers=headers)
+        self.assertEqual(res.status_code, 200)
+
+        # One statement for the administrator, all others for the financial overview.
+        self.assertEqual(len([statement for statement in statements if "FROM users" in statement]), 1)
+        self.assertIn("FROM users", statements[0])
+        # The expensive column properties of the administrator are not loaded.
+        self.assertNotIn("uploads", statements[0])
+        self.assertNotIn("ranks", statements[0])
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import sqlite3
+
+from sqlalchemy.exc import OperationalError
+
+from shop_db2.api import db
+from shop_db2.helpers.database import retry_on_busy
+from tests.base import BaseTestCase
+
+
+def _error(message: str) -> OperationalError:
+    return OperationalError("INSERT INTO foo", {}, sqlite3.OperationalError(message))
+
+
+class TestHelpersDatabaseTestCase(BaseTestCase):
+    def test_sqlite_connection_settings(self) -> None:
+        """Every SQLite connection must wait for locks instead of failing immediately."""
+        self.assertEqual(db.session.execute("PRAGMA busy_timeout").scalar(), 5000)
+
+    def test_retry_on_busy(self) -> None:
+        """A function whose transaction failed because of a locked database is executed again."""
+        calls = []
+
+        @retry_on_busy
+        def _func() -> str:
+            calls.append(None)
+            if len(calls) < 3:
+                raise _error("database is locked")
+            return "done"
+
+        self.assertEqual(_func(), "done")
+        self.assertEqual(len(calls), 3)
+
+    def test_retry_on_busy_gives_up(self) -> None:
+        """Other errors and errors after the last retry are raised."""
+        calls = []
+
+        @retry_on_busy
+        def _func() -> None:
+            calls.append(None)
+            raise _error("database is locked")
+
+        with self.assertRaises(OperationalError):
+            _func()
+        self.assertEqual(len(calls), 1 + self.app.config["DATABASE_RETRIES"])
+
+        calls.clear()
+
+        @retry_on_busy
+        def _other_error() -> None:
+            calls.append(None)
+            raise _error("no such table: foo")
+
+        with self.assertRaises(OperationalError):
+            _other_error()
+        self.assertEqual(len(calls), 1)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import datetime
+
+from shop_db2.api import db
+from shop_db2.helpers.financial_overview import get_inconsistent_financial_rollups, rebuild_financial_rollups
+from shop_db2.helpers.purchases import insert_purchases
+from shop_db2.models import (
+    Deposit,
+    FinancialRollup,
+    ProductPrice,
+    Purchase,
+    Replenishment,
+    ReplenishmentCollection,
+    StocktakingCollection,
+    User,
+)
+from shop_db2.models.financial_rollup import PURCHASE_INCOME, STOCKTAKING_LOSS, STOCKTAKING_PROFIT
+from tests.base_api import BaseAPITestCase
+
+
+class TestHelpersFinancialOverviewTestCase(BaseAPITestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.insert_default_stocktakingcollections()
+        StocktakingCollection.query.filter_by(id=1).first().timestamp = datetime.datetime(2018, 1, 1, 9)
+        StocktakingCollection.query.filter_by(id=2).first().timestamp = datetime.datetime(2018, 3, 1, 9)
+        self.insert_default_purchases()
+        self.insert_default_deposits()
+        self.insert_default_replenishmentcollections()
+
+    def test_rollups_are_updated_incrementally(self) -> None:
+        """The rollups must match the full history after inserts, updates and revokes of all kinds of entries."""
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+
+        # Revoke and update purchases, deposits and replenishments
+        Purchase.query.filter_by(id=1).first().set_revoked(revoked=True, admin_id=1)
+        Purchase.query.filter_by(id=2).first().amount = 7
+        Deposit.query.filter_by(id=1).first().set_revoked(revoked=True, admin_id=1)
+        Replenishment.query.filter_by(id=1).first().total_price = 1
+        Replenishment.query.filter_by(id=3).first().set_revoked(revoked=True, admin_id=1)
+        db.session.commit()
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+
+        # Move a replenishmentcollection into a closed stocktaking period and revoke another one
+        ReplenishmentCollection.query.filter_by(id=1).first().timestamp = datetime.datetime(2018, 2, 1, 9)
+        ReplenishmentCollection.query.filter_by(id=2).first().set_revoked(revoked=True, admin_id=1)
+        db.session.commit()
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+
+        # Insert purchases in bulk, one of them in a closed stocktaking period
+        admin = User.query.filter_by(id=1).first()
+        insert_purchases(
+            admin,
+            [
+                {"user_id": 1, "product_id": 2, "amount": 3},
+                {"user_id": 2, "product_id": 1, "amount": 2, "timestamp": "2018-02-15 12:00:00Z"},
+            ],
+        )
+        db.session.commit()
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+
+        # Revoke the latest stocktakingcollection
+        StocktakingCollection.query.filter_by(id=2).first().set_revoked(revoked=True, admin_id=1)
+        db.session.commit()
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+        rows = FinancialRollup.query.filter(FinancialRollup.category.in_([STOCKTAKING_PROFIT, STOCKTAKING_LOSS]))
+        self.assertTrue(all(row.amount == 0 for row in rows))
+
+    def test_rollups_are_updated_after_product_changes(self) -> None:
+        """The stocktaking rollups must match the full history after changes of the countable products and of the
+        product prices, which are used to value the stocktaking differences.
+        """
+        self.assertNotEqual(FinancialRollup.query.filter(FinancialRollup.category == STOCKTAKING_LOSS).all(), [])
+
+        # Exclude a product from the stocktakings
+        res = self.put(url="/products/1", data={"countable": False}, role="admin")
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+
+        # Change a price now and move another one into the closed stocktaking period
+        res = self.put(url="/products/2", data={"price": 1000}, role="admin")
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+        ProductPrice.query.filter_by(product_id=3).first().timestamp = datetime.datetime(2018, 2, 1, 9)
+        db.session.commit()
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+
+    def test_stocktaking_rollups(self) -> None:
+        """The balance between two consecutive stocktakingcollections is booked on the day of the later one."""
+        rows = FinancialRollup.query.filter(FinancialRollup.date == datetime.date(2018, 3, 1)).all()
+        amounts = {row.category: row.amount for row in rows}
+        balance = self.get(url="/stocktakingcollections/balance", params={"start_id": 1, "end_id": 2}, role="admin")
+        balance = balance.get_json()
+        self.assertNotEqual(balance["loss"], 0)
+        self.assertEqual(amounts.get(STOCKTAKING_PROFIT, 0), balance["profit"])
+        self.assertEqual(amounts.get(STOCKTAKING_LOSS, 0), balance["loss"])
+
+    def test_check_and_rebuild_financial_rollups(self) -> None:
+        """This test checks the consistency check and the rebuild of the financial rollups."""
+        self.assertEqual(rebuild_financial_rollups(), 0)
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
+
+        # Corrupt the rollups without the ORM
+        table = FinancialRollup.__table__
+        today = datetime.datetime.utcnow().date()
+        purchase_income = FinancialRollup.query.filter_by(date=today, category=PURCHASE_INCOME).first().amount
+        db.session.execute(table.update().where(table.c.category == PURCHASE_INCOME).values(amount=42))
+        db.session.execute(table.insert().values(date=datetime.date(2000, 1, 1), category=PURCHASE_INCOME, amount=1))
+        db.session.commit()
+
+        inconsistent = get_inconsistent_financial_rollups()
+        self.assertEqual(
+            inconsistent,
+            [
+                {"date": datetime.date(2000, 1, 1), "category": PURCHASE_INCOME, "amount": 1, "expected": 0},
+                {"date": today, "category": PURCHASE_INCOME, "amount": 42, "expected": purchase_income},
+            ],
+        )
+
+        self.assertEqual(rebuild_financial_rollups(), 2)
+        self.assertEqual(get_inconsistent_financial_rollups(), [])
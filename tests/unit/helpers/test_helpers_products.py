@@ -2,7 +2,11 @@
 # -*- coding: utf-8 -*-
 __author__ = "g3n35i5"
 
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from hypothesis import given, settings
+from hypothesis import strategies as st
 
 import shop_db2.exceptions as exc
 import shop_db2.helpers.products as product_helpers
@@ -11,6 +15,44 @@ from shop_db2.models import Product, ProductPrice, Purchase, StocktakingCollecti
 from tests.base_api import BaseAPITestCase
 
 
+def _mean_price_day_by_day(changes: List[Tuple[datetime, int]], start: datetime, end: datetime) -> int:
+    """Reference implementation of the mean price calculation which iterates over all days in the time range."""
+
+    def _begin_of_day(date: datetime) -> datetime:
+        return date.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    changes = [(_begin_of_day(timestamp), price) for timestamp, price in changes]
+    current_date = changes[0][0]
+    current_price = changes[0][1]
+    start = _begin_of_day(start)
+    end = end.replace(hour=23, minute=59, second=59, microsecond=999999)
+    day_count = 0
+    sum_price = 0
+    while current_date <= end:
+        current_date += timedelta(days=1)
+        if current_date <= start:
+            continue
+        day_count += 1
+        sum_price += current_price
+        if current_date in list(map(lambda x: x[0], changes)):
+            current_price = next(item for item in changes if item[0] == current_date)[1]
+    return int(round(sum_price / day_count))
+
+
+@st.composite
+def price_histories(draw: st.DrawFn) -> Tuple[List[Tuple[datetime, int]], datetime, datetime]:
+    """Generates a time range and a price history as used by the mean price calculation: The first price is valid
+    at the start date, all further price changes lie in the time range.
+    """
+    start = draw(st.datetimes(min_value=datetime(2017, 1, 1), max_value=datetime(2020, 1, 1)))
+    end = start + draw(st.timedeltas(min_value=timedelta(seconds=1), max_value=timedelta(days=120)))
+    first = start - draw(st.timedeltas(min_value=timedelta(0), max_value=timedelta(days=60)))
+    timestamps = draw(st.lists(st.datetimes(min_value=start, max_value=end), max_size=10))
+    timestamps = sorted(t for t in timestamps if start < t < end)
+    prices = draw(st.lists(st.integers(min_value=0, max_value=10000), min_size=len(timestamps) + 1))
+    return list(zip([first] + timestamps, prices)), start, end
+
+
 class TestHelpersProductsTestCase(BaseAPITestCase):
     def test_get_product_mean_price_in_range(self):
         """This test checks whether the average weighted price of a product is
@@ -83,6 +125,52 @@ class TestHelpersProductsTestCase(BaseAPITestCase):
         mean = product_helpers._get_product_mean_price_in_time_range(1, start, end)
         self.assertEqual(mean, 145)
 
+    @settings(max_examples=500, deadline=None)
+    @given(price_histories())
+    def test_mean_price_matches_the_day_by_day_calculation(self, history):
+        """The interval weighted mean price must be identical to the mean of the daily prices."""
+        changes, start, end = history
+        self.assertEqual(
+            product_helpers._calculate_mean_price(changes, start, end),
+            _mean_price_day_by_day(changes, start, end),
+        )
+
+    def test_get_product_mean_price_does_not_modify_the_price_history(self):
+        """The calculation of the mean price must not touch the product prices in the session."""
+        t1 = datetime.strptime("2017-01-01 09:00:00", "%Y-%m-%d %H:%M:%S")
+        ProductPrice.query.filter_by(product_id=1).first().timestamp = t1
+        t2 = datetime.strptime("2017-02-01 09:00:00", "%Y-%m-%d %H:%M:%S")
+        db.session.add(ProductPrice(price=100, product_id=1, admin_id=1, timestamp=t2))
+        db.session.commit()
+        prices = ProductPrice.query.filter_by(product_id=1).all()
+
+        start = datetime.strptime("2017-01-15 09:00:00", "%Y-%m-%d %H:%M:%S")
+        end = datetime.strptime("2017-02-15 10:00:00", "%Y-%m-%d %H:%M:%S")
+        product_helpers._get_product_mean_price_in_time_range(1, start, end)
+
+        self.assertFalse(db.session.dirty)
+        self.assertEqual([p.timestamp for p in prices], [t1, t2])
+
+    def test_get_mean_prices_of_multiple_products(self):
+        """The mean prices of multiple products must be identical to the mean prices of each single product."""
+        t = datetime.strptime("2017-01-01 09:00:00", "%Y-%m-%d %H:%M:%S")
+        for product_id in [1, 2]:
+            ProductPrice.query.filter_by(product_id=product_id).first().timestamp = t
+        for day, price in [(3, 100), (5, 150), (9, 50)]:
+            timestamp = datetime(2017, 2, day, 9)
+            db.session.add(ProductPrice(price=price, product_id=1, admin_id=1, timestamp=timestamp))
+            db.session.add(ProductPrice(price=price * 2, product_id=2, admin_id=1, timestamp=timestamp))
+        db.session.commit()
+
+        start = datetime.strptime("2017-02-01 09:00:00", "%Y-%m-%d %H:%M:%S")
+        end = datetime.strptime("2017-02-10 10:00:00", "%Y-%m-%d %H:%M:%S")
+        mean_prices = product_helpers._get_product_mean_prices_in_time_range([1, 2, 3, 4], start, end)
+        for product_id in [1, 2, 3, 4]:
+            mean_price = product_helpers._get_product_mean_price_in_time_range(product_id, start, end)
+            self.assertEqual(mean_prices[product_id], mean_price)
+        # Products without a price at the start date use their current price
+        self.assertEqual(mean_prices[3], Product.query.filter_by(id=3).first().price)
+
     def test_get_product_mean_price_in_range_invalid_params(self):
         """This test ensures that the helper function raises the corresponding
         exceptions for invalid parameters.
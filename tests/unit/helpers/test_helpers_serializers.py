@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import datetime
+import json
+import uuid
+from unittest import mock
+
+from flask import jsonify
+from flask.json import JSONEncoder as FlaskJSONEncoder
+from sqlalchemy.orm import defer
+
+from shop_db2.api import app, db
+from shop_db2.helpers.serializers import JSONEncoder, get_serializer, json_list_response, serialize
+from shop_db2.models import Purchase, User
+from tests.base_api import BaseAPITestCase
+
+
+class TestHelpersSerializersTestCase(BaseAPITestCase):
+    def test_serialize_entities(self) -> None:
+        """The serializer must return the same values as the attributes of the entities"""
+        self.insert_default_purchases()
+        fields = ["id", "timestamp", "amount", "price", "revoked", "foo"]
+        purchases = Purchase.query.all()
+        expected = [{field: getattr(purchase, field, None) for field in fields} for purchase in purchases]
+        self.assertEqual(serialize(purchases, fields), expected)
+        self.assertIs(get_serializer(Purchase, fields), get_serializer(Purchase, list(fields)))
+
+        # Deferred and expired columns are loaded on access
+        users = User.query.options(defer(User.is_admin)).all()
+        db.session.expire(users[0], ["lastname"])
+        self.assertEqual(
+            serialize(users, ["lastname", "is_admin", "imagename"]),
+            [{"lastname": u.lastname, "is_admin": u.is_admin, "imagename": u.imagename} for u in users],
+        )
+
+        # A single entity and a single field
+        self.assertEqual(serialize(purchases[0], ["id"]), [{"id": 1}])
+
+    def test_serialize_projected_rows(self) -> None:
+        """The serializer must also work with plain rows"""
+        self.insert_default_purchases()
+        rows = db.session.query(Purchase.id, Purchase.amount).order_by(Purchase.id).all()
+        self.assertEqual(serialize(rows, ["amount", "id"]), [{"amount": r.amount, "id": r.id} for r in rows])
+
+    def test_json_encoder_output_is_identical(self) -> None:
+        """The JSON encoder of the application must return exactly the same output as the flask encoder"""
+        timezone = datetime.timezone(datetime.timedelta(hours=2))
+        data = [
+            {"b": 1, "a": [datetime.datetime(2020, 2, 29, 23, 59, 59, 999), datetime.date(2021, 12, 31)]},
+            [datetime.datetime(2020, 1, 1, 1, tzinfo=timezone), datetime.datetime(1, 1, 1)],
+            {"ä": 'ö€😀\x7f\n\t\x01"\\', "x": {"z": None, "y": [True, False, 1.5, -3]}},
+            {1: 2, 10: 3, 2: 4},
+            [2**70, uuid.UUID("12345678123456781234567812345678")],
+        ]
+        for item in data:
+            for ensure_ascii in [True, False]:
+                for sort_keys in [True, False]:
+                    for separators in [(",", ":"), None]:
+                        kwargs = {"ensure_ascii": ensure_ascii, "sort_keys": sort_keys, "separators": separators}
+                        self.assertEqual(
+                            json.dumps(item, cls=JSONEncoder, **kwargs),
+                            json.dumps(item, cls=FlaskJSONEncoder, **kwargs),
+                        )
+
+        # The responses of the API are encoded with the JSON encoder of the application
+        self.assertIs(self.app.json_encoder, JSONEncoder)
+
+    def test_json_list_response(self) -> None:
+        """A streamed list must be identical to the list returned by jsonify"""
+        self.insert_default_purchases()
+        fields = ["id", "timestamp", "amount", "price"]
+        expected = jsonify(serialize(Purchase.query.all(), fields)).get_data(as_text=True)
+        for batch_size in [1, 2, 5, 100]:
+            response = json_list_response(Purchase.query.yield_per(batch_size), fields, batch_size=batch_size)
+            self.assertTrue(response.is_streamed)
+            self.assertEqual(response.get_data(as_text=True), expected)
+
+        # An empty stream is an empty list, whereas lists are never streamed
+        self.assertEqual(json_list_response(iter([]), fields).get_data(as_text=True), "[]\n")
+        self.assertFalse(json_list_response([], fields).is_streamed)
+
+        # Pretty printed responses are never streamed
+        with mock.patch.dict(app.config, {"JSONIFY_PRETTYPRINT_REGULAR": True}):
+            response = json_list_response(Purchase.query.yield_per(2), fields)
+            self.assertFalse(response.is_streamed)
+            self.assertEqual(
+                response.get_data(as_text=True), jsonify(serialize(Purchase.query.all(), fields)).get_data(as_text=True)
+            )
@@ -8,6 +8,7 @@ import shop_db2.helpers.stocktakings as stocktaking_helpers
 from shop_db2.api import db
 from shop_db2.models import Product, ProductPrice, Purchase, ReplenishmentCollection, Stocktaking, StocktakingCollection
 from tests.base_api import BaseAPITestCase
+from tests.utils import record_statements
 
 
 class TestHelpersStocktakingsTestCase(BaseAPITestCase):
@@ -761,6 +762,42 @@ class TestHelpersStocktakingsTestCase(BaseAPITestCase):
         self.assertEqual(result["loss"], 500)
         self.assertEqual(result["profit"], 3000)
 
+    def test_balance_between_stocktakings_with_a_constant_number_of_queries(self):
+        """The balance calculation must not issue any additional queries per product."""
+        start = StocktakingCollection(admin_id=1, timestamp=datetime(2018, 1, 1))
+        end = StocktakingCollection(admin_id=1, timestamp=datetime(2018, 2, 1))
+        db.session.add_all([start, end])
+        db.session.flush()
+
+        def _add_product(product_id: int) -> None:
+            db.session.add(Stocktaking(product_id=product_id, count=10, collection_id=start.id))
+            db.session.add(Stocktaking(product_id=product_id, count=5, collection_id=end.id))
+            db.session.add(Purchase(user_id=1, product_id=product_id, amount=4, timestamp=datetime(2018, 1, 15)))
+
+        for product_id in range(1, 5):
+            _add_product(product_id)
+        db.session.commit()
+
+        with record_statements() as statements:
+            result = stocktaking_helpers._get_balance_between_stocktakings(start, end)
+        self.assertEqual(len(result["products"]), 4)
+        self.assertEqual(result["products"][1]["difference"], -1)
+
+        # Add more products, the number of statements must not change.
+        for index in range(5):
+            product = Product(name=f"New product {index}", created_by=1)
+            db.session.add(product)
+            db.session.flush()
+            product.set_price(price=100, admin_id=1)
+            _add_product(product.id)
+        db.session.commit()
+
+        with record_statements() as more_statements:
+            result = stocktaking_helpers._get_balance_between_stocktakings(start, end)
+        self.assertEqual(len(result["products"]), 9)
+        self.assertEqual(result["products"][9]["balance"], -100)
+        self.assertEqual(len(more_statements), len(statements))
+
     def test_get_latest_non_revoked_stocktakingcollection(self):
         """This test checks the "get_latest_non_revoked_stocktakingcollection" helper function."""
         # Insert the default stocktaking collections.
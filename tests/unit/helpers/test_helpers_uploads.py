@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import base64
+import io
+import os
+import shutil
+import tempfile
+
+from PIL import Image
+
+import shop_db2.exceptions as exc
+from shop_db2.api import app
+from shop_db2.helpers.uploads import insert_image
+from tests.base import BaseTestCase
+
+
+class TestHelpersUploadsTestCase(BaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.resources = app.config["UPLOAD_FOLDER"]
+        self.upload_folder = tempfile.mkdtemp()
+        app.config["UPLOAD_FOLDER"] = self.upload_folder + "/"
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.upload_folder)
+        super().tearDown()
+
+    @staticmethod
+    def _encode(size: int, mode: str = "RGB", image_format: str = "PNG") -> str:
+        data = io.BytesIO()
+        Image.new(mode, (size, size)).save(data, format=image_format)
+        return base64.b64encode(data.getvalue()).decode()
+
+    def _resource(self, filename: str) -> str:
+        with open(os.path.join(self.resources, filename), "rb") as file:
+            return base64.b64encode(file.read()).decode()
+
+    def _stored_files(self) -> list:
+        return sorted(name for name in os.listdir(self.upload_folder) if name != "thumbnails")
+
+    def test_insert_image(self) -> None:
+        """The decoded image must be stored, regardless of a data URL prefix and line breaks in the base64 data"""
+        value = self._encode(200)
+        filename = insert_image({"filename": "image.png", "value": value})
+        with open(os.path.join(self.upload_folder, filename), "rb") as file:
+            self.assertEqual(file.read(), base64.b64decode(value))
+
+        wrapped = "\n".join(value[i : i + 76] for i in range(0, len(value), 76))
+        for data in [f"data:image/png;base64,{value}", wrapped]:
+            self.assertEqual(insert_image({"filename": "image.png", "value": data}), filename)
+        self.assertEqual(self._stored_files(), [filename])
+
+    def test_insert_invalid_images(self) -> None:
+        """Invalid images must be rejected without leaving any temporary file behind"""
+        # The header is valid, but the pixel data is truncated
+        truncated = base64.b64decode(self._encode(200))
+        truncated = base64.b64encode(truncated[: len(truncated) // 2]).decode()
+        for value, exception in [
+            ("no base64!", exc.BrokenImage),
+            (self._encode(200)[:-1], exc.BrokenImage),
+            ("data:image/png," + "A" * 300, exc.BrokenImage),
+            (self._resource("broken_image.png"), exc.BrokenImage),
+            (truncated, exc.BrokenImage),
+            (self._resource("valid_image.jpg"), exc.InvalidFileType),
+            (self._resource("non_quadratic.png"), exc.ImageMustBeQuadratic),
+        ]:
+            with self.assertRaises(exception):
+                insert_image({"filename": "image.png", "value": value})
+        self.assertEqual(self._stored_files(), [])
+
+    def test_insert_image_pixel_limit(self) -> None:
+        """Images with too many pixels must be rejected before they are decoded"""
+        # A highly compressed image with 100 megapixels
+        value = self._encode(10_000, mode="1")
+        self.assertLess(len(value), app.config["MAX_CONTENT_LENGTH"])
+        with self.assertRaises(exc.ImageTooLarge):
+            insert_image({"filename": "image.png", "value": value})
+        self.assertEqual(self._stored_files(), [])
+
+        app.config["MAX_IMAGE_PIXELS"] = 99 * 99
+        with self.assertRaises(exc.ImageTooLarge):
+            insert_image({"filename": "image.png", "value": self._encode(100)})
+        insert_image({"filename": "image.png", "value": self._encode(99)})
+
+    def test_insert_image_downscaling(self) -> None:
+        """Images larger than the maximum size must be downscaled before they are stored"""
+        app.config["MAX_IMAGE_SIZE"] = 150
+        filename = insert_image({"filename": "image.png", "value": self._encode(200, mode="P")})
+        with Image.open(os.path.join(self.upload_folder, filename)) as image:
+            self.assertEqual((image.format, image.size), ("PNG", (150, 150)))
+        self.assertEqual(self._stored_files(), [filename])
+        self.assertEqual(insert_image({"filename": "image.png", "value": self._encode(200, mode="P")}), filename)
+
+        # Images are not downscaled if the maximum size is disabled
+        app.config["MAX_IMAGE_SIZE"] = None
+        filename = insert_image({"filename": "image.png", "value": self._encode(200, mode="P")})
+        with Image.open(os.path.join(self.upload_folder, filename)) as image:
+            self.assertEqual(image.size, (200, 200))
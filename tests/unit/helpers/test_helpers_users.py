@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+from shop_db2.api import db
+from shop_db2.helpers.users import get_inconsistent_user_credits, hash_password, rebuild_user_credits
+from shop_db2.models import User
+from tests.base_api import BaseAPITestCase
+
+
+class TestHelpersUsersTestCase(BaseAPITestCase):
+    def test_check_and_rebuild_user_credits(self):
+        """This test checks the consistency check and the rebuild of the persisted user credits."""
+        self.insert_default_purchases()
+        self.insert_default_deposits()
+        self.insert_default_replenishmentcollections()
+        self.assertEqual(get_inconsistent_user_credits(), [])
+
+        # Corrupt the credit of two users without the ORM
+        table = User.__table__
+        db.session.execute(table.update().where(table.c.id.in_([1, 5])).values(credit=42))
+        db.session.commit()
+
+        inconsistent = get_inconsistent_user_credits()
+        self.assertEqual(
+            inconsistent,
+            [
+                {"id": 1, "credit": 42, "expected": 100 + 600 - 300 - 8 * 100},
+                {"id": 5, "credit": 42, "expected": 3000 + 1000 + 500 + 3000},
+            ],
+        )
+
+        self.assertEqual(rebuild_user_credits(), 2)
+        self.assertEqual(get_inconsistent_user_credits(), [])
+        self.assertEqual(User.query.filter_by(id=1).first().credit, 100 + 600 - 300 - 8 * 100)
+
+    def test_hash_password_with_configured_work_factor(self):
+        """The bcrypt work factor of new password hashes can be configured."""
+        self.app.config["BCRYPT_LOG_ROUNDS"] = 5
+        password_hash = hash_password("supersecret")
+        self.assertEqual(password_hash.decode().split("$")[2], "05")
+        self.assertTrue(self.bcrypt.check_password_hash(password_hash, "supersecret"))
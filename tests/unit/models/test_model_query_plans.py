@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+import datetime
+import re
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Tuple
+
+from sqlalchemy import event
+
+from shop_db2.api import db
+from shop_db2.helpers.products import _get_product_mean_price_in_time_range, get_theoretical_stock_of_product
+from shop_db2.models import Product, Purchase, ReplenishmentCollection, StocktakingCollection, User
+from shop_db2.models.user_credit import credit_expression
+from tests.base import BaseTestCase
+
+# A full scan of a table shows up as "SCAN <table>" (or "SCAN TABLE <table>" in older SQLite versions)
+# without using any index.
+FULL_TABLE_SCAN = re.compile(r"^SCAN (TABLE )?(?P<table>\w+)$")
+
+
+@contextmanager
+def record_selects() -> Iterator[List[Tuple[str, Any]]]:
+    """Records all SELECT statements and their parameters which are sent to the database inside the context."""
+    selects: List[Tuple[str, Any]] = []
+
+    def _record(_conn: Any, _cursor: Any, statement: str, parameters: Any, *_: Any) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            selects.append((statement, parameters))
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield selects
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
+
+
+class QueryPlanTestCase(BaseTestCase):
+    def setUp(self) -> None:
+        super().setUp()
+        self.insert_default_purchases()
+        self.insert_default_deposits()
+        self.insert_default_replenishmentcollections()
+        self.insert_default_stocktakingcollections()
+
+    def assertNoFullTableScan(self, func: Callable[[], Any]) -> None:
+        """Runs the given function and checks the query plan of every SELECT statement it sends to the database."""
+        with record_selects() as selects:
+            func()
+        self.assertTrue(selects)
+        cursor = db.session.connection().connection.cursor()
+        for statement, parameters in selects:
+            # The columns of a query plan row are (id, parent, notused, detail)
+            for *_, detail in cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall():
+                match = FULL_TABLE_SCAN.match(detail)
+                if match:
+                    self.fail(f"Full scan of table '{match.group('table')}' in query:\n{statement}")
+
+    def test_query_plan_of_user_lookups(self) -> None:
+        """Loading a single user resolves the rank, the admin state and the verification without a full scan."""
+        self.assertNoFullTableScan(lambda: User.query.filter(User.id == 2).first())
+
+    def test_query_plan_of_user_history(self) -> None:
+        """The purchases, deposits and replenishmentcollections of a user are found via indexes."""
+        user = User.query.filter(User.id == 1).first()
+        self.assertNoFullTableScan(lambda: user.purchases.all())
+        self.assertNoFullTableScan(lambda: user.deposits.all())
+        self.assertNoFullTableScan(lambda: user.replenishmentcollections.all())
+        self.assertNoFullTableScan(lambda: db.session.query(credit_expression(1)).scalar())
+
+    def test_query_plan_of_product_lookups(self) -> None:
+        """Loading a single product resolves the price and the purchase and replenishment sums via indexes."""
+        self.assertNoFullTableScan(lambda: Product.query.filter(Product.id == 1).first())
+        self.assertNoFullTableScan(lambda: Product.query.filter(Product.id == 1).first().tags)
+
+    def test_query_plan_of_stock_and_mean_price(self) -> None:
+        """The theoretical stock and the mean price of a product are calculated without a full scan."""
+        start = datetime.datetime(2020, 1, 1)
+        end = datetime.datetime.utcnow()
+        self.assertNoFullTableScan(lambda: get_theoretical_stock_of_product(1))
+        self.assertNoFullTableScan(lambda: _get_product_mean_price_in_time_range(1, start, end))
+
+    def test_query_plan_of_collections(self) -> None:
+        """The entries of a collection and the revokes of an entry are found via indexes."""
+        replcoll = ReplenishmentCollection.query.filter(ReplenishmentCollection.id == 1).first()
+        stocktakingcollection = StocktakingCollection.query.filter(StocktakingCollection.id == 1).first()
+        purchase = Purchase.query.filter(Purchase.id == 1).first()
+        self.assertNoFullTableScan(lambda: replcoll.replenishments.all())
+        self.assertNoFullTableScan(lambda: replcoll.revokehistory)
+        self.assertNoFullTableScan(lambda: stocktakingcollection.stocktakings.all())
+        self.assertNoFullTableScan(lambda: stocktakingcollection.revokehistory)
+        self.assertNoFullTableScan(lambda: purchase.revokehistory)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+__author__ = "g3n35i5"
+
+from shop_db2.api import db
+from shop_db2.models import Product, Purchase, Tag
+from shop_db2.models.table_version import _commit_listeners, get_table_versions, on_modified_tables
+from tests.base import BaseTestCase
+
+
+class TableVersionModelTestCase(BaseTestCase):
+    def test_table_versions_of_committed_changes(self) -> None:
+        """Every commit must increment the versions of all tables it has modified exactly once"""
+        tables = ["purchases", "tags", "users", "users.credit", "productprices"]
+        before = get_table_versions(tables)
+
+        # Changes made via the session. The persisted user credit is counted separately.
+        db.session.add(Purchase(user_id=1, product_id=1, amount=1))
+        db.session.add(Purchase(user_id=2, product_id=1, amount=1))
+        db.session.commit()
+        after = get_table_versions(tables)
+        self.assertEqual(after["purchases"], before["purchases"] + 1)
+        self.assertEqual(after["users.credit"], before["users.credit"] + 1)
+        self.assertEqual(after["users"], before["users"])
+        self.assertEqual(after["tags"], before["tags"])
+        self.assertEqual(after["productprices"], before["productprices"])
+
+        # Statements executed without the ORM
+        db.session.execute(Tag.__table__.update().values(is_for_sale=False))
+        db.session.commit()
+        self.assertEqual(get_table_versions(["tags"])["tags"], after["tags"] + 1)
+
+        # Changes of a many-to-many relationship
+        version = get_table_versions(["product_tag_assignments"])["product_tag_assignments"]
+        product = Product.query.filter_by(id=1).first()
+        product.tags.append(Tag.query.filter_by(id=2).first())
+        db.session.commit()
+        self.assertEqual(get_table_versions(["product_tag_assignments"])["product_tag_assignments"], version + 1)
+
+    def test_table_versions_without_changes(self) -> None:
+        """Rolled back transactions and commits without changes must not increment any version"""
+        versions = get_table_versions(["purchases", "tags"])
+        db.session.add(Purchase(user_id=1, product_id=1, amount=1))
+        db.session.flush()
+        db.session.rollback()
+        db.session.commit()
+        self.assertEqual(get_table_versions(["purchases", "tags"]), versions)
+
+        # Unknown tables have the version 0
+        self.assertEqual(get_table_versions(["foo"]), {"foo": 0})
+
+    def test_modified_tables_are_cleared_on_commit(self) -> None:
+        """The modified tables must be passed to the commit listeners once and then be forgotten"""
+        committed = []
+        on_modified_tables(committed.append)
+        self.addCleanup(_commit_listeners.remove, committed.append)
+
+        db.session.add(Purchase(user_id=1, product_id=1, amount=1))
+        db.session.commit()
+        self.assertNotIn("modified_tables", db.session.connection().info)
+        self.assertEqual(len(committed), 1)
+        self.assertTrue({"purchases", "users.credit"} <= committed[0])
+
+        # The versions of the previous transaction are not incremented again
+        versions = get_table_versions(["purchases", "tags"])
+        db.session.add(Tag(name="Bread", created_by=1))
+        db.session.commit()
+        after = get_table_versions(["purchases", "tags"])
+        self.assertEqual(after, {"purchases": versions["purchases"], "tags": versions["tags"] + 1})
+        self.assertNotIn("purchases", committed[1])
@@ -4,8 +4,19 @@ __author__ = "g3n35i5"
 
 import shop_db2.exceptions as exc
 from shop_db2.api import db
-from shop_db2.models import Purchase, User, UserVerification
+from shop_db2.helpers.users import get_inconsistent_user_credits
+from shop_db2.models import (
+    AdminUpdate,
+    Deposit,
+    Purchase,
+    RankUpdate,
+    Replenishment,
+    ReplenishmentCollection,
+    User,
+    UserVerification,
+)
 from tests.base import BaseTestCase
+from tests.utils import record_statements
 
 
 class UserModelTestCase(BaseTestCase):
@@ -75,6 +86,63 @@ class UserModelTestCase(BaseTestCase):
         user = User.query.filter_by(id=1).first()
         self.assertEqual(user.rank_id, 3)
         self.assertEqual(user.rank.name, "Alumni")
+        # The rank updates are kept as history
+        rank_updates = RankUpdate.query.filter_by(user_id=1).order_by(RankUpdate.id).all()
+        self.assertEqual([ru.rank_id for ru in rank_updates], [2, 3])
+
+    def test_user_rank_state_follows_the_rank(self) -> None:
+        """The active and system user state of a user is read from its current rank."""
+        user = User.query.filter_by(id=1).first()
+        self.assertTrue(user.active)
+        self.assertFalse(user.is_system_user)
+        user.set_rank_id(rank_id=4, admin_id=1)
+        db.session.commit()
+        user = User.query.filter_by(id=1).first()
+        self.assertFalse(user.active)
+        self.assertFalse(user.is_system_user)
+
+        # Unverified users do not have a rank
+        user = User.query.filter_by(id=4).first()
+        self.assertIsNone(user.rank_id)
+        self.assertIsNone(user.active)
+
+    def test_user_rank_state_does_not_query_the_rank_history(self) -> None:
+        """Loading users must not search the rank updates for the latest rank."""
+        with record_statements() as statements:
+            users = User.query.all()
+            self.assertEqual([user.rank_id for user in users], [2, 3, 1, None, 1])
+        self.assertEqual(len(statements), 1)
+        self.assertNotIn("rankupdates", statements[0])
+
+    def test_user_admin_state_does_not_query_per_user(self) -> None:
+        """Loading users must resolve the admin state of all users in the same statement."""
+        with record_statements() as statements:
+            users = User.query.all()
+            self.assertEqual([user.is_admin for user in users], [True, False, False, False, False])
+        self.assertEqual(len(statements), 1)
+
+    def test_user_admin_state_follows_the_latest_admin_update(self) -> None:
+        """The admin state of a user is defined by the latest admin update and is reloaded after a change."""
+        user = User.query.filter_by(id=2).first()
+        user.set_admin(is_admin=True, admin_id=1)
+        self.assertTrue(user.is_admin)
+        user.set_is_admin(is_admin=False, admin_id=1)
+        self.assertFalse(user.is_admin)
+        db.session.commit()
+        self.assertEqual(User.query.filter(User.is_admin.is_(True)).count(), 1)
+        self.assertEqual(AdminUpdate.query.filter_by(user_id=2).count(), 2)
+
+    def test_remove_last_admin_counts_the_admins_once(self) -> None:
+        """Checking for the last remaining admin must not load all users but issue a single count."""
+        user = User.query.filter_by(id=1).first()
+        with record_statements() as statements:
+            with self.assertRaises(exc.NoRemainingAdmin):
+                user.set_is_admin(is_admin=False, admin_id=1)
+        # The admin update gets validated (one statement each for the existence of any admin and the acting
+        # admin) before the remaining admins are counted.
+        selects = [statement for statement in statements if statement.startswith("SELECT")]
+        self.assertEqual(len(selects), 3)
+        self.assertEqual(len([statement for statement in selects if "count(*)" in statement]), 1)
 
     def test_update_user_firstname(self) -> None:
         """Update the firstname of a user"""
@@ -136,3 +204,53 @@ class UserModelTestCase(BaseTestCase):
         """
         favorites = User.query.filter_by(id=1).first().favorites
         self.assertEqual([], favorites)
+
+    def test_user_credit_is_updated_incrementally(self) -> None:
+        """The persisted credit must follow all purchases, deposits, replenishments and their revokes."""
+        self.insert_default_replenishmentcollections()
+        self.assertEqual(User.query.filter_by(id=5).first().credit, 3000 + 1000 + 500 + 3000)
+
+        purchase = Purchase(user_id=1, product_id=1, amount=2)
+        db.session.add(purchase)
+        db.session.add(Deposit(user_id=1, amount=1000, admin_id=1, comment="Foo"))
+        db.session.commit()
+        self.assertEqual(User.query.filter_by(id=1).first().credit, 1000 - 600)
+
+        # Change the purchase amount and revoke it afterwards
+        purchase.amount = 1
+        db.session.commit()
+        self.assertEqual(User.query.filter_by(id=1).first().credit, 1000 - 300)
+        purchase.set_revoked(revoked=True)
+        db.session.commit()
+        self.assertEqual(User.query.filter_by(id=1).first().credit, 1000)
+
+        # Revoke a single replenishment and the whole second collection
+        Replenishment.query.filter_by(id=1).first().set_revoked(revoked=True, admin_id=1)
+        db.session.commit()
+        self.assertEqual(User.query.filter_by(id=5).first().credit, 1000 + 500 + 3000)
+        ReplenishmentCollection.query.filter_by(id=2).first().set_revoked(revoked=True, admin_id=1)
+        db.session.commit()
+        self.assertEqual(User.query.filter_by(id=5).first().credit, 1000)
+
+        # Revoking the last replenishment of a collection also revokes the collection
+        Replenishment.query.filter_by(id=2).first().set_revoked(revoked=True, admin_id=1)
+        db.session.commit()
+        self.assertTrue(ReplenishmentCollection.query.filter_by(id=1).first().revoked)
+        self.assertEqual(User.query.filter_by(id=5).first().credit, 0)
+        Replenishment.query.filter_by(id=2).first().set_revoked(revoked=False, admin_id=1)
+        db.session.commit()
+        self.assertFalse(ReplenishmentCollection.query.filter_by(id=1).first().revoked)
+        self.assertEqual(User.query.filter_by(id=5).first().credit, 1000)
+
+        self.assertEqual(get_inconsistent_user_credits(), [])
+
+    def test_user_credit_does_not_query_the_history(self) -> None:
+        """Loading a user must not aggregate its purchases, deposits or replenishments."""
+        self.insert_default_purchases()
+        self.insert_default_deposits()
+        with record_statements() as statements:
+            user = User.query.filter_by(id=1).first()
+            self.assertEqual(user.credit, 100 + 600 - 300 - 8 * 100)
+        self.assertEqual(len(statements), 1)
+        for table in ["purchases", "deposits", "replenishments"]:
+            self.assertNotIn(table, statements[0])
@@ -1 +1,28 @@
 """This module contains utility functions for tests."""
+
+from contextlib import contextmanager
+from typing import Any, Iterator, List
+
+from sqlalchemy import event
+
+from shop_db2.api import db
+
+
+@contextmanager
+def record_statements() -> Iterator[List[str]]:
+    """Records all SQL statements which are sent to the database inside the context.
+
+    Yields:
+        The list to which all executed statements are appended.
+    """
+    statements: List[str] = []
+
+    def _record(_conn: Any, _cursor: Any, statement: str, *_: Any) -> None:
+        statements.append(statement)
+
+    engine = db.engine
+    event.listen(engine, "before_cursor_execute", _record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", _record)
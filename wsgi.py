@@ -54,6 +54,8 @@ if __name__ == "__main__":
         choices=["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"],
     )
 
+    parser.add_argument("--workers", help="the number of worker processes (overrides the configuration)", type=int)
+
     args = parser.parse_args()
 
     # Overwrite the app configuration with the productive settings.
@@ -63,14 +65,10 @@ if __name__ == "__main__":
     app.logger.handlers = logging.getLogger("gunicorn.error").handlers
     app.logger.setLevel(logging.getLevelName(args.loglevel))
 
-    # Set the gunicorn options.
+    # Set the gunicorn options. Multiple workers can share the database, see "helpers/database.py".
     options = {
         "bind": "%s:%s" % (app.config["HOST"], app.config["PORT"]),
-        # BEGIN OF WARNING
-        # DO NOT CHANGE THIS VALUE, THE APPLICATION IS NOT DESIGNED FOR
-        # MULTITHREADING AND ERRORS MAY OCCUR IN THE DATABASE!!!
-        "workers": 1,
-        # END WARNING
+        "workers": args.workers or app.config.get("WORKERS", 1),
     }
 
     StandaloneApplication(app, options).run()